@@ -401,13 +401,9 @@ class Agent(ABC):
                 cm = console.status("LLM responding to message...")
                 stack.enter_context(cm)
             output_len = self.config.llm.max_output_tokens
-            if (
-                self.num_tokens(prompt) + output_len
-                > self.llm.completion_context_length()
-            ):
-                output_len = self.llm.completion_context_length() - self.num_tokens(
-                    prompt
-                )
+            prompt_tokens = self.num_tokens(prompt)
+            if prompt_tokens + output_len > self.llm.completion_context_length():
+                output_len = self.llm.completion_context_length() - prompt_tokens
                 if output_len < self.config.llm.min_output_tokens:
                     raise ValueError(
                         """
@@ -428,13 +424,14 @@ class Agent(ABC):
             response = self.llm.generate(prompt, output_len)
 
         displayed = False
-        if not self.llm.get_stream() or response.cached:
+        stream = self.streamed(response)
+        if not stream or response.cached:
             # we would have already displayed the msg "live" ONLY if
             # streaming was enabled, AND we did not find a cached response
             console.print(f"[green]{self.indent}", end="")
             print("[green]" + response.message)
             displayed = True
-        self.update_token_usage(response, prompt, self.llm.get_stream())
+        self.update_token_usage(response, prompt, stream, prompt_tokens=prompt_tokens)
         return ChatDocument.from_LLMResponse(response, displayed)
 
     def get_tool_messages(self, msg: str | ChatDocument) -> List[ToolMessage]:
@@ -617,10 +614,24 @@ class Agent(ABC):
         if isinstance(prompt, str):
             return self.parser.num_tokens(prompt)
         else:
-            return sum([self.parser.num_tokens(m.content) for m in prompt])
+            return sum(m.num_tokens(self.parser) for m in prompt)
+
+    def streamed(self, response: LLMResponse) -> bool:
+        """
+        Whether `response` was streamed: as recorded in the response if known
+        (e.g. by an LLM that streams only some of its responses), else as
+        per the streaming setting of the LLM.
+        """
+        if response.streamed is not None:
+            return response.streamed
+        return self.llm is not None and cast(LanguageModel, self.llm).get_stream()
 
     def update_token_usage(
-        self, response: LLMResponse, prompt: str | List[LLMMessage], stream: bool
+        self,
+        response: LLMResponse,
+        prompt: str | List[LLMMessage],
+        stream: bool,
+        prompt_tokens: Optional[int] = None,
     ) -> None:
         """
         Updates `response.usage` obj (token usage and cost fields).the usage memebr
@@ -633,18 +644,23 @@ class Agent(ABC):
             prompt (str | List[LLMMessage]): prompt or list of LLMMessage objects
             stream (bool): whether to update the usage in the response object
                 if the response is not cached.
+            prompt_tokens: number of tokens in `prompt`, if already known
         """
         if response is not None:
             # Note: If response was not streamed, then
             # `response.usage` would already have been set by the API,
             # so we only need to update in the stream case.
-            if stream:
-                # usage, cost = 0 when response is from cache
-                prompt_tokens = 0
+            if stream and (response.cached or response.usage is None):
+                # usage, cost = 0 when response is from cache; LLMs that stream
+                # count the usage as the response arrives, so it is only
+                # counted here for those that do not
                 completion_tokens = 0
                 cost = 0.0
-                if not response.cached:
-                    prompt_tokens = self.num_tokens(prompt)
+                if response.cached:
+                    prompt_tokens = 0
+                else:
+                    if prompt_tokens is None:
+                        prompt_tokens = self.num_tokens(prompt)
                     completion_tokens = self.num_tokens(response.message)
                     cost = self.compute_token_cost(prompt_tokens, completion_tokens)
                 response.usage = LLMTokenUsage(
@@ -1,21 +1,28 @@
 import inspect
 import logging
 from contextlib import ExitStack
-from typing import Dict, List, Optional, Set, Type, cast, no_type_check
+from typing import Dict, List, Optional, Set, Tuple, Type, cast, no_type_check
 
 from rich import print
 from rich.console import Console
 
 from langroid.agent.base import Agent, AgentConfig
 from langroid.agent.chat_document import ChatDocument
+from langroid.agent.context_packing import (
+    ContextPacker,
+    ContextPackingConfig,
+    PackedContext,
+)
 from langroid.agent.tool_message import ToolMessage
 from langroid.language_models.base import (
     LanguageModel,
     LLMFunctionSpec,
     LLMMessage,
+    LLMResponse,
     Role,
     StreamingIfAllowed,
 )
+from langroid.language_models.chat_tokens import ChatTokenEstimator
 from langroid.utils.configuration import settings
 
 console = Console()
@@ -33,12 +40,15 @@ class ChatAgentConfig(AgentConfig):
         use_tools: whether to use our own ToolMessages mechanism
         use_functions_api: whether to use functions native to the LLM API
                 (e.g. OpenAI's `function_call` mechanism)
+        context_packing: how to fit the message history into the LLM's
+                context window, when it is too long
     """
 
     system_message: str = "You are a helpful assistant."
     user_message: Optional[str] = None
     use_tools: bool = True
     use_functions_api: bool = False
+    context_packing: ContextPackingConfig = ContextPackingConfig()
 
 
 class ChatAgent(Agent):
@@ -76,6 +86,28 @@ class ChatAgent(Agent):
         self.llm_functions_handled: Set[str] = set()
         self.llm_functions_usable: Set[str] = set()
         self.llm_function_force: Optional[Dict[str, str]] = None
+        if self.llm is not None:
+            # shared with the LLM, which counts the tokens of the same prompts
+            self.token_estimator = cast(LanguageModel, self.llm).token_estimator()
+        else:
+            chat_model = config.llm.chat_model if config.llm is not None else None
+            self.token_estimator = ChatTokenEstimator(
+                str(getattr(chat_model, "value", chat_model or ""))
+            )
+        self.context_packer = ContextPacker(
+            config.context_packing, self._message_tokens, self._summarize_messages
+        )
+        # running total of tokens in the first `_tokens_counted` messages of
+        # the history (the last of which is `_tokens_last`), see `chat_num_tokens`
+        self._tokens_total = 0
+        self._tokens_counted = 0
+        self._tokens_last: Optional[LLMMessage] = None
+        # result of the last packing of the message history, with the
+        # messages that were left out, if any
+        self.last_packing: Optional[PackedContext] = None
+        # prompt tokens of the packed messages, including the functions schema
+        # and other per-request tokens, for the usage of the response
+        self._packed_prompt_tokens = 0
 
         priming_messages = task
         if priming_messages is None:
@@ -124,14 +156,13 @@ class ChatAgent(Agent):
         """
         if len(self.message_history) > 0:
             if self.message_history[0].role == Role.SYSTEM:
-                self.message_history[0].content = (
-                    self.message_history[0].content + "\n\n" + message
-                )
+                self._set_content(0, self.message_history[0].content + "\n\n" + message)
         else:
             if self.task_messages[0].role == Role.SYSTEM:
                 self.task_messages[0].content = (
                     self.task_messages[0].content + "\n\n" + message
                 )
+                self.task_messages[0].invalidate_token_count()
 
     def add_user_message(self, message: str) -> None:
         """
@@ -158,7 +189,7 @@ class ChatAgent(Agent):
         # find last message in self.message_history with role `role`
         for i in range(len(self.message_history) - 1, -1, -1):
             if self.message_history[i].role == role:
-                self.message_history[i].content = message
+                self._set_content(i, message)
                 break
 
     def enable_message(
@@ -296,6 +327,7 @@ class ChatAgent(Agent):
             # so it is ok to overwrite the last message in the task_messages,
             # since we know it is a tool-instruction msg.
             self.task_messages[-1].content = json_instructions
+            self.task_messages[-1].invalidate_token_count()
 
         # Note that task_messages is the initial set of messages created to set up
         # the task, and they may not yet have been sent to the LLM at this point.
@@ -304,7 +336,7 @@ class ChatAgent(Agent):
         # update the self.message_history as well, since this history will be sent to
         # the LLM on each round, after appending the latest assistant, user msgs.
         if len(self.message_history) > 0:
-            self.message_history[-1].content = json_instructions
+            self._set_content(len(self.message_history) - 1, json_instructions)
 
     @no_type_check
     def llm_response(
@@ -322,6 +354,46 @@ class ChatAgent(Agent):
         if not self.llm_can_respond(message):
             return None
 
+        hist, output_len = self._prep_llm_messages(message)
+        with StreamingIfAllowed(self.llm):
+            response = self.llm_response_messages(hist, output_len)
+        # TODO - when response contains function_call we should include
+        # that (and related fields) in the message_history
+        self.message_history.append(ChatDocument.to_LLMMessage(response))
+        return response
+
+    @no_type_check
+    async def llm_response_async(
+        self, message: Optional[str | ChatDocument] = None
+    ) -> Optional[ChatDocument]:
+        """
+        Async version of `llm_response`. See there for details.
+        """
+        if not self.llm_can_respond(message):
+            return None
+
+        hist, output_len = self._prep_llm_messages(message)
+        with StreamingIfAllowed(self.llm):
+            response = await self.llm_response_messages_async(hist, output_len)
+        self.message_history.append(ChatDocument.to_LLMMessage(response))
+        return response
+
+    @no_type_check
+    def _prep_llm_messages(
+        self, message: Optional[str | ChatDocument] = None
+    ) -> Tuple[List[LLMMessage], int]:
+        """
+        Prepare messages to be sent to self.llm_response_messages,
+            which is the main method that calls the LLM API to get a response.
+
+        Args:
+            message (str|ChatDocument): message or ChatDocument object to respond to.
+                If None, use the self.task_messages
+
+        Returns:
+            List[LLMMessage]: list of messages to send to the LLM
+            int: max output tokens to request from the LLM
+        """
         assert (
             message is not None or len(self.message_history) == 0
         ), "message can be None only if message_history is empty, i.e. at start."
@@ -331,9 +403,13 @@ class ChatAgent(Agent):
             self.message_history = self.task_messages.copy()
             # first message is system msg, augment if needed
             if self.system_tool_instructions != "":
-                self.message_history[0].content += (
-                    "\n\n" + self.system_tool_instructions
+                self._set_content(
+                    0,
+                    self.message_history[0].content
+                    + "\n\n"
+                    + self.system_tool_instructions,
                 )
+            self._freeze_prefix()
             # for debugging, show the initial message history
             if settings.debug:
                 print(
@@ -347,65 +423,85 @@ class ChatAgent(Agent):
             llm_msg = ChatDocument.to_LLMMessage(message)
             self.message_history.append(llm_msg)
 
-        hist = self.message_history
-        output_len = self.config.llm.max_output_tokens
-        if (
-            self.chat_num_tokens(hist)
-            > self.llm.chat_context_length() - self.config.llm.max_output_tokens
-        ):
-            # chat + output > max context length,
-            # so first try to shorten requested output len to fit.
-            output_len = self.llm.chat_context_length() - self.chat_num_tokens(hist)
-            if output_len < self.config.llm.min_output_tokens:
-                # unacceptably small output len, so drop early parts of conv history
-                # if output_len is still too long, then drop early parts of conv history
-                # TODO we should really be doing summarization or other types of
-                #   prompt-size reduction
-                while (
-                    self.chat_num_tokens(hist)
-                    > self.llm.chat_context_length() - self.config.llm.min_output_tokens
-                ):
-                    # try dropping early parts of conv history
-                    # TODO we should really be doing summarization or other types of
-                    #   prompt-size reduction
-                    if len(hist) <= 2:
-                        # first two are "reserved" for the initial system, user msgs
-                        # that presumably set up the initial "priming" or "task" for
-                        # the agent.
-                        raise ValueError(
-                            """
-                        The message history is longer than the max chat context 
-                        length allowed, and we have run out of messages to drop."""
-                        )
-                    hist = hist[:2] + hist[3:]
-
-                if len(hist) < len(self.message_history):
-                    msg_tokens = self.chat_num_tokens()
-                    logger.warning(
-                        f"""
-                    Chat Model context length is {self.llm.chat_context_length()} 
-                    tokens, but the current message history is {msg_tokens} tokens long.
-                    Dropped the {len(self.message_history) - len(hist)} messages
-                    from early in the conversation history so total tokens are 
-                    low enough to allow minimum output length of 
-                    {self.config.llm.min_output_tokens} tokens.
-                    """
-                    )
-
-        if output_len < self.config.llm.min_output_tokens:
-            raise ValueError(
+        # room for the functions schema and other per-request tokens
+        functions, fun_call = self._function_args()
+        overhead = self.token_estimator.overhead_tokens(
+            self.message_history, functions, fun_call
+        )
+        packed = self.context_packer.pack(
+            self.message_history,
+            self.llm.chat_context_length() - overhead,
+            self.config.llm.max_output_tokens,
+            self.config.llm.min_output_tokens,
+            # the system message and other task messages are always kept
+            pinned=len(self.task_messages),
+            total=self.chat_num_tokens(),
+        )
+        self.last_packing = packed
+        self._packed_prompt_tokens = packed.tokens + overhead
+        if packed.dropped:
+            logger.warning(
                 f"""
-                Tried to shorten prompt history for chat mode 
-                but the feasible output length {output_len} is still
-                less than the minimum output length {self.config.llm.min_output_tokens}.
-                """
+            Chat Model context length is {self.llm.chat_context_length()} 
+            tokens, but the current message history is {self.chat_num_tokens()}
+            tokens long. Left out the {len(packed.dropped)} messages
+            {packed.dropped} from early in the conversation history
+            {"(replaced by a summary) " if packed.summary else ""}so total tokens
+            are low enough to allow minimum output length of 
+            {self.config.llm.min_output_tokens} tokens.
+            """
             )
-        with StreamingIfAllowed(self.llm):
-            response = self.llm_response_messages(hist, output_len)
-        # TODO - when response contains function_call we should include
-        # that (and related fields) in the message_history
-        self.message_history.append(ChatDocument.to_LLMMessage(response))
-        return response
+        return packed.messages, packed.output_len
+
+    def _summarize_messages(self, messages: List[LLMMessage], max_tokens: int) -> str:
+        """
+        Summarize messages with the LLM, e.g. to replace messages that are left
+        out of the context window (see `ContextPackingConfig.policy`).
+        Args:
+            messages: messages to summarize
+            max_tokens: max tokens of the summary
+        Returns:
+            str: the summary
+        """
+        assert self.parser is not None
+        llm = cast(LanguageModel, self.llm)
+        transcript = "\n\n".join(f"{m.role}: {m.content}" for m in messages)
+        # leave room for the instructions and the summary
+        max_input = llm.chat_context_length() - max_tokens - 100
+        tokens = self.parser.tokenizer.encode(transcript)
+        if len(tokens) > max_input:
+            transcript = self.parser.tokenizer.decode(tokens[-max_input:])
+        response = llm.chat(
+            [
+                LLMMessage(
+                    role=Role.SYSTEM,
+                    content="Concisely summarize the conversation below, "
+                    "keeping any facts, decisions and open questions.",
+                ),
+                LLMMessage(role=Role.USER, content=transcript),
+            ],
+            max_tokens,
+        )
+        return response.message.strip()
+
+    def _function_args(
+        self,
+    ) -> Tuple[Optional[List[LLMFunctionSpec]], str | Dict[str, str]]:
+        """
+        Get the `functions` and `function_call` args to use with the LLM API,
+        based on the usable functions of this agent.
+        Returns:
+            functions: list of usable function specs, or None
+            fun_call: "auto", "none", or a dict naming the function to force
+        """
+        functions: Optional[List[LLMFunctionSpec]] = None
+        fun_call: str | Dict[str, str] = "none"
+        if self.config.use_functions_api and len(self.llm_functions_usable) > 0:
+            functions = [self.llm_functions_map[f] for f in self.llm_functions_usable]
+            fun_call = (
+                "auto" if self.llm_function_force is None else self.llm_function_force
+            )
+        return functions, fun_call
 
     def llm_response_messages(
         self, messages: List[LLMMessage], output_len: Optional[int] = None
@@ -426,17 +522,7 @@ class ChatAgent(Agent):
                 stack.enter_context(cm)
             if self.llm.get_stream():  # type: ignore
                 console.print(f"[green]{self.indent}", end="")
-            functions: Optional[List[LLMFunctionSpec]] = None
-            fun_call: str | Dict[str, str] = "none"
-            if self.config.use_functions_api and len(self.llm_functions_usable) > 0:
-                functions = [
-                    self.llm_functions_map[f] for f in self.llm_functions_usable
-                ]
-                fun_call = (
-                    "auto"
-                    if self.llm_function_force is None
-                    else self.llm_function_force
-                )
+            functions, fun_call = self._function_args()
             assert self.llm is not None
             response = cast(LanguageModel, self.llm).chat(
                 messages,
@@ -444,8 +530,42 @@ class ChatAgent(Agent):
                 functions=functions,
                 function_call=fun_call,
             )
+        return self._render_llm_response(response, messages)
+
+    async def llm_response_messages_async(
+        self, messages: List[LLMMessage], output_len: Optional[int] = None
+    ) -> ChatDocument:
+        """
+        Async version of `llm_response_messages`. See there for details.
+        """
+        assert self.config.llm is not None and self.llm is not None
+        output_len = output_len or self.config.llm.max_output_tokens
+        if self.llm.get_stream():  # type: ignore
+            console.print(f"[green]{self.indent}", end="")
+        functions, fun_call = self._function_args()
+        response = await cast(LanguageModel, self.llm).achat(
+            messages,
+            output_len,
+            functions=functions,
+            function_call=fun_call,
+        )
+        return self._render_llm_response(response, messages)
+
+    def _render_llm_response(
+        self, response: LLMResponse, messages: List[LLMMessage]
+    ) -> ChatDocument:
+        """
+        Display the LLM response (unless it was already streamed "live"),
+        update token usage, and package the response as a ChatDocument.
+        Args:
+            response: response from the LLM
+            messages: messages that were sent to the LLM
+        Returns:
+            ChatDocument: the response
+        """
         displayed = False
-        if not self.llm.get_stream() or response.cached:  # type: ignore
+        stream = self.streamed(response)
+        if not stream or response.cached:
             displayed = True
             cached = f"[red]{self.indent}(cached)[/red]" if response.cached else ""
             if response.function_call is not None:
@@ -453,8 +573,11 @@ class ChatAgent(Agent):
             else:
                 response_str = response.message
             print(cached + "[green]" + response_str)
-        stream = self.llm.get_stream()  # type: ignore
-        self.update_token_usage(response, messages, stream)
+        prompt_tokens = None
+        if self.last_packing is not None and messages is self.last_packing.messages:
+            # already counted when packing the history
+            prompt_tokens = self._packed_prompt_tokens
+        self.update_token_usage(response, messages, stream, prompt_tokens)
         return ChatDocument.from_LLMResponse(response, displayed)
 
     def _llm_response_temp_context(self, message: str, prompt: str) -> ChatDocument:
@@ -500,7 +623,10 @@ class ChatAgent(Agent):
 
     def chat_num_tokens(self, messages: Optional[List[LLMMessage]] = None) -> int:
         """
-        Total number of tokens in the message history so far.
+        Total number of tokens in the message history so far, in the chat format
+        of the LLM (see `ChatTokenEstimator.message_tokens`).
+        Token counts are cached on the messages, and the total of the history
+        is maintained incrementally as messages are appended.
 
         Args:
             messages: if provided, compute the number of tokens in this list of
@@ -508,14 +634,52 @@ class ChatAgent(Agent):
         Returns:
             int: number of tokens in message history
         """
-        if self.parser is None:
-            raise ValueError(
-                "ChatAgent.parser is None. "
-                "You must set ChatAgent.parser "
-                "before calling chat_num_tokens()."
-            )
-        hist = messages if messages is not None else self.message_history
-        return sum([self.parser.num_tokens(m.content) for m in hist])
+        if messages is not None:
+            return sum(self._message_tokens(m) for m in messages)
+        hist = self.message_history
+        n = self._tokens_counted
+        if n > len(hist) or (n > 0 and hist[n - 1] is not self._tokens_last):
+            # the history was changed other than by appending: count afresh
+            n = self._tokens_total = 0
+        for m in hist[n:]:
+            self._tokens_total += self._message_tokens(m)
+        self._tokens_counted = len(hist)
+        self._tokens_last = hist[-1] if hist else None
+        return self._tokens_total
+
+    def _message_tokens(self, message: LLMMessage) -> int:
+        """
+        Number of tokens of a message in the chat format of the LLM,
+        including its framing, role, name and function_call
+        (see `ChatTokenEstimator`).
+        """
+        return self.token_estimator.message_tokens(message)
+
+    def _set_content(self, i: int, content: str) -> None:
+        """
+        Change the content of the i-th message of the history, keeping its
+        token count, and the running total of the history, up to date.
+        """
+        message = self.message_history[i]
+        counted = i < self._tokens_counted
+        if counted:
+            self._tokens_total -= self._message_tokens(message)
+        message.content = content
+        message.invalidate_token_count()
+        if counted:
+            self._tokens_total += self._message_tokens(message)
+        if i < len(self.task_messages):
+            self._freeze_prefix()
+
+    def _freeze_prefix(self) -> None:
+        """
+        Declare the task messages at the start of the history (the system
+        message and tool instructions) to the LLM, as the unchanging prefix of
+        its prompts (see `FrozenPrefix`).
+        """
+        n = len(self.task_messages)
+        if self.llm is not None and len(self.message_history) >= n:
+            cast(LanguageModel, self.llm).set_prompt_prefix(self.message_history[:n])
 
     def message_history_str(self, i: Optional[int] = None) -> str:
         """
@@ -13,6 +13,7 @@ from langroid.language_models.base import (
 from langroid.mytypes import DocMetaData, Document, Entity
 from langroid.parsing.agent_chats import parse_message
 from langroid.parsing.json import extract_top_level_json, top_level_json_field
+from langroid.parsing.parser import TokenCounted
 from langroid.utils.output.printing import shorten_text
 
 
@@ -50,7 +51,7 @@ class ChatDocLoggerFields(BaseModel):
         return "\t".join(field_names)
 
 
-class ChatDocument(Document):
+class ChatDocument(Document, TokenCounted):
     function_call: Optional[LLMFunctionCall] = None
     metadata: ChatDocMetaData
     attachment: None | ChatDocAttachment = None
@@ -184,12 +185,16 @@ class ChatDocument(Document):
             # LLM can only respond to text content, so extract it
             content = message
 
-        return LLMMessage(
+        llm_message = LLMMessage(
             role=sender_role,
             content=content,
             function_call=fun_call,
             name=sender_name,
         )
+        if isinstance(message, ChatDocument):
+            # same content, so the same token count
+            llm_message._token_count = message._token_count
+        return llm_message
 
 
 ChatDocMetaData.update_forward_refs()
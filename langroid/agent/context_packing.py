@@ -0,0 +1,174 @@
+"""
+Packing of a chat history into the context window of an LLM.
+
+When the history (plus the output tokens to request) does not fit in the
+context window, the pinned messages at the start of the history (the system
+message and other task messages) are kept, along with as many of the most
+recent messages as fit, and the messages in between are dropped or, with the
+"summarize" policy, replaced by a summary. The messages to keep are picked in
+a single pass over their (cached, see `TokenCounted`) token counts, so packing
+a long history is linear in its length.
+"""
+from enum import Enum
+from typing import Callable, List, Optional
+
+from pydantic import BaseSettings
+
+from langroid.language_models.base import LLMMessage, Role
+
+SUMMARY_HEADER = "Summary of the earlier part of the conversation:\n"
+
+
+class PackingPolicy(str, Enum):
+    """What to do with the messages that do not fit."""
+
+    DROP = "drop"
+    SUMMARIZE = "summarize"  # replace them with a summary
+
+
+class ContextPackingConfig(BaseSettings):
+    policy: PackingPolicy = PackingPolicy.DROP
+    # max tokens of the summary of dropped messages, with the "summarize" policy
+    summary_tokens: int = 256
+
+
+class PackedContext:
+    """
+    Result of packing a chat history. (A plain class rather than a pydantic
+    model, so that the messages are not re-validated and copied on each turn.)
+    """
+
+    def __init__(
+        self,
+        messages: List[LLMMessage],
+        output_len: int,
+        tokens: int,
+        dropped: Optional[List[int]] = None,
+        summary: Optional[LLMMessage] = None,
+    ):
+        """
+        Args:
+            messages: messages to send
+            output_len: max output tokens to request
+            tokens: tokens in `messages`
+            dropped: indices (in the history) of the messages left out
+            summary: summary of the messages left out, if any
+        """
+        self.messages = messages
+        self.output_len = output_len
+        self.tokens = tokens
+        self.dropped = dropped or []
+        self.summary = summary
+
+
+class ContextPacker:
+    """
+    Packs a chat history into a context window, see `pack`.
+    """
+
+    def __init__(
+        self,
+        config: ContextPackingConfig,
+        count: Callable[[LLMMessage], int],
+        summarize: Optional[Callable[[List[LLMMessage], int], str]] = None,
+    ):
+        """
+        Args:
+            config: packing settings
+            count: number of tokens of a message
+            summarize: fn summarizing messages in at most the given number
+                of tokens (needed by the "summarize" policy)
+        """
+        self.config = config
+        self.count = count
+        self.summarize = summarize
+
+    def pack(
+        self,
+        messages: List[LLMMessage],
+        context_length: int,
+        max_output_tokens: int,
+        min_output_tokens: int,
+        pinned: int = 2,
+        total: Optional[int] = None,
+    ) -> PackedContext:
+        """
+        Fit messages into a context window: if they leave room for
+        `max_output_tokens`, they are all kept; else the output length is
+        shortened, down to `min_output_tokens`; if that is still not enough,
+        the oldest messages after the `pinned` first ones are left out.
+        Args:
+            messages: the chat history
+            context_length: context length of the LLM, in tokens
+            max_output_tokens: output length to request, if possible
+            min_output_tokens: minimum acceptable output length
+            pinned: number of leading messages that are always kept
+                (e.g. the system message and other task messages)
+            total: tokens in `messages`, if known
+        Returns:
+            PackedContext: messages to send, the output length to request,
+                and the messages left out
+        Raises:
+            ValueError: if the pinned messages alone do not fit
+        """
+        if total is None:
+            total = sum(self.count(m) for m in messages)
+        if total + min_output_tokens <= context_length:
+            return PackedContext(
+                messages=messages,
+                output_len=min(max_output_tokens, context_length - total),
+                tokens=total,
+            )
+
+        counts = [self.count(m) for m in messages]
+        pinned = min(pinned, len(messages))
+        budget = context_length - min_output_tokens
+        kept = sum(counts[:pinned])
+        if kept > budget:
+            raise ValueError(
+                """
+                The message history is longer than the max chat context
+                length allowed, and we have run out of messages to drop."""
+            )
+        # room for the summary of the messages left out, if any
+        summarizing = (
+            self.config.policy == PackingPolicy.SUMMARIZE and self.summarize is not None
+        )
+        reserved = (
+            self.config.summary_tokens
+            + self.count(LLMMessage(role=Role.SYSTEM, content=SUMMARY_HEADER))
+            if summarizing
+            else 0
+        )
+        # keep the longest run of most recent messages that fits
+        start = len(messages)
+        while start > pinned and kept + reserved + counts[start - 1] <= budget:
+            start -= 1
+            kept += counts[start]
+
+        summary = None
+        if summarizing and start > pinned:
+            summary = self._summary(messages[pinned:start])
+            summary_tokens = self.count(summary)
+            if kept + summary_tokens <= budget:
+                kept += summary_tokens
+            else:
+                summary = None
+
+        return PackedContext(
+            messages=messages[:pinned]
+            + ([summary] if summary is not None else [])
+            + messages[start:],
+            output_len=min(max_output_tokens, context_length - kept),
+            tokens=kept,
+            dropped=list(range(pinned, start)),
+            summary=summary,
+        )
+
+    def _summary(self, messages: List[LLMMessage]) -> LLMMessage:
+        assert self.summarize is not None
+        text = self.summarize(messages, self.config.summary_tokens)
+        return LLMMessage(
+            role=Role.SYSTEM,
+            content=SUMMARY_HEADER + text,
+        )
@@ -172,4 +172,5 @@ class ToolMessage(ABC, BaseModel):
             properties=properties,
             required=required,
         )
+        spec._args_model = cls
         return spec
@@ -1,10 +1,17 @@
 from abc import ABC, abstractmethod
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 
 
 class CacheDB(ABC):
     """Abstract base class for a cache database."""
 
+    @abstractmethod
+    def clear(self) -> None:
+        """
+        Abstract method to clear all keys from the cache.
+        """
+        pass
+
     @abstractmethod
     def store(self, key: str, value: Dict[str, Any]) -> None:
         """
@@ -28,3 +35,38 @@ class CacheDB(ABC):
             dict: The value associated with the key.
         """
         pass
+
+    def store_many(self, items: Dict[str, Any]) -> None:
+        """
+        Store several key-value pairs. Backends override this to do it
+        in a single round-trip; the default stores them one by one.
+
+        Args:
+            items (dict): The values to store, keyed by their keys.
+        """
+        for key, value in items.items():
+            self.store(key, value)
+
+    def retrieve_many(self, keys: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Retrieve the values associated with several keys. Backends override
+        this to do it in a single round-trip; the default retrieves them
+        one by one.
+
+        Args:
+            keys (List[str]): The keys to retrieve the values for.
+
+        Returns:
+            List[dict]: The values (None for missing keys), in the order of `keys`.
+        """
+        return [self.retrieve(key) for key in keys]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Counters of the cache, e.g. for metrics. Backends override this;
+        the default has none.
+
+        Returns:
+            dict: counters, by name.
+        """
+        return {}
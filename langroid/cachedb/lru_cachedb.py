@@ -0,0 +1,164 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+from pydantic import BaseModel
+
+from langroid.cachedb.base import CacheDB
+
+
+class LRUCacheConfig(BaseModel):
+    """Configuration model for LRUCache."""
+
+    max_bytes: int = 64 * 1024 * 1024  # max total (JSON) size of stored values
+    ttl: Optional[float] = 60 * 60  # seconds until an entry expires; None = never
+    # instances created via `LRUCache.shared` with the same name share entries
+    name: str = "default"
+
+
+class LRUCache(CacheDB):
+    """
+    In-process cache, evicting least-recently-used entries when the total size
+    of the stored values exceeds `max_bytes`. Values are kept as objects, so a
+    hit costs neither a network round-trip nor JSON decoding; callers should
+    treat retrieved values as read-only.
+    """
+
+    _shared: Dict[str, "LRUCache"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, config: LRUCacheConfig):
+        """
+        Initialize an LRUCache with the given config.
+
+        Args:
+            config (LRUCacheConfig): The configuration to use.
+        """
+        self.config = config
+        self.lock = threading.Lock()
+        # key -> (expiry time, size in bytes, value), least recently used first
+        self.entries: OrderedDict[str, Tuple[float, int, Any]] = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def shared(cls, config: LRUCacheConfig) -> "LRUCache":
+        """
+        Get the process-wide LRUCache named `config.name`, creating it if needed,
+        so that all users (e.g. all LLM instances) share the same entries.
+
+        Args:
+            config (LRUCacheConfig): The configuration to use, if creating it.
+
+        Returns:
+            LRUCache: The shared cache.
+        """
+        with cls._shared_lock:
+            cache = cls._shared.get(config.name)
+            if cache is None:
+                cache = cls(config)
+                cls._shared[config.name] = cache
+            return cache
+
+    def clear(self) -> None:
+        """Clear all entries."""
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def delete(self, keys: Iterable[str]) -> None:
+        """
+        Remove the entries of some keys (those present).
+
+        Args:
+            keys (Iterable[str]): The keys to remove.
+        """
+        with self.lock:
+            for key in keys:
+                self._remove(key)
+
+    def present(self, keys: Iterable[str]) -> Set[str]:
+        """
+        The keys (among `keys`) that have an entry, expired or not.
+
+        Args:
+            keys (Iterable[str]): The keys to check.
+
+        Returns:
+            Set[str]: The keys present.
+        """
+        with self.lock:
+            return {key for key in keys if key in self.entries}
+
+    def store(self, key: str, value: Any) -> None:
+        """
+        Store a value associated with a key, evicting least-recently-used
+        entries if needed to stay within `max_bytes`. A value larger than
+        `max_bytes` is not stored.
+
+        Args:
+            key (str): The key under which to store the value.
+            value (Any): The value to store.
+        """
+        size = len(json.dumps(value))
+        ttl = self.config.ttl
+        expiry = float("inf") if ttl is None else time.monotonic() + ttl
+        with self.lock:
+            self._remove(key)
+            if size > self.config.max_bytes:
+                return
+            self.entries[key] = (expiry, size, value)
+            self.bytes += size
+            while self.bytes > self.config.max_bytes:
+                oldest = next(iter(self.entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def retrieve(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Retrieve the value associated with a key, marking it as most recently
+        used.
+
+        Args:
+            key (str): The key to retrieve the value for.
+
+        Returns:
+            dict: The value associated with the key, or None if it is
+                missing or expired.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]  # type: ignore
+
+    def _remove(self, key: str) -> None:
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Counters of the cache, e.g. for metrics.
+
+        Returns:
+            dict: hits, misses, evictions, number of entries and total bytes.
+        """
+        with self.lock:
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                entries=len(self.entries),
+                bytes=self.bytes,
+            )
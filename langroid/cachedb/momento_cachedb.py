@@ -1,8 +1,8 @@
-import json
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 
 import momento
 from dotenv import load_dotenv
@@ -10,6 +10,7 @@ from momento.responses import CacheGet
 from pydantic import BaseModel
 
 from langroid.cachedb.base import CacheDB
+from langroid.cachedb.record import RecordCodec
 
 logger = logging.getLogger(__name__)
 
@@ -19,10 +20,16 @@ class MomentoCacheConfig(BaseModel):
 
     ttl: int = 60 * 60 * 24 * 7  # 1 week
     cachename: str = "langroid_momento_cache"
+    # max concurrent requests in `store_many` / `retrieve_many`
+    max_concurrent_requests: int = 16
+    compress: bool = False  # zstd-compress stored records? (needs `zstandard`)
 
 
 class MomentoCache(CacheDB):
-    """Momento implementation of the CacheDB."""
+    """
+    Momento implementation of the CacheDB.
+    Values are stored as compact records (see `cachedb.record`).
+    """
 
     def __init__(self, config: MomentoCacheConfig):
         """
@@ -32,6 +39,7 @@ class MomentoCache(CacheDB):
             config (MomentoCacheConfig): The configuration to use.
         """
         self.config = config
+        self.codec = RecordCodec(config.compress)
         load_dotenv()
 
         momento_token = os.getenv("MOMENTO_AUTH_TOKEN")
@@ -51,6 +59,15 @@ class MomentoCache(CacheDB):
         """Clear keys from current db."""
         self.client.flush_cache(self.config.cachename)
 
+    def stats(self) -> Dict[str, Any]:
+        """
+        Size counters of the records stored, e.g. for metrics.
+
+        Returns:
+            dict: see `RecordCodec.stats`.
+        """
+        return self.codec.stats()
+
     def store(self, key: str, value: Any) -> None:
         """
         Store a value associated with a key.
@@ -59,7 +76,7 @@ class MomentoCache(CacheDB):
             key (str): The key under which to store the value.
             value (Any): The value to store.
         """
-        self.client.set(self.config.cachename, key, json.dumps(value))
+        self.client.set(self.config.cachename, key, self.codec.encode(value))
 
     def retrieve(self, key: str) -> Optional[Dict[str, Any]]:
         """
@@ -73,6 +90,35 @@ class MomentoCache(CacheDB):
         """
         value = self.client.get(self.config.cachename, key)
         if isinstance(value, CacheGet.Hit):
-            return json.loads(value.value_string)  # type: ignore
+            return self.codec.decode(value.value_bytes)
         else:
             return None
+
+    def store_many(self, items: Dict[str, Any]) -> None:
+        """
+        Store several key-value pairs, with concurrent requests
+        (the Momento client has no multi-key set).
+
+        Args:
+            items (dict): The values to store, keyed by their keys.
+        """
+        if not items:
+            return
+        with ThreadPoolExecutor(self.config.max_concurrent_requests) as pool:
+            list(pool.map(lambda kv: self.store(*kv), items.items()))
+
+    def retrieve_many(self, keys: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Retrieve the values associated with several keys, with concurrent
+        requests (the Momento client has no multi-key get).
+
+        Args:
+            keys (List[str]): The keys to retrieve the values for.
+
+        Returns:
+            List[dict]: The values (None for missing keys), in the order of `keys`.
+        """
+        if not keys:
+            return []
+        with ThreadPoolExecutor(self.config.max_concurrent_requests) as pool:
+            return list(pool.map(self.retrieve, keys))
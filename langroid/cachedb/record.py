@@ -0,0 +1,215 @@
+"""
+Compact, versioned records of cached LLM API responses.
+
+A raw OpenAI response carries much that is never read back from the cache
+(ids, `created` timestamps, `object` and `index` fields, ...). A record keeps
+only what the LLM classes use: each choice's message (role, content and
+function_call) or completion text, and the usage. It is serialized as compact
+JSON (with `orjson` if installed, else the stdlib `json`), optionally
+zstd-compressed, behind a small header:
+
+    b"\\x00L" | version (1 byte) | flags (1 byte: bit 0 = zstd)
+
+Values written before records existed (plain JSON, or zstd-compressed JSON in
+the `SQLiteCache`) start differently, and are still decoded as such.
+"""
+import json
+import threading
+from typing import Any, Dict, Optional, Union
+
+RECORD_VERSION = 1
+_MAGIC = b"\x00L"
+_HEADER_SIZE = len(_MAGIC) + 2
+_ZSTD = 0x01
+_ZSTD_FRAME = b"\x28\xb5\x2f\xfd"
+
+
+def _dumps(value: Any) -> bytes:
+    try:
+        import orjson
+    except ImportError:
+        return json.dumps(value, separators=(",", ":")).encode()
+    return orjson.dumps(value)
+
+
+def _loads(data: bytes) -> Any:
+    try:
+        import orjson
+    except ImportError:
+        return json.loads(data)
+    return orjson.loads(data)
+
+
+def compact_response(value: Any) -> Any:
+    """
+    Keep only the fields of an OpenAI (Chat)Completion response that are read
+    back from the cache; other values are returned unchanged.
+    Args:
+        value: value to cache
+    Returns:
+        the compact value
+    """
+    if not isinstance(value, dict) or "choices" not in value:
+        return value
+    choices = []
+    for choice in value["choices"]:
+        if "message" in choice:
+            message = choice["message"]
+            compact = dict(role=message.get("role"), content=message.get("content"))
+            if message.get("function_call") is not None:
+                compact["function_call"] = dict(
+                    name=message["function_call"].get("name"),
+                    arguments=message["function_call"].get("arguments"),
+                )
+            choices.append(dict(message=compact))
+        else:
+            choices.append(dict(text=choice.get("text")))
+    record: Dict[str, Any] = dict(choices=choices)
+    if value.get("usage") is not None:
+        usage = value["usage"]
+        record["usage"] = dict(
+            prompt_tokens=usage.get("prompt_tokens", 0),
+            completion_tokens=usage.get("completion_tokens", 0),
+            total_tokens=usage.get("total_tokens", 0),
+        )
+    return record
+
+
+def encoded_size(value: Any) -> int:
+    """
+    Size of the (uncompressed) record of a value, e.g. to count the bytes read
+    from or written to a cache. The value is encoded to measure it, so this is
+    best kept off hot paths (see `CacheStats`).
+    """
+    return len(_dumps(compact_response(value))) + _HEADER_SIZE
+
+
+class RecordCodec:
+    """
+    Encodes values to compact records, and decodes records (or values in the
+    legacy format) back. Tracks the bytes saved relative to the legacy format,
+    which is measured (by serializing the full value as before) only on a
+    sample of the records, and extrapolated to the others by the size of
+    their (uncompressed) payload.
+    """
+
+    def __init__(self, compress: bool = False, legacy_sample_every: int = 16):
+        """
+        Args:
+            compress: zstd-compress records? (needs `zstandard`)
+            legacy_sample_every: measure the legacy size of the first record,
+                and then of one in this many
+        """
+        self.compress = compress
+        self.compressor: Any = None
+        self.decompressor: Any = None
+        if compress:
+            self._init_zstd()
+        self.lock = threading.Lock()
+        self.legacy_sample_every = max(legacy_sample_every, 1)
+        self.records = 0
+        self.stored_bytes = 0
+        self.payload_bytes = 0  # uncompressed payloads of all records
+        # legacy sizes, and uncompressed payloads, of the sampled records
+        self.sampled_legacy_bytes = 0
+        self.sampled_payload_bytes = 0
+
+    def _init_zstd(self) -> None:
+        # this is an "extra" optional dependency, so we import it here
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError(
+                """
+                Compressed cache records require the `zstandard` package,
+                please install it with `pip install zstandard`
+                (or `poetry install -E zstd`)
+                """
+            )
+        self.compressor = zstandard.ZstdCompressor()
+        self.decompressor = zstandard.ZstdDecompressor()
+
+    def encode(self, value: Any) -> bytes:
+        """
+        Encode a value to a record.
+        Args:
+            value: value to cache
+        Returns:
+            bytes: the record
+        """
+        data = _dumps(compact_response(value))
+        payload_size = len(data)
+        flags = 0
+        if self.compress:
+            data = self.compressor.compress(data)
+            flags |= _ZSTD
+        record = _MAGIC + bytes([RECORD_VERSION, flags]) + data
+        with self.lock:
+            sampled = self.records % self.legacy_sample_every == 0
+            self.records += 1
+            self.stored_bytes += len(record)
+            self.payload_bytes += payload_size
+        if sampled:
+            # size of the value as it was stored before records existed
+            legacy_size = len(json.dumps(value))
+            with self.lock:
+                self.sampled_legacy_bytes += legacy_size
+                self.sampled_payload_bytes += payload_size
+        return record
+
+    def decode(self, data: Union[bytes, str]) -> Optional[Any]:
+        """
+        Decode a record, or a value in the legacy format.
+        Args:
+            data: the stored record
+        Returns:
+            the cached value
+        """
+        if isinstance(data, str):
+            data = data.encode()
+        if data.startswith(_MAGIC):
+            version, flags = data[len(_MAGIC)], data[len(_MAGIC) + 1]
+            if version > RECORD_VERSION:
+                raise ValueError(f"Unsupported cache record version {version}")
+            data = data[_HEADER_SIZE:]
+            if flags & _ZSTD:
+                data = self._decompress(data)
+        elif data.startswith(_ZSTD_FRAME):
+            data = self._decompress(data)
+        return _loads(data)
+
+    def _decompress(self, data: bytes) -> bytes:
+        # the record may have been written with compression on,
+        # even if it is off now
+        if self.decompressor is None:
+            self._init_zstd()
+        decompressor: Any = self.decompressor
+        return decompressor.decompress(data)  # type: ignore
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Size counters of the records encoded, e.g. for metrics.
+        Returns:
+            dict: records encoded, their (estimated) size in the legacy format
+                (plain JSON of the full value), their stored size, and the
+                bytes saved
+        """
+        with self.lock:
+            legacy_bytes = (
+                round(
+                    self.payload_bytes
+                    * self.sampled_legacy_bytes
+                    / self.sampled_payload_bytes
+                )
+                if self.sampled_payload_bytes
+                else self.sampled_legacy_bytes
+            )
+            return dict(
+                records=self.records,
+                legacy_bytes=legacy_bytes,
+                stored_bytes=self.stored_bytes,
+                saved_bytes=legacy_bytes - self.stored_bytes,
+                saved_ratio=(
+                    1 - self.stored_bytes / legacy_bytes if legacy_bytes else 0.0
+                ),
+            )
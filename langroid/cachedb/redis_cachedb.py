@@ -1,7 +1,8 @@
-import json
 import logging
 import os
-from typing import Any, Dict, Optional
+import re
+import time
+from typing import Any, Dict, List, Optional
 
 import fakeredis
 import redis
@@ -9,6 +10,7 @@ from dotenv import load_dotenv
 from pydantic import BaseModel
 
 from langroid.cachedb.base import CacheDB
+from langroid.cachedb.record import RecordCodec
 
 logger = logging.getLogger(__name__)
 
@@ -17,10 +19,30 @@ class RedisCacheConfig(BaseModel):
     """Configuration model for RedisCache."""
 
     fake: bool = False
+    compress: bool = False  # zstd-compress stored records? (needs `zstandard`)
+    ttl: Optional[int] = None  # seconds; None = never expire
+    # prefix of all keys, e.g. "<project>:<model>"; one Redis db can hold
+    # several namespaces, and `clear` only deletes the keys of its own.
+    # An LLM sets it to its model name when left empty.
+    namespace: str = ""
+    # approximate LRU cap on the number of keys in the namespace: the least
+    # recently used are evicted beyond it; None = unbounded. The `ttl` of
+    # keys then counts from their last use, like their LRU order.
+    max_entries: Optional[int] = None
+    # check the cap every this many stores
+    evict_every: int = 100
 
 
 class RedisCache(CacheDB):
-    """Redis implementation of the CacheDB."""
+    """
+    Redis implementation of the CacheDB.
+    Values are stored as compact records (see `cachedb.record`), under keys
+    prefixed by the namespace (if any), and expire after `ttl` (if any).
+    With `max_entries` set, the access time of each key is kept in a sorted
+    set, so that the least recently used keys can be evicted; each access
+    then also renews the expiry of the key, so that the keys and the set
+    expire together.
+    """
 
     def __init__(self, config: RedisCacheConfig):
         """
@@ -30,6 +52,10 @@ class RedisCache(CacheDB):
             config (RedisCacheConfig): The configuration to use.
         """
         self.config = config
+        self.codec = RecordCodec(config.compress)
+        self.prefix = f"{config.namespace}:" if config.namespace else ""
+        self.lru_key = f"{self.prefix}__lru__"
+        self.num_stores = 0
         load_dotenv()
 
         if self.config.fake:
@@ -52,8 +78,79 @@ class RedisCache(CacheDB):
                 )
 
     def clear(self) -> None:
-        """Clear keys from current db."""
-        self.client.flushdb()
+        """
+        Clear keys from current db: only those of the namespace, if any.
+        """
+        if self.prefix:
+            self.invalidate()
+        else:
+            self.client.flushdb()
+
+    def invalidate(self, prefix: str = "") -> int:
+        """
+        Delete the keys of the namespace that start with a prefix, using SCAN
+        (so Redis is not blocked, unlike with KEYS), and UNLINK in batches.
+
+        Args:
+            prefix (str): Prefix of the keys to delete (after the namespace);
+                "" = all keys of the namespace.
+
+        Returns:
+            int: The number of keys deleted.
+        """
+        pattern = _escape_glob(self.prefix + prefix) + "*"
+        deleted = 0
+        batch: List[bytes] = []
+        for key in self.client.scan_iter(match=pattern, count=1000):
+            batch.append(key)
+            if len(batch) == 1000:
+                deleted += self._unlink(batch)
+                batch = []
+        if batch:
+            deleted += self._unlink(batch)
+        return deleted
+
+    def _unlink(self, keys: List[bytes]) -> int:
+        pipe = self.client.pipeline(transaction=False)
+        pipe.unlink(*keys)
+        if self.config.max_entries is not None:
+            pipe.zrem(self.lru_key, *keys)
+        return int(pipe.execute()[0])
+
+    def evict(self) -> int:
+        """
+        Evict the least recently used keys of the namespace beyond
+        `max_entries`, down to 90% of it.
+
+        Returns:
+            int: The number of keys evicted.
+        """
+        if self.config.max_entries is None:
+            return 0
+        if self.config.ttl is not None:
+            # keys that expired on their own
+            self.client.zremrangebyscore(
+                self.lru_key, "-inf", time.time() - self.config.ttl
+            )
+        count = self.client.zcard(self.lru_key)
+        if count <= self.config.max_entries:
+            return 0
+        excess = count - int(0.9 * self.config.max_entries)
+        keys = self.client.zrange(self.lru_key, 0, excess - 1)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.unlink(*keys)
+        pipe.zrem(self.lru_key, *keys)
+        pipe.execute()
+        return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Size counters of the records stored, e.g. for metrics.
+
+        Returns:
+            dict: see `RecordCodec.stats`.
+        """
+        return self.codec.stats()
 
     def clear_all(self) -> None:
         """Clear all keys from all dbs."""
@@ -67,7 +164,7 @@ class RedisCache(CacheDB):
             key (str): The key under which to store the value.
             value (Any): The value to store.
         """
-        self.client.set(key, json.dumps(value))
+        self._set({key: value})
 
     def retrieve(self, key: str) -> Optional[Dict[str, Any]]:
         """
@@ -79,5 +176,65 @@ class RedisCache(CacheDB):
         Returns:
             dict: The value associated with the key.
         """
-        value = self.client.get(key)
-        return json.loads(value) if value else None
+        return self._get([key])[0]
+
+    def store_many(self, items: Dict[str, Any]) -> None:
+        """
+        Store several key-value pairs (with their TTL), in one pipelined
+        round-trip.
+
+        Args:
+            items (dict): The values to store, keyed by their keys.
+        """
+        if items:
+            self._set(items)
+
+    def retrieve_many(self, keys: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Retrieve the values associated with several keys, with one MGET
+        (pipelined with the update of their access times, if needed).
+
+        Args:
+            keys (List[str]): The keys to retrieve the values for.
+
+        Returns:
+            List[dict]: The values (None for missing keys), in the order of `keys`.
+        """
+        return self._get(keys) if keys else []
+
+    def _set(self, items: Dict[str, Any]) -> None:
+        pipe = self.client.pipeline(transaction=False)
+        for key, value in items.items():
+            pipe.set(self.prefix + key, self.codec.encode(value), ex=self.config.ttl)
+        if self.config.max_entries is not None:
+            now = time.time()
+            pipe.zadd(self.lru_key, {self.prefix + key: now for key in items})
+        pipe.execute()
+        before = self.num_stores
+        self.num_stores += len(items)
+        if (
+            before // self.config.evict_every
+            != self.num_stores // self.config.evict_every
+        ):
+            self.evict()
+
+    def _get(self, keys: List[str]) -> List[Optional[Dict[str, Any]]]:
+        full_keys = [self.prefix + key for key in keys]
+        if self.config.max_entries is None:
+            values = self.client.mget(full_keys)
+        else:
+            now = time.time()
+            pipe = self.client.pipeline(transaction=False)
+            pipe.mget(full_keys)
+            # only keys already in the set, i.e. stored (and not evicted)
+            pipe.zadd(self.lru_key, {key: now for key in full_keys}, xx=True)
+            if self.config.ttl is not None:
+                for key in full_keys:
+                    pipe.expire(key, self.config.ttl)
+            values = pipe.execute()[0]
+        return [self.codec.decode(v) if v else None for v in values]
+
+
+def _escape_glob(pattern: str) -> str:
+    """Escape the glob special chars of a Redis MATCH pattern."""
+    return re.sub(r"([*?\[\]\\])", r"\\\1", pattern)
@@ -0,0 +1,219 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from langroid.cachedb.base import CacheDB
+from langroid.cachedb.record import RecordCodec
+
+
+class SQLiteCacheConfig(BaseModel):
+    """Configuration model for SQLiteCache."""
+
+    path: str = "~/.langroid/cache.db"
+    compress: bool = False  # zstd-compress stored records? (needs `zstandard`)
+    ttl: Optional[int] = 60 * 60 * 24 * 7  # 1 week; None = never expire
+    max_bytes: Optional[int] = 1024 * 1024 * 1024  # 1 GB; None = unbounded
+    # check the size limit (and purge expired entries) every this many stores
+    evict_every: int = 100
+    timeout: float = 30  # seconds to wait for a lock held by another writer
+
+
+class SQLiteCache(CacheDB):
+    """
+    SQLite implementation of the CacheDB, persisting on local disk.
+    The db is in WAL mode, so that readers (across threads and processes)
+    are not blocked by a writer. Entries expire after `ttl`, and when the
+    total size of stored values exceeds `max_bytes`, the least recently
+    used entries are evicted.
+    Values are stored as compact records (see `cachedb.record`).
+    """
+
+    def __init__(self, config: SQLiteCacheConfig):
+        """
+        Initialize a SQLiteCache with the given config.
+
+        Args:
+            config (SQLiteCacheConfig): The configuration to use.
+        """
+        self.config = config
+        self.path = os.path.expanduser(config.path)
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.codec = RecordCodec(config.compress)
+        # sqlite3 connections cannot be shared across threads
+        self.local = threading.local()
+        self.num_stores = 0
+        with self._connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    compressed INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires REAL,
+                    accessed REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        conn: Optional[sqlite3.Connection] = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.config.timeout)
+            # WAL mode is safe with synchronous=NORMAL, and much faster
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def clear(self) -> None:
+        """Clear all keys from the db."""
+        with self._connection() as conn:
+            conn.execute("DELETE FROM cache")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Size counters of the records stored, e.g. for metrics.
+
+        Returns:
+            dict: see `RecordCodec.stats`.
+        """
+        return self.codec.stats()
+
+    def store(self, key: str, value: Any) -> None:
+        """
+        Store a value associated with a key.
+
+        Args:
+            key (str): The key under which to store the value.
+            value (Any): The value to store.
+        """
+        self.store_many({key: value})
+
+    def store_many(self, items: Dict[str, Any]) -> None:
+        """
+        Store several key-value pairs, in one transaction.
+
+        Args:
+            items (dict): The values to store, keyed by their keys.
+        """
+        if not items:
+            return
+        now = time.time()
+        expires = None if self.config.ttl is None else now + self.config.ttl
+        rows = []
+        for key, value in items.items():
+            data = self.codec.encode(value)
+            rows.append((key, data, int(self.config.compress), len(data), expires, now))
+        with self._connection() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+        before = self.num_stores
+        self.num_stores += len(rows)
+        if (
+            before // self.config.evict_every
+            != self.num_stores // self.config.evict_every
+        ):
+            self.evict()
+
+    def retrieve(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Retrieve the value associated with a key.
+
+        Args:
+            key (str): The key to retrieve the value for.
+
+        Returns:
+            dict: The value associated with the key, or None if it is
+                missing or expired.
+        """
+        return self.retrieve_many([key])[0]
+
+    def retrieve_many(self, keys: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Retrieve the values associated with several keys, in one query.
+
+        Args:
+            keys (List[str]): The keys to retrieve the values for.
+
+        Returns:
+            List[dict]: The values (None for missing or expired keys),
+                in the order of `keys`.
+        """
+        if not keys:
+            return []
+        conn = self._connection()
+        rows: Dict[str, Tuple[bytes, int, Optional[float], float]] = {}
+        # stay below SQLite's limit on the number of query params
+        for start in range(0, len(keys), 500):
+            chunk = keys[start : start + 500]
+            for key, *row in conn.execute(
+                "SELECT key, value, compressed, expires, accessed FROM cache "
+                f"WHERE key IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ):
+                rows[key] = tuple(row)  # type: ignore
+        now = time.time()
+        expired = {k for k, r in rows.items() if r[2] is not None and r[2] < now}
+        # recency is only needed for eviction, so keep reads from
+        # turning into writes, except once in a while
+        stale = [k for k, r in rows.items() if now - r[3] > 60 and k not in expired]
+        if expired or stale:
+            with conn:
+                conn.executemany(
+                    "DELETE FROM cache WHERE key = ?", [(k,) for k in expired]
+                )
+                conn.executemany(
+                    "UPDATE cache SET accessed = ? WHERE key = ?",
+                    [(now, k) for k in stale],
+                )
+        values: List[Optional[Dict[str, Any]]] = []
+        for key in keys:
+            row = rows.get(key)
+            if row is None or key in expired:
+                values.append(None)
+                continue
+            values.append(self.codec.decode(row[0]))
+        return values
+
+    def evict(self) -> None:
+        """
+        Delete expired entries, and if the total size of the stored values
+        exceeds `max_bytes`, delete least recently used entries to get
+        back to 90% of it.
+        """
+        with self._connection() as conn:
+            conn.execute("DELETE FROM cache WHERE expires < ?", (time.time(),))
+            if self.config.max_bytes is None:
+                return
+            (total,) = conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM cache"
+            ).fetchone()
+            if total <= self.config.max_bytes:
+                return
+            excess = total - int(0.9 * self.config.max_bytes)
+            # delete least recently used entries, as long as the total size
+            # of the entries deleted before each one is below the excess
+            conn.execute(
+                """
+                DELETE FROM cache WHERE key IN (
+                    SELECT key FROM (
+                        SELECT key, SUM(size) OVER (
+                            ORDER BY accessed ROWS UNBOUNDED PRECEDING
+                        ) - size AS deleted_before
+                        FROM cache
+                    )
+                    WHERE deleted_before < ?
+                )
+                """,
+                (excess,),
+            )
@@ -0,0 +1,138 @@
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from langroid.cachedb.base import CacheDB
+from langroid.cachedb.lru_cachedb import LRUCache
+
+
+class TieredCache(CacheDB):
+    """
+    Two-tier cache: an in-process `LRUCache` in front of a (typically remote)
+    backend cache such as `RedisCache` or `MomentoCache`.
+    Writes go through to both tiers; a value found only in the backend
+    is promoted to the memory tier, so repeated lookups stay in-process.
+    The memory tier may be shared (see `LRUCache.shared`): `clear` only removes
+    the entries this cache put there.
+    """
+
+    def __init__(self, memory: LRUCache, backend: CacheDB):
+        """
+        Initialize a TieredCache.
+
+        Args:
+            memory (LRUCache): The in-process tier, looked up first.
+            backend (CacheDB): The backend tier.
+        """
+        self.memory = memory
+        self.backend = backend
+        self.lock = threading.Lock()
+        self.backend_hits = 0
+        self.backend_misses = 0
+        # keys this cache put in the memory tier (some may since be evicted)
+        self.keys: Set[str] = set()
+
+    def _track(self, keys: Iterable[str]) -> None:
+        """Note keys put in the memory tier, forgetting evicted ones now and then."""
+        with self.lock:
+            self.keys.update(keys)
+            if len(self.keys) > 2 * self.memory.stats()["entries"] + 1024:
+                self.keys = self.memory.present(self.keys)
+
+    def clear(self) -> None:
+        """
+        Clear the backend, and the entries this cache put in the memory tier
+        (those of other users of a shared memory tier are kept).
+        """
+        with self.lock:
+            keys, self.keys = self.keys, set()
+        self.memory.delete(keys)
+        self.backend.clear()
+
+    def store(self, key: str, value: Any) -> None:
+        """
+        Store a value associated with a key, in both tiers.
+
+        Args:
+            key (str): The key under which to store the value.
+            value (Any): The value to store.
+        """
+        self.memory.store(key, value)
+        self._track([key])
+        self.backend.store(key, value)
+
+    def retrieve(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Retrieve the value associated with a key, from the memory tier if
+        present, else from the backend (promoting it to the memory tier).
+
+        Args:
+            key (str): The key to retrieve the value for.
+
+        Returns:
+            dict: The value associated with the key.
+        """
+        value = self.memory.retrieve(key)
+        if value is not None:
+            return value
+        value = self.backend.retrieve(key)
+        with self.lock:
+            if value is None:
+                self.backend_misses += 1
+            else:
+                self.backend_hits += 1
+        if value is not None:
+            self.memory.store(key, value)
+            self._track([key])
+        return value
+
+    def store_many(self, items: Dict[str, Any]) -> None:
+        """
+        Store several key-value pairs, in both tiers.
+
+        Args:
+            items (dict): The values to store, keyed by their keys.
+        """
+        self.memory.store_many(items)
+        self._track(items)
+        self.backend.store_many(items)
+
+    def retrieve_many(self, keys: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Retrieve the values associated with several keys: those missing from
+        the memory tier are looked up in the backend in one call, and promoted.
+
+        Args:
+            keys (List[str]): The keys to retrieve the values for.
+
+        Returns:
+            List[dict]: The values (None for missing keys), in the order of `keys`.
+        """
+        values = self.memory.retrieve_many(keys)
+        missing = [i for i, v in enumerate(values) if v is None]
+        if not missing:
+            return values
+        found = self.backend.retrieve_many([keys[i] for i in missing])
+        with self.lock:
+            hits = sum(v is not None for v in found)
+            self.backend_hits += hits
+            self.backend_misses += len(found) - hits
+        promoted = []
+        for i, value in zip(missing, found):
+            if value is not None:
+                values[i] = value
+                self.memory.store(keys[i], value)
+                promoted.append(keys[i])
+        self._track(promoted)
+        return values
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Hit/miss counters of each tier, e.g. for metrics.
+        The backend is only looked up on a memory miss.
+
+        Returns:
+            dict: counters of the "memory" and "backend" tiers.
+        """
+        with self.lock:
+            backend = dict(hits=self.backend_hits, misses=self.backend_misses)
+        return dict(memory=self.memory.stats(), backend=backend)
@@ -1,12 +1,16 @@
 import os
-from typing import Callable, List
+import time
+from typing import Callable, List, Optional
 
 import openai
 from dotenv import load_dotenv
 
 from langroid.embedding_models.base import EmbeddingModel, EmbeddingModelsConfig
+from langroid.language_models.cassette import active_cassette, replaying
+from langroid.language_models.rate_limiter import get_rate_limiter
 from langroid.language_models.utils import retry_with_exponential_backoff
 from langroid.mytypes import Embeddings
+from langroid.parsing.parser import Parser, ParsingConfig
 
 
 class OpenAIEmbeddingsConfig(EmbeddingModelsConfig):
@@ -14,6 +18,9 @@ class OpenAIEmbeddingsConfig(EmbeddingModelsConfig):
     model_name: str = "text-embedding-ada-002"
     api_key: str = ""
     dims: int = 1536
+    # client-side rate limits, shared process-wide per model; None = unlimited
+    requests_per_minute: Optional[int] = None
+    tokens_per_minute: Optional[int] = None
 
 
 class SentenceTransformerEmbeddingsConfig(EmbeddingModelsConfig):
@@ -28,7 +35,7 @@ class OpenAIEmbeddings(EmbeddingModel):
         self.config = config
         load_dotenv()
         self.config.api_key = os.getenv("OPENAI_API_KEY", "")
-        if self.config.api_key == "":
+        if self.config.api_key == "" and not replaying():
             raise ValueError(
                 """OPENAI_API_KEY env variable must be set to use 
                 OpenAIEmbeddings. Please set the OPENAI_API_KEY value 
@@ -36,13 +43,28 @@ class OpenAIEmbeddings(EmbeddingModel):
                 """
             )
         openai.api_key = self.config.api_key
+        self.parser = Parser(ParsingConfig())
 
     def embedding_fn(self) -> Callable[[List[str]], Embeddings]:
+        limiter = get_rate_limiter(
+            self.config.model_name,
+            requests_per_minute=self.config.requests_per_minute,
+            tokens_per_minute=self.config.tokens_per_minute,
+        )
+
         @retry_with_exponential_backoff
         def fn(texts: List[str]) -> Embeddings:
-            result = openai.Embedding.create(  # type: ignore
-                input=texts, model=self.config.model_name
-            )
+            args = dict(input=texts, model=self.config.model_name)
+            cassette = active_cassette()
+            if cassette is not None and cassette.replaying:
+                result = cassette.replay("Embedding", args)
+                return [d["embedding"] for d in result["data"]]
+            tokens = sum(self.parser.num_tokens(t) for t in texts)
+            with limiter.limit(tokens):
+                start = time.time()
+                result = openai.Embedding.create(**args)  # type: ignore
+            if cassette is not None:
+                cassette.record("Embedding", args, result, start)
             return [d["embedding"] for d in result["data"]]
 
         return fn
@@ -1,25 +1,56 @@
 import asyncio
 import json
+import sys
+import time
 from abc import ABC, abstractmethod
 from enum import Enum
-from typing import Any, Dict, List, Optional, Tuple, Type, Union
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
 
-import aiohttp
-from pydantic import BaseModel, BaseSettings
+from pydantic import BaseModel, BaseSettings, PrivateAttr
 
+from langroid.cachedb.lru_cachedb import LRUCacheConfig
 from langroid.cachedb.momento_cachedb import MomentoCacheConfig
 from langroid.cachedb.redis_cachedb import RedisCacheConfig
+from langroid.cachedb.sqlite_cachedb import SQLiteCacheConfig
+from langroid.language_models.cache_stats import CacheStats, register_cache_stats
+from langroid.language_models.rate_limiter import RateLimiter, get_rate_limiter
+from langroid.language_models.utils import run_async
 from langroid.mytypes import Document
 from langroid.parsing.agent_chats import parse_message
 from langroid.parsing.json import top_level_json_field
+from langroid.parsing.parser import Parser, ParsingConfig, TokenCounted
 from langroid.prompts.dialog import collate_chat_history
 from langroid.prompts.templates import (
     EXTRACTION_PROMPT_GPT4,
     SUMMARY_ANSWER_PROMPT_GPT4,
 )
 from langroid.utils.configuration import settings
+from langroid.utils.constants import Colors
 from langroid.utils.output.printing import show_if_debug
 
+if TYPE_CHECKING:
+    from langroid.language_models.chat_tokens import ChatTokenEstimator
+    from langroid.language_models.endpoint_pool import EndpointConfig
+    from langroid.language_models.prompt_prefix import IncrementalPrompt
+
+T = TypeVar("T")
+R = TypeVar("R")
+
 
 class LLMConfig(BaseSettings):
     type: str = "openai"
@@ -34,7 +65,24 @@ class LLMConfig(BaseSettings):
     min_output_tokens: int = 64
     use_chat_for_completion: bool = True  # use chat model for completion?
     stream: bool = False  # stream output from API?
-    cache_config: None | RedisCacheConfig | MomentoCacheConfig = None
+    cache_config: Optional[
+        Union[RedisCacheConfig, MomentoCacheConfig, SQLiteCacheConfig]
+    ] = None
+    # optional in-process LRU cache tier, in front of the cache above
+    # (shared by all LLMs with the same `memory_cache_config.name`); None = no tier.
+    # Its entries are not affected by the invalidation, namespace or TTL of the
+    # cache above, so they may be served until they expire from the tier itself.
+    memory_cache_config: Optional[LRUCacheConfig] = None
+    # when caching is on, make identical concurrent (non-streamed) calls only
+    # once: the others wait for the first one's response (see `single_flight`)
+    coalesce_requests: bool = True
+    # max requests in flight at once, in the batch APIs
+    # (`chat_batch`, `generate_batch`)
+    max_concurrent_requests: int = 8
+    # client-side rate limits, shared process-wide by all instances using the
+    # same model (see `rate_limiter.get_rate_limiter`); None = unlimited
+    requests_per_minute: Optional[int] = None
+    tokens_per_minute: Optional[int] = None
 
     # Dict of model -> (input/prompt cost, output/completion cost)
     cost_per_1k_tokens: Optional[Dict[str, Tuple[float, float]]] = None
@@ -64,6 +112,9 @@ class LLMFunctionSpec(BaseModel):
     name: str
     description: str
     parameters: Dict[str, Any]
+    # model of the arguments (e.g. the ToolMessage the spec was made from),
+    # to validate them as they stream in; not sent to the API
+    _args_model: Optional[Type[BaseModel]] = PrivateAttr(default=None)
 
 
 class LLMTokenUsage(BaseModel):
@@ -83,9 +134,10 @@ class Role(str, Enum):
     FUNCTION = "function"
 
 
-class LLMMessage(BaseModel):
+class LLMMessage(TokenCounted):
     """
     Class representing message sent to, or received from, LLM.
+    Caches the number of tokens in its content, see `TokenCounted`.
     """
 
     role: Role
@@ -131,6 +183,12 @@ class LLMResponse(BaseModel):
     function_call: Optional[LLMFunctionCall] = None
     usage: Optional[LLMTokenUsage]
     cached: bool = False
+    # whether the response is from an identical call that was in flight
+    # (then `cached` is also set, since it cost nothing)
+    coalesced: bool = False
+    # whether the response was shown "live" as it streamed; None means
+    # as per `get_stream()` of the LLM (see `CascadeLM`, whose tiers differ)
+    streamed: Optional[bool] = None
 
     def to_LLMMessage(self) -> LLMMessage:
         content = self.message
@@ -189,6 +247,79 @@ class LLMResponse(BaseModel):
         return recipient_name, content
 
 
+class StreamEventType(str, Enum):
+    """Types of events emitted while streaming an LLM response."""
+
+    TEXT = "text"  # delta of the message text
+    FUNCTION_NAME = "function_name"  # delta of the function_call name
+    FUNCTION_ARGS = "function_args"  # delta of the function_call arguments
+    FINAL = "final"  # end of stream, with the complete response
+
+
+class LLMStreamEvent(BaseModel):
+    """
+    Event emitted while streaming an LLM response: delta events carry the
+    newly generated piece of text (or of the function_call name/arguments)
+    in `delta`, and the final event carries the complete response, with usage.
+    """
+
+    type: StreamEventType
+    delta: str = ""
+    elapsed: float = 0.0  # seconds since the request was sent
+    response: Optional[LLMResponse] = None  # only in the final event
+    # only in the final event: seconds until the first delta arrived
+    time_to_first_token: Optional[float] = None
+
+
+def response_stream_events(
+    response: LLMResponse, elapsed: float = 0.0
+) -> Iterator[LLMStreamEvent]:
+    """
+    Emit a complete (e.g. cached or non-streamed) response as stream events:
+    a single delta event (or function_call name and args events),
+    followed by the final event.
+    Args:
+        response: the complete response
+        elapsed: seconds since the request was sent
+    """
+    if response.function_call is not None:
+        yield LLMStreamEvent(
+            type=StreamEventType.FUNCTION_NAME,
+            delta=response.function_call.name,
+            elapsed=elapsed,
+        )
+        if response.function_call.arguments is not None:
+            yield LLMStreamEvent(
+                type=StreamEventType.FUNCTION_ARGS,
+                delta=json.dumps(response.function_call.arguments),
+                elapsed=elapsed,
+            )
+    elif response.message:
+        yield LLMStreamEvent(
+            type=StreamEventType.TEXT, delta=response.message, elapsed=elapsed
+        )
+    yield LLMStreamEvent(
+        type=StreamEventType.FINAL,
+        elapsed=elapsed,
+        response=response,
+        time_to_first_token=elapsed,
+    )
+
+
+def print_stream_event(event: LLMStreamEvent) -> None:
+    """
+    Console consumer of stream events: print each delta as it arrives.
+    """
+    if event.type == StreamEventType.FINAL:
+        print("")
+    elif event.type == StreamEventType.FUNCTION_NAME:
+        sys.stdout.write(Colors().GREEN + "FUNC: " + event.delta + ": ")
+        sys.stdout.flush()
+    else:
+        sys.stdout.write(Colors().GREEN + event.delta)
+        sys.stdout.flush()
+
+
 # Define an abstract base class for language models
 class LanguageModel(ABC):
     """
@@ -197,21 +328,45 @@ class LanguageModel(ABC):
 
     def __init__(self, config: LLMConfig):
         self.config = config
+        self._parser: Optional[Parser] = None
+        self._token_estimator: Optional["ChatTokenEstimator"] = None
+        self._prompt: Optional["IncrementalPrompt"] = None
+        model = config.chat_model or config.completion_model or config.type
+        self.cache_stats = CacheStats(getattr(model, "value", str(model)))
+        register_cache_stats(self.cache_stats)
 
     @staticmethod
-    def create(config: Optional[LLMConfig]) -> Optional[Type["LanguageModel"]]:
+    def create(
+        config: Optional[LLMConfig],
+        endpoints: Optional[List["EndpointConfig"]] = None,
+    ) -> Optional[Type["LanguageModel"]]:
         """
         Create a language model.
         Args:
             config: configuration for language model
+            endpoints: endpoints to spread the API calls over (see
+                `EndpointPool`); only for OpenAI (and Azure) LLMs
         Returns: instance of language model
         """
         from langroid.language_models.azure_openai import AzureGPT
-        from langroid.language_models.openai_gpt import OpenAIGPT
+        from langroid.language_models.cascade import CascadeLM
+        from langroid.language_models.endpoint_pool import EndpointPoolConfig
+        from langroid.language_models.mock_lm import MockLM
+        from langroid.language_models.openai_gpt import OpenAIGPT, OpenAIGPTConfig
 
         if config is None or config.type is None:
             return None
 
+        if endpoints is not None:
+            if not isinstance(config, OpenAIGPTConfig):
+                raise ValueError(
+                    f"Endpoint pools are not supported by LLMs of type {config.type}"
+                )
+            pool = config.endpoint_pool or EndpointPoolConfig()
+            config = config.copy(
+                update=dict(endpoint_pool=pool.copy(update=dict(endpoints=endpoints)))
+            )
+
         openai: Union[Type[AzureGPT], Type[OpenAIGPT]]
 
         if config.type == "azure":
@@ -220,6 +375,8 @@ class LanguageModel(ABC):
             openai = OpenAIGPT
         cls = dict(
             openai=openai,
+            mock=MockLM,
+            cascade=CascadeLM,
         ).get(config.type, openai)
         return cls(config)  # type: ignore
 
@@ -252,9 +409,252 @@ class LanguageModel(ABC):
     ) -> LLMResponse:
         pass
 
+    @abstractmethod
+    async def achat(
+        self,
+        messages: Union[str, List[LLMMessage]],
+        max_tokens: int,
+        functions: Optional[List[LLMFunctionSpec]] = None,
+        function_call: str | Dict[str, str] = "auto",
+    ) -> LLMResponse:
+        pass
+
+    def chat_stream(
+        self,
+        messages: Union[str, List[LLMMessage]],
+        max_tokens: int,
+        functions: Optional[List[LLMFunctionSpec]] = None,
+        function_call: str | Dict[str, str] = "auto",
+    ) -> Iterator[LLMStreamEvent]:
+        """
+        Chat with the LLM, yielding the response incrementally as stream events,
+        ending with a `StreamEventType.FINAL` event carrying the complete response.
+        This default implementation emits the complete response of `chat`;
+        LLMs that support streaming override it to emit deltas as they arrive.
+        See `chat` for a description of the params.
+        """
+        start = time.time()
+        response = self.chat(messages, max_tokens, functions, function_call)
+        yield from response_stream_events(response, time.time() - start)
+
+    async def achat_stream(
+        self,
+        messages: Union[str, List[LLMMessage]],
+        max_tokens: int,
+        functions: Optional[List[LLMFunctionSpec]] = None,
+        function_call: str | Dict[str, str] = "auto",
+    ) -> AsyncIterator[LLMStreamEvent]:
+        """
+        Async version of `chat_stream`.
+        """
+        start = time.time()
+        response = await self.achat(messages, max_tokens, functions, function_call)
+        for event in response_stream_events(response, time.time() - start):
+            yield event
+
     def __call__(self, prompt: str, max_tokens: int) -> LLMResponse:
         return self.generate(prompt, max_tokens)
 
+    def rate_limiter(self, model: Optional[str] = None) -> RateLimiter:
+        """
+        Get the process-wide rate limiter for a model, configured with
+        this LLM's `requests_per_minute` and `tokens_per_minute` limits.
+        Args:
+            model: model name; defaults to `config.chat_model`
+        Returns:
+            RateLimiter: limiter shared by all users of `model`
+        """
+        model = model or self.config.chat_model
+        if isinstance(model, Enum):
+            model = model.value
+        return get_rate_limiter(
+            str(model),
+            requests_per_minute=self.config.requests_per_minute,
+            tokens_per_minute=self.config.tokens_per_minute,
+        )
+
+    def estimate_tokens(
+        self,
+        messages: Union[str, List[LLMMessage]],
+        max_tokens: int,
+        functions: Optional[List[LLMFunctionSpec]] = None,
+        function_call: str | Dict[str, str] = "auto",
+    ) -> int:
+        """
+        Estimate the total tokens (prompt + completion) a request may consume,
+        e.g. for budgeting against a tokens-per-minute limit.
+        Args:
+            messages: prompt string, or list of messages
+            max_tokens: max output tokens requested
+            functions: functions available to the LLM, whose schema is part
+                of the prompt
+            function_call: how the LLM should use `functions`
+        Returns:
+            int: estimated number of tokens
+        """
+        estimator = self.token_estimator()
+        if isinstance(messages, str):
+            prompt_tokens = self.num_tokens(messages)
+            if functions:
+                prompt_tokens += estimator.functions_tokens(functions)
+        else:
+            _, tokens = self.prompt().render(messages)
+            prompt_tokens = tokens + estimator.overhead_tokens(
+                messages, functions, function_call
+            )
+        return prompt_tokens + max_tokens
+
+    def token_estimator(self) -> "ChatTokenEstimator":
+        """
+        The (lazily created) counter of chat prompt tokens for the chat model;
+        it caches the token counts of message contents on the messages.
+        """
+        from langroid.language_models.chat_tokens import ChatTokenEstimator
+
+        if self._token_estimator is None:
+            model = self.config.chat_model or ""
+            self._token_estimator = ChatTokenEstimator(
+                str(getattr(model, "value", model))
+            )
+        return self._token_estimator
+
+    def prompt(self) -> "IncrementalPrompt":
+        """
+        The (lazily created) latest chat prompt sent, whose API dicts, token
+        counts and hash are updated incrementally from turn to turn.
+        """
+        from langroid.language_models.prompt_prefix import IncrementalPrompt
+
+        if self._prompt is None:
+            self._prompt = IncrementalPrompt(self.token_estimator().message_tokens)
+        return self._prompt
+
+    def set_prompt_prefix(self, messages: List[LLMMessage]) -> None:
+        """
+        Declare the leading messages of the chat prompts to come (e.g. the
+        system message and tool instructions), that do not change from turn
+        to turn; see `FrozenPrefix`.
+        """
+        from langroid.language_models.prompt_prefix import FrozenPrefix
+
+        prompt = self.prompt()
+        prompt.set_prefix(FrozenPrefix(messages, prompt.count))
+
+    def num_tokens(self, text: str) -> int:
+        """
+        Number of tokens in `text`, using the (lazily created) default tokenizer.
+        """
+        if self._parser is None:
+            self._parser = Parser(ParsingConfig())
+        return self._parser.num_tokens(text)
+
+    async def _run_batch(
+        self,
+        inputs: Sequence[T],
+        call: Callable[[T], Awaitable[R]],
+        max_concurrent: Optional[int] = None,
+    ) -> List[R]:
+        """
+        Run `call` on each of `inputs` concurrently, with at most
+        `max_concurrent` calls in flight. (Each call itself waits on the
+        requests/tokens-per-minute budgets of the model's rate limiter.)
+        Args:
+            inputs: e.g. prompts or message lists
+            call: async fn mapping an input to e.g. an LLMResponse
+            max_concurrent: max concurrent calls; defaults to
+                `config.max_concurrent_requests`
+        Returns:
+            List: results, in the same order as `inputs`
+        """
+        semaphore = asyncio.Semaphore(
+            max_concurrent or self.config.max_concurrent_requests
+        )
+
+        async def run_one(item: T) -> R:
+            async with semaphore:
+                return await call(item)
+
+        return list(await asyncio.gather(*(run_one(i) for i in inputs)))
+
+    async def achat_batch(
+        self,
+        messages_list: Sequence[Union[str, List[LLMMessage]]],
+        max_tokens: int,
+        functions: Optional[List[LLMFunctionSpec]] = None,
+        function_call: str | Dict[str, str] = "auto",
+        max_concurrent: Optional[int] = None,
+    ) -> List[LLMResponse]:
+        """
+        Run `achat` on each of a list of message-sequences, with bounded
+        concurrency and rate limits.
+        Args:
+            messages_list: list of message-sequences (or prompt strings)
+            max_tokens: max output tokens for each call
+            functions: functions available to the LLM, in each call
+            function_call: how the LLM should use `functions`, in each call
+            max_concurrent: max concurrent calls; defaults to
+                `config.max_concurrent_requests`
+        Returns:
+            List[LLMResponse]: responses, in the same order as `messages_list`,
+                each with its own `usage` and `cached` fields.
+        """
+        return await self._run_batch(
+            messages_list,
+            lambda m: self.achat(m, max_tokens, functions, function_call),
+            max_concurrent,
+        )
+
+    def chat_batch(
+        self,
+        messages_list: Sequence[Union[str, List[LLMMessage]]],
+        max_tokens: int,
+        functions: Optional[List[LLMFunctionSpec]] = None,
+        function_call: str | Dict[str, str] = "auto",
+        max_concurrent: Optional[int] = None,
+    ) -> List[LLMResponse]:
+        """
+        Sync version of `achat_batch`. See there for details.
+        """
+        return run_async(
+            self.achat_batch(
+                messages_list, max_tokens, functions, function_call, max_concurrent
+            )
+        )
+
+    async def agenerate_batch(
+        self,
+        prompts: Sequence[str],
+        max_tokens: int,
+        max_concurrent: Optional[int] = None,
+    ) -> List[LLMResponse]:
+        """
+        Run `agenerate` on each of a list of prompts, with bounded
+        concurrency and rate limits.
+        Args:
+            prompts: list of prompts
+            max_tokens: max output tokens for each call
+            max_concurrent: max concurrent calls; defaults to
+                `config.max_concurrent_requests`
+        Returns:
+            List[LLMResponse]: responses, in the same order as `prompts`
+        """
+        return await self._run_batch(
+            prompts,
+            lambda p: self.agenerate(p, max_tokens),
+            max_concurrent,
+        )
+
+    def generate_batch(
+        self,
+        prompts: Sequence[str],
+        max_tokens: int,
+        max_concurrent: Optional[int] = None,
+    ) -> List[LLMResponse]:
+        """
+        Sync version of `agenerate_batch`. See there for details.
+        """
+        return run_async(self.agenerate_batch(prompts, max_tokens, max_concurrent))
+
     def chat_context_length(self) -> int:
         if self.config.chat_model is None:
             raise ValueError("No chat model specified")
@@ -298,23 +698,26 @@ class LanguageModel(ABC):
         """.strip()
         show_if_debug(prompt, "FOLLOWUP->STANDALONE-PROMPT= ")
         standalone = self.generate(prompt=prompt, max_tokens=1024).message.strip()
-        show_if_debug(prompt, "FOLLOWUP->STANDALONE-RESPONSE= ")
+        show_if_debug(standalone, "FOLLOWUP->STANDALONE-RESPONSE= ")
         return standalone
 
+    def _verbatim_extract_prompt(self, question: str, passage: Document) -> str:
+        templatized_prompt = EXTRACTION_PROMPT_GPT4
+        final_prompt = templatized_prompt.format(
+            question=question, content=passage.content
+        )
+        show_if_debug(final_prompt, "EXTRACT-PROMPT= ")
+        return final_prompt
+
     async def get_verbatim_extract_async(self, question: str, passage: Document) -> str:
         """
         Asynchronously, get verbatim extract from passage
         that is relevant to a question.
         Asynch allows parallel calls to the LLM API.
         """
-        async with aiohttp.ClientSession():
-            templatized_prompt = EXTRACTION_PROMPT_GPT4
-            final_prompt = templatized_prompt.format(
-                question=question, content=passage.content
-            )
-            show_if_debug(final_prompt, "EXTRACT-PROMPT= ")
-            final_extract = await self.agenerate(prompt=final_prompt, max_tokens=1024)
-            show_if_debug(final_extract.message.strip(), "EXTRACT-RESPONSE= ")
+        final_prompt = self._verbatim_extract_prompt(question, passage)
+        final_extract = await self.agenerate(prompt=final_prompt, max_tokens=1024)
+        show_if_debug(final_extract.message.strip(), "EXTRACT-RESPONSE= ")
         return final_extract.message.strip()
 
     async def _get_verbatim_extracts(
@@ -322,10 +725,11 @@ class LanguageModel(ABC):
         question: str,
         passages: List[Document],
     ) -> List[Document]:
-        async with aiohttp.ClientSession():
-            verbatim_extracts = await asyncio.gather(
-                *(self.get_verbatim_extract_async(question, P) for P in passages)
-            )
+        prompts = [self._verbatim_extract_prompt(question, P) for P in passages]
+        responses = await self.agenerate_batch(prompts, max_tokens=1024)
+        verbatim_extracts = [r.message.strip() for r in responses]
+        for e in verbatim_extracts:
+            show_if_debug(e, "EXTRACT-RESPONSE= ")
         metadatas = [P.metadata for P in passages]
         # return with metadata so we can use it downstream, e.g. to cite sources
         return [
@@ -338,7 +742,9 @@ class LanguageModel(ABC):
     ) -> List[Document]:
         """
         From each passage, extract verbatim text that is relevant to a question,
-        using concurrent API calls to the LLM.
+        using concurrent API calls to the LLM, bounded by
+        `config.max_concurrent_requests` and the configured rate limits
+        (see `generate_batch`).
         Args:
             question: question to be answered
             passages: list of passages from which to extract relevant verbatim text
@@ -346,7 +752,7 @@ class LanguageModel(ABC):
         Returns:
             list of verbatim extracts from passages that are relevant to question
         """
-        docs = asyncio.run(self._get_verbatim_extracts(question, passages))
+        docs = run_async(self._get_verbatim_extracts(question, passages))
         return docs
 
     def get_summary_answer(self, question: str, passages: List[Document]) -> Document:
@@ -0,0 +1,100 @@
+"""
+Canonical cache keys for LLM API calls.
+
+A key depends only on the args that affect the response (model, messages or
+prompt, functions, sampling params), serialized in a stable order and fed
+incrementally to a fast hash. Transport-level args such as `request_timeout`
+and `stream` are ignored, so e.g. streaming and non-streaming runs share
+cache entries.
+"""
+import hashlib
+import json
+from typing import Any, Dict, List
+
+# args that do not affect the content of the response
+IGNORED_ARGS = {"request_timeout", "timeout", "stream"}
+
+_SEP = b"\x00"
+
+
+def _canonical(value: Any) -> bytes:
+    """Stable serialization of a JSON-like value (dict keys sorted)."""
+    return json.dumps(
+        value, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str
+    ).encode()
+
+
+def function_schema_hash(spec: Dict[str, Any]) -> str:
+    """
+    Hash of a function spec (name, description, parameters schema),
+    independent of the order of its keys.
+    Args:
+        spec: function spec, as sent to the API
+    Returns:
+        str: hex digest
+    """
+    return hashlib.blake2b(_canonical(spec), digest_size=16).hexdigest()
+
+
+def update_message_hash(h: "hashlib._Hash", message: Dict[str, Any]) -> None:
+    """
+    Feed a message (as sent to the API) into a running hash of messages,
+    see `messages_digest`.
+    """
+    # only the fields that are sent to the API, in a fixed order
+    for field in ("role", "name", "content", "function_call"):
+        value = message.get(field)
+        if value is not None:
+            h.update(field.encode() + _SEP)
+            h.update(value.encode() if isinstance(value, str) else _canonical(value))
+            h.update(_SEP)
+    h.update(b"\x01")
+
+
+def new_messages_hash() -> "hashlib._Hash":
+    """An empty running hash of messages, see `update_message_hash`."""
+    return hashlib.blake2b(digest_size=16)
+
+
+def messages_digest(messages: List[Dict[str, Any]]) -> str:
+    """
+    Digest of a list of messages (as sent to the API). It can be computed
+    incrementally, as messages are appended, by keeping the running hash
+    (see `new_messages_hash` and `update_message_hash`).
+    """
+    h = new_messages_hash()
+    for m in messages:
+        update_message_hash(h, m)
+    return h.hexdigest()
+
+
+def cache_key(call_type: str, **kwargs: Any) -> str:
+    """
+    Canonical cache key of an API call.
+    Args:
+        call_type: kind of call, e.g. "ChatCompletion" or "Completion"
+        **kwargs: the args of the API call
+    Returns:
+        str: hex digest
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(call_type.encode() + _SEP)
+    for name in sorted(kwargs):
+        if name in IGNORED_ARGS:
+            continue
+        value = kwargs[name]
+        h.update(name.encode() + _SEP)
+        if name == "messages":
+            # precomputed (see `HashedMessages`), or computed here
+            digest = getattr(value, "digest", None) or messages_digest(value)
+            h.update(digest.encode())
+        elif name == "functions":
+            # independent of the order of the functions, which may come from
+            # a set (e.g. the usable tools of an agent), whose iteration order
+            # varies across processes
+            for digest in sorted(function_schema_hash(spec) for spec in value):
+                h.update(digest.encode() + _SEP)
+        else:
+            h.update(_canonical(value))
+        h.update(_SEP)
+    return h.hexdigest()
@@ -0,0 +1,289 @@
+"""
+Statistics of the response cache of LLMs: lookups, hits and their latency,
+bytes read and written, and the spend saved, per call type
+(e.g. "ChatCompletion", "AsyncChatCompletion").
+
+Each `LanguageModel` has its own `CacheStats` (`LanguageModel.cache_stats`),
+which is also registered process-wide, so that `all_cache_stats` and
+`cache_stats_prometheus` give an aggregate view, by LLM name.
+
+The bytes read and written are those of the (uncompressed) cache records of
+the responses, which are only sized when the counters are read, to keep
+encoding off the lookup and store paths (see `CacheStats.raw`).
+"""
+import threading
+import weakref
+from typing import Any, Dict, Iterable, List, Tuple
+
+from langroid.cachedb.record import encoded_size
+
+# raw counters, per call type
+_COUNTERS = (
+    "lookups",
+    "hits",
+    "misses",
+    "coalesced",
+    "lookup_time",
+    "max_lookup_time",
+    "bytes_read",
+    "bytes_written",
+    "cost_saved",
+)
+
+# name, type and help of the Prometheus metric of each exported counter
+_METRICS: Dict[str, Tuple[str, str, str]] = dict(
+    lookups=("cache_lookups_total", "counter", "Cache lookups."),
+    hits=("cache_hits_total", "counter", "Cache hits."),
+    misses=("cache_misses_total", "counter", "Cache misses."),
+    coalesced=(
+        "cache_coalesced_total",
+        "counter",
+        "Calls that waited for an identical call in flight.",
+    ),
+    lookup_time=(
+        "cache_lookup_seconds_total",
+        "counter",
+        "Total time spent in cache lookups.",
+    ),
+    max_lookup_time=(
+        "cache_lookup_seconds_max",
+        "gauge",
+        "Slowest cache lookup.",
+    ),
+    bytes_read=("cache_read_bytes_total", "counter", "Bytes read from the cache."),
+    bytes_written=(
+        "cache_written_bytes_total",
+        "counter",
+        "Bytes written to the cache.",
+    ),
+    cost_saved=(
+        "cache_saved_dollars_total",
+        "counter",
+        "Estimated API spend saved by the cache.",
+    ),
+    hit_ratio=("cache_hit_ratio", "gauge", "Cache hits per lookup."),
+)
+
+# max responses kept for sizing between two reads of the counters; the size
+# of those beyond is estimated from the mean size of those kept
+MAX_PENDING = 256
+
+
+class CacheStats:
+    """
+    Cache counters of a `LanguageModel`, per call type.
+    """
+
+    def __init__(self, name: str = ""):
+        """
+        Args:
+            name: name of the LLM (e.g. its model), to label its counters with
+                in the process-wide view
+        """
+        self.name = name
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.calls: Dict[str, Dict[str, float]] = {}
+        # responses to size: (call type, counter, response)
+        self.pending: List[Tuple[str, str, Any]] = []
+        # number of responses to size beyond `MAX_PENDING`, by (call type, counter)
+        self.unsized: Dict[Tuple[str, str], int] = {}
+
+    def _counters(self, call_type: str) -> Dict[str, float]:
+        # caller holds the lock
+        counters = self.calls.get(call_type)
+        if counters is None:
+            counters = self.calls[call_type] = dict.fromkeys(_COUNTERS, 0.0)
+        return counters
+
+    def record_lookup(
+        self,
+        call_type: str,
+        hit: bool,
+        latency: float,
+        bytes_read: int = 0,
+        cost_saved: float = 0.0,
+        response: Any = None,
+    ) -> None:
+        """
+        Record a cache lookup.
+        Args:
+            call_type: kind of call, e.g. "ChatCompletion"
+            hit: whether the response was found
+            latency: seconds the lookup took
+            bytes_read: size of the response found
+            cost_saved: estimated cost of the API call saved by a hit
+            response: the response found, to count the size of (lazily)
+                instead of `bytes_read`
+        """
+        with self.lock:
+            counters = self._counters(call_type)
+            counters["lookups"] += 1
+            counters["hits" if hit else "misses"] += 1
+            counters["lookup_time"] += latency
+            counters["max_lookup_time"] = max(counters["max_lookup_time"], latency)
+            counters["bytes_read"] += bytes_read
+            counters["cost_saved"] += cost_saved
+            if response is not None:
+                self._pend(call_type, "bytes_read", response)
+
+    def record_coalesced(self, call_type: str, cost_saved: float = 0.0) -> None:
+        """
+        Record a call that got the response of an identical call in flight
+        (after missing the cache).
+        Args:
+            call_type: kind of call, e.g. "ChatCompletion"
+            cost_saved: estimated cost of the API call saved
+        """
+        with self.lock:
+            counters = self._counters(call_type)
+            counters["coalesced"] += 1
+            counters["cost_saved"] += cost_saved
+
+    def record_store(
+        self, call_type: str, bytes_written: int = 0, response: Any = None
+    ) -> None:
+        """
+        Record a write to the cache.
+        Args:
+            call_type: kind of call, e.g. "ChatCompletion"
+            bytes_written: size of the response written
+            response: the response written, to count the size of (lazily)
+                instead of `bytes_written`
+        """
+        with self.lock:
+            self._counters(call_type)["bytes_written"] += bytes_written
+            if response is not None:
+                self._pend(call_type, "bytes_written", response)
+
+    def _pend(self, call_type: str, counter: str, response: Any) -> None:
+        # caller holds the lock
+        if len(self.pending) < MAX_PENDING:
+            self.pending.append((call_type, counter, response))
+        else:
+            key = (call_type, counter)
+            self.unsized[key] = self.unsized.get(key, 0) + 1
+
+    def _size_pending(self) -> None:
+        """Add the sizes of the pending responses to the byte counters."""
+        with self.lock:
+            pending, self.pending = self.pending, []
+            unsized, self.unsized = self.unsized, {}
+        if not pending:
+            return
+        sizes = [(c, counter, encoded_size(r)) for c, counter, r in pending]
+        mean = sum(size for _, _, size in sizes) / len(sizes)
+        with self.lock:
+            for call_type, counter, size in sizes:
+                self._counters(call_type)[counter] += size
+            for (call_type, counter), n in unsized.items():
+                self._counters(call_type)[counter] += round(n * mean)
+
+    def raw(self) -> Dict[str, Dict[str, float]]:
+        """Copy of the raw counters, per call type."""
+        self._size_pending()
+        with self.lock:
+            return {call_type: dict(c) for call_type, c in self.calls.items()}
+
+    def dict(self) -> Dict[str, Dict[str, float]]:
+        """
+        Counters per call type, and over all of them (under "total"),
+        e.g. for metrics.
+        Returns:
+            dict: for each call type, the raw counters, the hit ratio,
+                and the mean lookup latency
+        """
+        return _summarize([self.raw()])
+
+    def prometheus(self) -> str:
+        """The counters, in the Prometheus text exposition format."""
+        return _prometheus({self.name: self.dict()})
+
+
+def _add(into: Dict[str, float], counters: Dict[str, float]) -> None:
+    for name, value in counters.items():
+        if name == "max_lookup_time":
+            into[name] = max(into[name], value)
+        else:
+            into[name] += value
+
+
+def _summarize(
+    raws: Iterable[Dict[str, Dict[str, float]]]
+) -> Dict[str, Dict[str, float]]:
+    """Merge raw counters, and add the totals and derived stats."""
+    merged: Dict[str, Dict[str, float]] = {}
+    total = dict.fromkeys(_COUNTERS, 0.0)
+    for raw in raws:
+        for call_type, counters in raw.items():
+            _add(merged.setdefault(call_type, dict.fromkeys(_COUNTERS, 0.0)), counters)
+            _add(total, counters)
+    merged["total"] = total
+    for counters in merged.values():
+        lookups = counters["lookups"]
+        counters["hit_ratio"] = counters["hits"] / lookups if lookups else 0.0
+        counters["mean_lookup_time"] = (
+            counters["lookup_time"] / lookups if lookups else 0.0
+        )
+    return merged
+
+
+def _prometheus(stats: Dict[str, Dict[str, Dict[str, float]]]) -> str:
+    """
+    Format counters (by LLM name, then call type) in the Prometheus text
+    exposition format, with the metric names prefixed by "langroid_llm_".
+    """
+    lines: List[str] = []
+    for counter, (metric, kind, help) in _METRICS.items():
+        metric = "langroid_llm_" + metric
+        lines.append(f"# HELP {metric} {help}")
+        lines.append(f"# TYPE {metric} {kind}")
+        for name, by_call_type in sorted(stats.items()):
+            for call_type, counters in sorted(by_call_type.items()):
+                if call_type == "total":
+                    continue
+                labels = f'llm="{_escape(name)}",call_type="{_escape(call_type)}"'
+                lines.append(f"{metric}{{{labels}}} {counters[counter]:g}")
+    return "\n".join(lines) + "\n"
+
+
+def _escape(label: str) -> str:
+    return label.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+_registry: "weakref.WeakSet[CacheStats]" = weakref.WeakSet()
+_registry_lock = threading.Lock()
+
+
+def register_cache_stats(stats: CacheStats) -> None:
+    """
+    Add a `CacheStats` to the process-wide view (it is dropped from it
+    when no longer referenced elsewhere, i.e. when its LLM is gone).
+    """
+    with _registry_lock:
+        _registry.add(stats)
+
+
+def all_cache_stats() -> Dict[str, Dict[str, Dict[str, float]]]:
+    """
+    Cache counters of all LLMs in this process, e.g. for metrics; those of
+    LLMs with the same name are added up.
+    Returns:
+        dict: counters (see `CacheStats.dict`) by LLM name
+    """
+    with _registry_lock:
+        registered = list(_registry)
+    by_name: Dict[str, List[Dict[str, Dict[str, float]]]] = {}
+    for stats in registered:
+        by_name.setdefault(stats.name, []).append(stats.raw())
+    return {name: _summarize(raws) for name, raws in by_name.items()}
+
+
+def cache_stats_prometheus() -> str:
+    """
+    Cache counters of all LLMs in this process, in the Prometheus text
+    exposition format (e.g. to serve at a /metrics endpoint).
+    """
+    return _prometheus(all_cache_stats())
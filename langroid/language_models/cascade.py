@@ -0,0 +1,367 @@
+"""
+Cascade of LLMs: each call goes to a cheap model first, and is escalated to
+the next (more capable, more expensive) model only if the response fails one
+of the escalation checks, e.g. it is a `NO_ANSWER`, a tool message or function
+call that does not parse, or it looks truncated or empty (see `CHECKS`).
+
+Checks are selected by name in `CascadeConfig.checks`; custom ones can be
+added to `CHECKS`, or passed to `CascadeLM`. `CascadeLM.stats` gives the share
+of calls served by each tier, and the latency and cost spent on each.
+
+    CascadeConfig(
+        tiers=[
+            OpenAIGPTConfig(chat_model=OpenAIChatModel.GPT3_5_TURBO),
+            OpenAIGPTConfig(chat_model=OpenAIChatModel.GPT4),
+        ],
+    )
+
+Only the last tier streams its output (if streaming is on), since the
+responses of the others may be discarded; each response records whether it
+was streamed (`LLMResponse.streamed`), so that agents display the others.
+"""
+import json
+import threading
+import time
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Union,
+    cast,
+)
+
+from langroid.language_models.base import (
+    LanguageModel,
+    LLMConfig,
+    LLMFunctionSpec,
+    LLMMessage,
+    LLMResponse,
+    LLMTokenUsage,
+)
+from langroid.parsing.json import extract_top_level_json
+from langroid.utils.constants import NO_ANSWER
+
+
+class CascadeConfig(LLMConfig):
+    type: str = "cascade"
+    # configs of the LLMs to try in turn, cheapest first
+    tiers: List[LLMConfig] = []
+    # names of the escalation checks to apply (see `CHECKS`)
+    checks: List[str] = ["no_answer", "parse_failure", "length"]
+    # with the "length" check: escalate replies shorter than this
+    # (function calls excepted)
+    min_response_chars: int = 1
+
+
+class CascadeRequest:
+    """A call to a cascade, as seen by the escalation checks."""
+
+    def __init__(
+        self,
+        config: CascadeConfig,
+        messages: Union[str, List[LLMMessage]],
+        max_tokens: int,
+        functions: Optional[List[LLMFunctionSpec]] = None,
+        function_call: str | Dict[str, str] = "auto",
+    ):
+        self.config = config
+        self.messages = messages
+        self.max_tokens = max_tokens
+        self.functions = functions
+        self.function_call = function_call
+
+
+# whether a response should be escalated to the next tier
+EscalationCheck = Callable[[CascadeRequest, LLMResponse], bool]
+
+
+def no_answer_check(request: CascadeRequest, response: LLMResponse) -> bool:
+    """The LLM said it does not know."""
+    return response.function_call is None and NO_ANSWER in response.message
+
+
+def parse_failure_check(request: CascadeRequest, response: LLMResponse) -> bool:
+    """
+    The response is an invalid function call (unknown function, or missing
+    when one was required), or a JSON tool message (or function args) that
+    does not parse.
+    """
+    function_call = response.function_call
+    names = {f.name for f in request.functions or []}
+    if function_call is not None:
+        return bool(names) and function_call.name not in names
+    if isinstance(request.function_call, dict):
+        return True
+    text = response.message.strip()
+    if names and text.startswith("{"):
+        # function args that did not parse end up in the message
+        try:
+            json.loads(text)
+        except ValueError:
+            return True
+    if '"request"' in text:
+        return not any('"request"' in j for j in extract_top_level_json(text))
+    return False
+
+
+def length_check(request: CascadeRequest, response: LLMResponse) -> bool:
+    """The response was cut off at `max_tokens`, or is (nearly) empty."""
+    usage = response.usage
+    if usage is not None and 0 < request.max_tokens <= usage.completion_tokens:
+        return True
+    return (
+        response.function_call is None
+        and len(response.message.strip()) < request.config.min_response_chars
+    )
+
+
+CHECKS: Dict[str, EscalationCheck] = dict(
+    no_answer=no_answer_check,
+    parse_failure=parse_failure_check,
+    length=length_check,
+)
+
+
+class CascadeStats:
+    """
+    Counters of a cascade, per tier: calls tried and served, escalations
+    (by check), latency and cost.
+    """
+
+    def __init__(self, tiers: List[str]):
+        """
+        Args:
+            tiers: names of the tiers
+        """
+        self.tiers = tiers
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.calls = 0
+        self.latency = 0.0
+        self.counters: List[Dict[str, float]] = [
+            dict(attempts=0, served=0, latency=0.0, cost=0.0) for _ in self.tiers
+        ]
+        self.escalations: List[Dict[str, int]] = [{} for _ in self.tiers]
+
+    def record_attempt(
+        self, tier: int, latency: float, cost: float, escalation: Optional[str]
+    ) -> None:
+        """
+        Record the call of a tier.
+        Args:
+            tier: index of the tier
+            latency: seconds the call took
+            cost: cost of the call
+            escalation: name of the check that escalated it, if any
+        """
+        with self.lock:
+            counters = self.counters[tier]
+            counters["attempts"] += 1
+            counters["latency"] += latency
+            counters["cost"] += cost
+            if escalation is None:
+                counters["served"] += 1
+            else:
+                by_check = self.escalations[tier]
+                by_check[escalation] = by_check.get(escalation, 0) + 1
+
+    def record_call(self, latency: float) -> None:
+        with self.lock:
+            self.calls += 1
+            self.latency += latency
+
+    def dict(self) -> Dict[str, Any]:
+        """
+        Counters per tier (by name), with the share of calls served, and the
+        mean latency, plus the number and mean latency of calls overall.
+        """
+        with self.lock:
+            tiers: Dict[str, Any] = {}
+            for name, counters, escalations in zip(
+                self.tiers, self.counters, self.escalations
+            ):
+                attempts = counters["attempts"]
+                tiers[name] = dict(
+                    counters,
+                    share=counters["served"] / self.calls if self.calls else 0.0,
+                    mean_latency=counters["latency"] / attempts if attempts else 0.0,
+                    escalations=dict(escalations),
+                )
+            return dict(
+                calls=self.calls,
+                mean_latency=self.latency / self.calls if self.calls else 0.0,
+                cost=sum(c["cost"] for c in self.counters),
+                tiers=tiers,
+            )
+
+
+class CascadeLM(LanguageModel):
+    """
+    LLM that tries a cascade of LLMs, cheapest first, see `CascadeConfig`.
+    """
+
+    def __init__(
+        self,
+        config: CascadeConfig,
+        checks: Optional[Dict[str, EscalationCheck]] = None,
+    ):
+        """
+        Args:
+            config: configuration of the cascade
+            checks: escalation checks, by name, to apply besides those of
+                `config.checks`
+        """
+        if not config.tiers:
+            raise ValueError("A cascade needs at least one tier")
+        self.tiers = [
+            cast(LanguageModel, LanguageModel.create(c)) for c in config.tiers
+        ]
+        final = config.tiers[-1]
+        # prompts are counted and sized for the last tier; see also
+        # `chat_context_length`
+        config.chat_model = config.chat_model or final.chat_model
+        config.completion_model = config.completion_model or final.completion_model
+        super().__init__(config)
+        self.config: CascadeConfig = config
+        self.checks = {name: CHECKS[name] for name in config.checks}
+        self.checks.update(checks or {})
+        for tier in self.tiers[:-1]:
+            tier.set_stream(False)
+        self.stats = CascadeStats(
+            [
+                f"{i}:{getattr(c.chat_model, 'value', c.chat_model)}"
+                for i, c in enumerate(config.tiers)
+            ]
+        )
+
+    def set_stream(self, stream: bool) -> bool:
+        return self.tiers[-1].set_stream(stream)
+
+    def get_stream(self) -> bool:
+        return self.tiers[-1].get_stream()
+
+    def chat_context_length(self) -> int:
+        # a prompt must fit all tiers it may go to
+        return min(tier.chat_context_length() for tier in self.tiers)
+
+    def completion_context_length(self) -> int:
+        return min(tier.completion_context_length() for tier in self.tiers)
+
+    def chat_cost(self) -> Tuple[float, float]:
+        return self.tiers[-1].chat_cost()
+
+    def _escalation(
+        self, request: CascadeRequest, response: LLMResponse
+    ) -> Optional[str]:
+        """Name of the first check that escalates the response, if any."""
+        return next(
+            (name for name, check in self.checks.items() if check(request, response)),
+            None,
+        )
+
+    def _attempt(
+        self, request: CascadeRequest, tier: int, response: LLMResponse, start: float
+    ) -> bool:
+        """Record the response of a tier; whether it is final."""
+        final = tier == len(self.tiers) - 1
+        escalation = None if final else self._escalation(request, response)
+        cost = response.usage.cost if response.usage is not None else 0.0
+        self.stats.record_attempt(tier, time.time() - start, cost, escalation)
+        return escalation is None
+
+    def _combined(self, responses: List[LLMResponse]) -> LLMResponse:
+        """
+        The final response, with the usage of all the tiers tried, and whether
+        it was streamed (only by the last tier, and if not cached).
+        """
+        final = responses[-1]
+        streamed = (
+            len(responses) == len(self.tiers)
+            and self.tiers[-1].get_stream()
+            and not final.cached
+        )
+        usages = [r.usage for r in responses if r.usage is not None]
+        if len(responses) == 1 or not usages:
+            return final.copy(update=dict(streamed=streamed))
+        usage = LLMTokenUsage(
+            prompt_tokens=sum(u.prompt_tokens for u in usages),
+            completion_tokens=sum(u.completion_tokens for u in usages),
+            cost=sum(u.cost for u in usages),
+        )
+        # cached only if no tier cost anything
+        cached = all(r.cached for r in responses)
+        return final.copy(update=dict(usage=usage, cached=cached, streamed=streamed))
+
+    def _run(
+        self,
+        request: CascadeRequest,
+        call: Callable[[LanguageModel], LLMResponse],
+    ) -> LLMResponse:
+        start = time.time()
+        responses: List[LLMResponse] = []
+        for i, tier in enumerate(self.tiers):
+            tier_start = time.time()
+            responses.append(call(tier))
+            if self._attempt(request, i, responses[-1], tier_start):
+                break
+        self.stats.record_call(time.time() - start)
+        return self._combined(responses)
+
+    async def _arun(
+        self,
+        request: CascadeRequest,
+        call: Callable[[LanguageModel], Awaitable[LLMResponse]],
+    ) -> LLMResponse:
+        start = time.time()
+        responses: List[LLMResponse] = []
+        for i, tier in enumerate(self.tiers):
+            tier_start = time.time()
+            responses.append(await call(tier))
+            if self._attempt(request, i, responses[-1], tier_start):
+                break
+        self.stats.record_call(time.time() - start)
+        return self._combined(responses)
+
+    def chat(
+        self,
+        messages: Union[str, List[LLMMessage]],
+        max_tokens: int,
+        functions: Optional[List[LLMFunctionSpec]] = None,
+        function_call: str | Dict[str, str] = "auto",
+    ) -> LLMResponse:
+        request = CascadeRequest(
+            self.config, messages, max_tokens, functions, function_call
+        )
+        return self._run(
+            request,
+            lambda llm: llm.chat(messages, max_tokens, functions, function_call),
+        )
+
+    async def achat(
+        self,
+        messages: Union[str, List[LLMMessage]],
+        max_tokens: int,
+        functions: Optional[List[LLMFunctionSpec]] = None,
+        function_call: str | Dict[str, str] = "auto",
+    ) -> LLMResponse:
+        request = CascadeRequest(
+            self.config, messages, max_tokens, functions, function_call
+        )
+        return await self._arun(
+            request,
+            lambda llm: llm.achat(messages, max_tokens, functions, function_call),
+        )
+
+    def generate(self, prompt: str, max_tokens: int) -> LLMResponse:
+        request = CascadeRequest(self.config, prompt, max_tokens)
+        return self._run(request, lambda llm: llm.generate(prompt, max_tokens))
+
+    async def agenerate(self, prompt: str, max_tokens: int) -> LLMResponse:
+        request = CascadeRequest(self.config, prompt, max_tokens)
+        return await self._arun(request, lambda llm: llm.agenerate(prompt, max_tokens))
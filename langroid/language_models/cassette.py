@@ -0,0 +1,273 @@
+"""
+Record/replay of LLM and embedding API calls, for deterministic offline runs.
+
+In record mode, every API call made by `OpenAIGPT` and `OpenAIEmbeddings`
+(below the cache, so only actual calls) is saved with its response and timing
+to a "cassette": a JSONL file. In replay mode, calls are served from the
+cassette instead of the API, optionally sleeping for the recorded latency
+(or streaming chunks at their recorded offsets), so that e.g. `Task.run` can be
+benchmarked without network access or API spend, and the framework's own
+overhead measured separately from (simulated) API time, see `Cassette.stats`.
+LLMs and embedding models created while replaying need no API key.
+
+Usage:
+
+    with use_cassette("run.jsonl", "record"):
+        task.run()
+    with use_cassette("run.jsonl", "replay", simulate_latency=True) as cassette:
+        task.run()
+    print(cassette.stats())
+"""
+import asyncio
+import json
+import threading
+import time
+from contextlib import contextmanager
+from enum import Enum
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from openai.openai_object import OpenAIObject
+
+from langroid.language_models.cache_key import IGNORED_ARGS, cache_key
+
+
+class CassetteMode(str, Enum):
+    RECORD = "record"
+    REPLAY = "replay"
+
+
+class CassetteMiss(Exception):
+    """No recorded response for a call, in replay mode."""
+
+
+def _plain(value: Any) -> Any:
+    """An API response (OpenAIObject) as plain JSON-able data."""
+    return json.loads(json.dumps(value))
+
+
+class Cassette:
+    """
+    Recorded API calls, keyed by the cache key of each call (plus whether it
+    was streamed). A call made several times with the same args is replayed
+    with its recordings in order (cycling through them).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        mode: CassetteMode = CassetteMode.REPLAY,
+        simulate_latency: bool = False,
+        latency_scale: float = 1.0,
+    ):
+        """
+        Args:
+            path: path of the cassette file (overwritten in record mode)
+            mode: record or replay
+            simulate_latency: in replay mode, sleep for the recorded latency
+            latency_scale: factor applied to recorded latencies
+        """
+        self.path = path
+        self.mode = CassetteMode(mode)
+        self.simulate_latency = simulate_latency
+        self.latency_scale = latency_scale
+        self.lock = threading.Lock()
+        self.entries: Dict[str, List[Dict[str, Any]]] = {}
+        self.replays: Dict[str, int] = {}
+        self.recorded = 0
+        self.replayed = 0
+        self.api_time = 0.0  # seconds of recorded (or simulated) API time
+        if self.mode == CassetteMode.RECORD:
+            open(path, "w").close()
+        else:
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries.setdefault(entry["key"], []).append(entry)
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == CassetteMode.REPLAY
+
+    @staticmethod
+    def key(call_type: str, args: Dict[str, Any]) -> str:
+        """Key of a call: streamed and non-streamed responses differ in form."""
+        stream = "/stream" if args.get("stream") else ""
+        return cache_key(call_type, **args) + stream
+
+    def record(
+        self, call_type: str, args: Dict[str, Any], response: Any, start: float
+    ) -> Any:
+        """
+        Record an API call. A streamed response is recorded as it is consumed.
+        Args:
+            call_type: kind of call, e.g. "ChatCompletion" or "Embedding"
+            args: keyword args of the call
+            response: response of the call
+            start: time the call was sent
+        Returns:
+            the response, or for a streamed response, an event-sequence
+            to consume instead
+        """
+        entry: Dict[str, Any] = dict(
+            key=self.key(call_type, args),
+            call_type=call_type,
+            request={k: v for k, v in args.items() if k not in IGNORED_ARGS},
+        )
+        if not args.get("stream"):
+            entry.update(response=_plain(response), elapsed=time.time() - start)
+            self._write(entry)
+            return response
+        entry["chunks"] = []
+        if hasattr(response, "__aiter__"):
+            return self._record_chunks_async(entry, response, start)
+        return self._record_chunks(entry, response, start)
+
+    def _record_chunks(
+        self, entry: Dict[str, Any], response: Any, start: float
+    ) -> Iterator[Any]:
+        try:
+            for chunk in response:
+                entry["chunks"].append([time.time() - start, _plain(chunk)])
+                yield chunk
+        finally:
+            # also when the consumer stops at the final chunk, before the end
+            self._write(dict(entry, elapsed=time.time() - start))
+
+    async def _record_chunks_async(
+        self, entry: Dict[str, Any], response: Any, start: float
+    ) -> AsyncIterator[Any]:
+        try:
+            async for chunk in response:
+                entry["chunks"].append([time.time() - start, _plain(chunk)])
+                yield chunk
+        finally:
+            self._write(dict(entry, elapsed=time.time() - start))
+
+    def _write(self, entry: Dict[str, Any]) -> None:
+        with self.lock:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+            self.recorded += 1
+            self.api_time += entry["elapsed"]
+
+    def _entry(self, call_type: str, args: Dict[str, Any]) -> Dict[str, Any]:
+        key = self.key(call_type, args)
+        with self.lock:
+            entries = self.entries.get(key)
+            if not entries:
+                raise CassetteMiss(
+                    f"No recorded {call_type} response in {self.path} for: "
+                    f"{json.dumps(args, default=str)[:500]}"
+                )
+            i = self.replays.get(key, 0)
+            self.replays[key] = i + 1
+            entry = entries[i % len(entries)]
+            self.replayed += 1
+            self.api_time += entry["elapsed"] * self.latency_scale
+            return entry
+
+    def replay(self, call_type: str, args: Dict[str, Any]) -> Any:
+        """
+        Replay the recorded response of an API call.
+        Args:
+            call_type: kind of call, e.g. "ChatCompletion" or "Embedding"
+            args: keyword args of the call
+        Returns:
+            the response, or for a streamed call, its event-sequence
+        Raises:
+            CassetteMiss: if there is no recording of the call
+        """
+        entry = self._entry(call_type, args)
+        if "chunks" in entry:
+            return self._replay_chunks(entry)
+        if self.simulate_latency:
+            time.sleep(entry["elapsed"] * self.latency_scale)
+        return OpenAIObject.construct_from(entry["response"])
+
+    async def areplay(self, call_type: str, args: Dict[str, Any]) -> Any:
+        """
+        Async version of `replay`.
+        """
+        entry = self._entry(call_type, args)
+        if "chunks" in entry:
+            return self._areplay_chunks(entry)
+        if self.simulate_latency:
+            await asyncio.sleep(entry["elapsed"] * self.latency_scale)
+        return OpenAIObject.construct_from(entry["response"])
+
+    def _replay_chunks(self, entry: Dict[str, Any]) -> Iterator[Any]:
+        start = time.time()
+        for offset, chunk in entry["chunks"]:
+            if self.simulate_latency:
+                time.sleep(max(0.0, start + offset * self.latency_scale - time.time()))
+            yield OpenAIObject.construct_from(chunk)
+
+    async def _areplay_chunks(self, entry: Dict[str, Any]) -> AsyncIterator[Any]:
+        start = time.time()
+        for offset, chunk in entry["chunks"]:
+            if self.simulate_latency:
+                await asyncio.sleep(
+                    max(0.0, start + offset * self.latency_scale - time.time())
+                )
+            yield OpenAIObject.construct_from(chunk)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Counters of the cassette, e.g. to subtract API time from a benchmark.
+        Returns:
+            dict: calls recorded and replayed, and the total recorded
+                (or, when replaying, simulated) API time in seconds
+        """
+        with self.lock:
+            return dict(
+                recorded=self.recorded,
+                replayed=self.replayed,
+                api_time=self.api_time,
+            )
+
+
+_cassette: Optional[Cassette] = None
+
+
+def active_cassette() -> Optional[Cassette]:
+    """The cassette API calls are recorded to or replayed from, if any."""
+    return _cassette
+
+
+def replaying() -> bool:
+    """
+    Whether API calls are replayed from a cassette, so that no API key is
+    needed (for LLMs and embedding models created in the meantime).
+    """
+    return _cassette is not None and _cassette.replaying
+
+
+def set_cassette(cassette: Optional[Cassette]) -> None:
+    """Set (or with None, unset) the process-wide cassette."""
+    global _cassette
+    _cassette = cassette
+
+
+@contextmanager
+def use_cassette(
+    path: str,
+    mode: str = "replay",
+    simulate_latency: bool = False,
+    latency_scale: float = 1.0,
+) -> Iterator[Cassette]:
+    """
+    Record API calls to, or replay them from, a cassette, within a context.
+    Args:
+        path: path of the cassette file
+        mode: "record" or "replay"
+        simulate_latency: in replay mode, sleep for the recorded latency
+        latency_scale: factor applied to recorded latencies
+    """
+    previous = _cassette
+    cassette = Cassette(path, CassetteMode(mode), simulate_latency, latency_scale)
+    set_cassette(cassette)
+    try:
+        yield cassette
+    finally:
+        set_cassette(previous)
@@ -0,0 +1,183 @@
+"""
+Exact token counts of chat prompts, as billed (and limited) by the API.
+
+Besides the message contents, a chat prompt has per-message framing tokens,
+the role and (optional) name of each message, the name and arguments of
+function_calls, the `functions` schema (which the API renders into the system
+prompt as a TypeScript-like namespace) and the tokens that prime the reply.
+The framing depends on the model family; see `CHAT_FORMATS`.
+"""
+import json
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel
+
+from langroid.language_models.base import LLMFunctionSpec, LLMMessage, Role
+from langroid.parsing.parser import Parser, ParsingConfig
+
+
+class ChatFormat(BaseModel):
+    """Framing tokens of the chat format of a model family."""
+
+    tokens_per_message: int = 3
+    tokens_per_name: int = 1  # in addition to the tokens of the name itself
+    reply_tokens: int = 3  # every reply is primed with <|start|>assistant<|message|>
+
+
+# by model name prefix; the longest matching prefix applies
+CHAT_FORMATS: Dict[str, ChatFormat] = {
+    "gpt-3.5-turbo": ChatFormat(),
+    # the role is dropped when there is a name
+    "gpt-3.5-turbo-0301": ChatFormat(tokens_per_message=4, tokens_per_name=-1),
+    "gpt-4": ChatFormat(),
+}
+
+
+def chat_format(model: str) -> ChatFormat:
+    """
+    Chat format of a model (the latest one, for unknown models).
+    """
+    prefixes = [p for p in CHAT_FORMATS if model.startswith(p)]
+    if not prefixes:
+        return ChatFormat()
+    return CHAT_FORMATS[max(prefixes, key=len)]
+
+
+def _format_type(param: Dict[str, Any], indent: int) -> str:
+    kind = param.get("type")
+    if kind in ("string", "number", "integer"):
+        if "enum" in param:
+            return " | ".join(
+                json.dumps(v) if kind == "string" else str(v) for v in param["enum"]
+            )
+        return "number" if kind == "integer" else str(kind)
+    if kind in ("boolean", "null"):
+        return str(kind)
+    if kind == "object":
+        return "\n".join(["{", _format_properties(param, indent + 2), "}"])
+    if kind == "array":
+        if "items" in param:
+            return _format_type(param["items"], indent) + "[]"
+        return "any[]"
+    return ""
+
+
+def _format_properties(schema: Dict[str, Any], indent: int) -> str:
+    lines = []
+    required = schema.get("required", [])
+    for name, param in schema.get("properties", {}).items():
+        if param.get("description") and indent < 2:
+            lines.append(f"// {param['description']}")
+        optional = "" if name in required else "?"
+        lines.append(f"{name}{optional}: {_format_type(param, indent)},")
+    return "\n".join(" " * indent + line for line in lines)
+
+
+def format_functions(functions: List[LLMFunctionSpec]) -> str:
+    """
+    The `functions` schema, as rendered by the API into the prompt.
+    """
+    lines = ["namespace functions {", ""]
+    for f in functions:
+        if f.description:
+            lines.append(f"// {f.description}")
+        if f.parameters.get("properties"):
+            lines.append(f"type {f.name} = (_: {{")
+            lines.append(_format_properties(f.parameters, 0))
+            lines.append("}) => any;")
+        else:
+            lines.append(f"type {f.name} = () => any;")
+        lines.append("")
+    lines.append("} // namespace functions")
+    return "\n".join(lines)
+
+
+class ChatTokenEstimator:
+    """
+    Counts the tokens of chat prompts for a model, see `prompt_tokens`.
+    Message contents are counted once, and the count cached on the message
+    (see `TokenCounted`).
+    """
+
+    def __init__(self, model: str):
+        """
+        Args:
+            model: name of the chat model
+        """
+        self.format = chat_format(model)
+        try:
+            self.parser = Parser(ParsingConfig(token_encoding_model=model))
+        except KeyError:
+            # unknown to tiktoken: use the encoding of the current chat models
+            self.parser = Parser(ParsingConfig())
+
+    def text_tokens(self, text: str) -> int:
+        return self.parser.num_tokens(text)
+
+    def message_tokens(self, message: LLMMessage) -> int:
+        """
+        Tokens of a message, including its framing, role, name, and
+        function_call.
+        """
+        fmt = self.format
+        tokens = fmt.tokens_per_message + self.text_tokens(message.role.value)
+        tokens += message.num_tokens(self.parser)
+        if message.name:
+            tokens += self.text_tokens(message.name) + fmt.tokens_per_name
+        if message.role == Role.FUNCTION:
+            tokens -= 2
+        if message.function_call is not None:
+            tokens += self.text_tokens(message.function_call.name) + 3
+            if message.function_call.arguments is not None:
+                # sent JSON-encoded, see `LLMMessage.api_dict`
+                tokens += self.text_tokens(json.dumps(message.function_call.arguments))
+        return tokens
+
+    def functions_tokens(self, functions: List[LLMFunctionSpec]) -> int:
+        """Tokens of the `functions` schema."""
+        return self.text_tokens(format_functions(functions)) + 9
+
+    def overhead_tokens(
+        self,
+        messages: List[LLMMessage],
+        functions: Optional[List[LLMFunctionSpec]] = None,
+        function_call: str | Dict[str, str] = "auto",
+    ) -> int:
+        """
+        Tokens of a prompt besides those of its messages (see `message_tokens`):
+        the reply priming, and the `functions` schema and `function_call` args.
+        """
+        tokens = self.format.reply_tokens
+        if functions:
+            tokens += self.functions_tokens(functions)
+            system = next((m for m in messages if m.role == Role.SYSTEM), None)
+            if system is not None:
+                # the schema joins the first system message, after a newline,
+                # rather than being framed as a message of its own; the newline
+                # may merge with the end of the message (only that is re-counted)
+                tail = system.content[-16:]
+                tokens += self.text_tokens(tail + "\n") - self.text_tokens(tail) - 4
+        if isinstance(function_call, dict):
+            tokens += self.text_tokens(function_call["name"]) + 4
+        elif function_call == "none" and functions:
+            tokens += 1
+        return tokens
+
+    def prompt_tokens(
+        self,
+        messages: List[LLMMessage],
+        functions: Optional[List[LLMFunctionSpec]] = None,
+        function_call: str | Dict[str, str] = "auto",
+    ) -> int:
+        """
+        Tokens of a chat prompt, as counted by the API.
+        Args:
+            messages: messages of the prompt
+            functions: functions available to the LLM
+            function_call: how the LLM should use `functions`
+        Returns:
+            int: number of prompt tokens
+        """
+        return sum(self.message_tokens(m) for m in messages) + self.overhead_tokens(
+            messages, functions, function_call
+        )
@@ -0,0 +1,275 @@
+"""
+Load balancing of LLM API calls over a pool of endpoints: several API keys,
+Azure resources (regions) or deployments, each with its own weight and
+client-side rate limits.
+
+Each call goes to the healthy endpoint with the fewest outstanding requests
+relative to its weight (ties go to the one that has served the least, by
+weight, so idle traffic is split by weight). An endpoint failing
+`eject_after` times in a row is ejected for `eject_seconds` (doubling, up to
+`max_eject_seconds`, if it fails again right after). Once the ejection ends,
+it takes traffic again, and a single failure ejects it again. A call failing
+on an endpoint (with a transient or endpoint-specific error) fails over right
+away to another endpoint not yet tried by that call.
+
+The state of an endpoint (outstanding requests, health) is shared
+process-wide by all LLMs using it, like its rate limiter (see
+`get_rate_limiter`).
+
+Enable it with `OpenAIGPTConfig.endpoint_pool`, or via
+`LanguageModel.create(config, endpoints=[EndpointConfig(...), ...])`.
+"""
+import asyncio
+import hashlib
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, TypeVar
+
+import aiohttp
+import openai
+import requests
+from pydantic import BaseSettings
+
+from langroid.language_models.rate_limiter import RateLimiter, get_rate_limiter
+
+T = TypeVar("T")
+
+# errors after which a call fails over to another endpoint; others
+# (e.g. an invalid request) are the request's fault, not the endpoint's
+FAILOVER_ERRORS = (
+    requests.exceptions.RequestException,
+    openai.error.Timeout,
+    openai.error.RateLimitError,
+    openai.error.APIError,
+    openai.error.APIConnectionError,
+    openai.error.ServiceUnavailableError,
+    openai.error.TryAgain,
+    openai.error.AuthenticationError,
+    openai.error.PermissionError,
+    aiohttp.ClientError,
+    asyncio.TimeoutError,
+)
+
+
+class EndpointConfig(BaseSettings):
+    """
+    An endpoint of a pool. Fields left unset are those of the LLM (e.g. its
+    API key, or the global `openai` settings).
+    """
+
+    name: str = ""  # label in stats and logs; default: derived from the fields
+    api_key: str = ""
+    api_base: Optional[str] = None
+    api_type: Optional[str] = None  # e.g. "azure"
+    api_version: Optional[str] = None
+    organization: Optional[str] = None
+    # Azure deployment: sent as the `engine` of the call, instead of the model
+    deployment_name: Optional[str] = None
+    weight: float = 1.0
+    # client-side rate limits of this endpoint; None = unlimited
+    requests_per_minute: Optional[int] = None
+    tokens_per_minute: Optional[int] = None
+
+    def key(self) -> str:
+        """Identity of the endpoint (without its API key in clear)."""
+        if self.name:
+            return self.name
+        key_hash = hashlib.blake2b(self.api_key.encode(), digest_size=4).hexdigest()
+        return f"{self.api_base or 'default'}/{self.deployment_name or ''}#{key_hash}"
+
+
+class EndpointPoolConfig(BaseSettings):
+    endpoints: List[EndpointConfig] = []
+    # consecutive failures after which an endpoint is ejected
+    eject_after: int = 3
+    # seconds an endpoint stays ejected (doubling on repeated ejections)
+    eject_seconds: float = 30.0
+    max_eject_seconds: float = 300.0
+
+
+class EndpointState:
+    """Load and health of an endpoint, shared process-wide."""
+
+    def __init__(self) -> None:
+        self.outstanding = 0
+        self.served = 0
+        self.errors = 0
+        self.failures = 0  # consecutive
+        self.ejections = 0  # consecutive
+        self.ejected_until = 0.0
+
+
+_states: Dict[str, EndpointState] = {}
+# guards the states of all endpoints, which are read and updated together
+_states_lock = threading.Lock()
+
+
+def endpoint_stats() -> Dict[str, Dict[str, float]]:
+    """State of all endpoints in this process, by name, e.g. for metrics."""
+    now = time.monotonic()
+    with _states_lock:
+        return {
+            name: dict(
+                outstanding=s.outstanding,
+                served=s.served,
+                errors=s.errors,
+                ejections=s.ejections,
+                healthy=float(now >= s.ejected_until),
+            )
+            for name, s in _states.items()
+        }
+
+
+class Endpoint:
+    """An endpoint of a pool: its config, rate limiter and (shared) state."""
+
+    def __init__(self, config: EndpointConfig):
+        self.config = config
+        self.name = config.key()
+        self.limiter: RateLimiter = get_rate_limiter(
+            "endpoint:" + self.name,
+            requests_per_minute=config.requests_per_minute,
+            tokens_per_minute=config.tokens_per_minute,
+        )
+        with _states_lock:
+            self.state = _states.setdefault(self.name, EndpointState())
+
+    def request_args(
+        self, args: Dict[str, Any], default_api_key: str = ""
+    ) -> Dict[str, Any]:
+        """
+        The args of an API call, sent to this endpoint.
+        Args:
+            args: keyword args of the API call
+            default_api_key: API key to use if the endpoint has none
+        Returns:
+            the args, with the credentials (and deployment) of the endpoint
+        """
+        c = self.config
+        args = dict(args, api_key=c.api_key or default_api_key)
+        for name in ("api_base", "api_type", "api_version", "organization"):
+            value = getattr(c, name)
+            if value is not None:
+                args[name] = value
+        if c.deployment_name is not None:
+            args.pop("model", None)
+            args["engine"] = c.deployment_name
+        return args
+
+
+class EndpointPool:
+    """
+    Routes API calls over endpoints, see `call` and `acall`.
+    """
+
+    def __init__(self, config: EndpointPoolConfig):
+        if not config.endpoints:
+            raise ValueError("An endpoint pool needs at least one endpoint")
+        self.config = config
+        self.endpoints = [Endpoint(e) for e in config.endpoints]
+        if len({e.name for e in self.endpoints}) < len(self.endpoints):
+            raise ValueError("The endpoints of a pool must have distinct names")
+
+    def _pick(self, tried: Set[str]) -> Optional[Endpoint]:
+        """
+        Pick the endpoint for a request (and count it as outstanding there):
+        the least loaded healthy one not yet tried; if none is healthy, the
+        one whose ejection ends first. None if all were tried.
+        """
+        now = time.monotonic()
+        with _states_lock:
+            candidates = [e for e in self.endpoints if e.name not in tried]
+            if not candidates:
+                return None
+            healthy = [e for e in candidates if now >= e.state.ejected_until]
+            if healthy:
+                endpoint = min(
+                    healthy,
+                    key=lambda e: (
+                        e.state.outstanding / e.config.weight,
+                        e.state.served / e.config.weight,
+                    ),
+                )
+            else:
+                endpoint = min(candidates, key=lambda e: e.state.ejected_until)
+            endpoint.state.outstanding += 1
+            return endpoint
+
+    def _release(self, endpoint: Endpoint, failed: Optional[bool]) -> None:
+        """
+        Count a request to `endpoint` as done: failed (because of the endpoint)
+        or not; None = neither (e.g. an invalid request), health unchanged.
+        """
+        state = endpoint.state
+        with _states_lock:
+            state.outstanding -= 1
+            state.served += 1
+            if failed is None:
+                return
+            if not failed:
+                state.failures = state.ejections = 0
+                return
+            state.errors += 1
+            state.failures += 1
+            if state.failures >= self.config.eject_after:
+                state.ejections += 1
+                state.ejected_until = time.monotonic() + min(
+                    self.config.max_eject_seconds,
+                    self.config.eject_seconds * 2 ** (state.ejections - 1),
+                )
+                # after the ejection, a single failure ejects it again
+                state.failures = self.config.eject_after - 1
+
+    def call(self, fn: Callable[[Endpoint], T], tokens: int = 0) -> T:
+        """
+        Make a call on an endpoint, failing over to others on errors
+        specific to the endpoint (see `FAILOVER_ERRORS`).
+        Args:
+            fn: makes the call on the given endpoint
+            tokens: estimated tokens of the call, for the rate limits
+        Returns:
+            the result of the first endpoint to succeed
+        Raises:
+            the error of the last endpoint tried, if all fail
+        """
+        tried: Set[str] = set()
+        while True:
+            endpoint = self._pick(tried)
+            assert endpoint is not None
+            tried.add(endpoint.name)
+            try:
+                with endpoint.limiter.limit(tokens):
+                    result = fn(endpoint)
+            except FAILOVER_ERRORS:
+                self._release(endpoint, True)
+                if len(tried) == len(self.endpoints):
+                    raise
+                continue
+            except BaseException:
+                self._release(endpoint, None)
+                raise
+            self._release(endpoint, False)
+            return result
+
+    async def acall(self, fn: Callable[[Endpoint], Awaitable[T]], tokens: int = 0) -> T:
+        """
+        Async version of `call`.
+        """
+        tried: Set[str] = set()
+        while True:
+            endpoint = self._pick(tried)
+            assert endpoint is not None
+            tried.add(endpoint.name)
+            try:
+                async with endpoint.limiter.alimit(tokens):
+                    result = await fn(endpoint)
+            except FAILOVER_ERRORS:
+                self._release(endpoint, True)
+                if len(tried) == len(self.endpoints):
+                    raise
+                continue
+            except BaseException:
+                self._release(endpoint, None)
+                raise
+            self._release(endpoint, False)
+            return result
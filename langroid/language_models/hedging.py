@@ -0,0 +1,318 @@
+"""
+Hedged API calls, to cut tail latency: when a call has not returned within a
+percentile of the recent latencies of the LLM, a duplicate ("hedge") is sent,
+the first response is used and the other call is cancelled.
+
+Hedges cost extra requests, so they are capped, process-wide, at a fraction of
+all requests (see `HedgeBudget`), and none are sent until enough latencies
+have been seen. `HedgeStats` reports how often calls were hedged and won by the
+hedge, and the latency percentiles with and without hedging (for calls won by
+the hedge, the latency the original call would have had is estimated as the
+mean of the recent latencies above the time it had run).
+
+Enable it with `OpenAIGPTConfig.hedging = HedgingConfig(...)`; streamed calls
+are never hedged.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, TypeVar
+
+from pydantic import BaseSettings
+
+T = TypeVar("T")
+
+
+class HedgingConfig(BaseSettings):
+    # hedge a call once it has taken longer than this percentile of the
+    # recent latencies (of single attempts)
+    percentile: float = 95.0
+    # number of recent latencies kept, and needed before hedging starts
+    window: int = 500
+    min_samples: int = 20
+    # never hedge earlier than this, in seconds
+    min_delay: float = 0.0
+    # process-wide cap on hedges, as a fraction of requests (each request
+    # earns this fraction of a hedge), with bursts of up to `burst` hedges
+    max_extra_ratio: float = 0.05
+    burst: float = 10.0
+
+
+def percentile(values: List[float], p: float) -> float:
+    """The p-th percentile (nearest rank) of values (0 if there are none)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+class HedgeBudget:
+    """
+    Allowance of extra requests: each request earns a fraction of a hedge,
+    up to a burst; each hedge spends one.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.tokens = 0.0
+
+    def earn(self, ratio: float, burst: float) -> None:
+        with self.lock:
+            self.tokens = min(burst, self.tokens + ratio)
+
+    def spend(self) -> bool:
+        """Take one hedge from the allowance, if available."""
+        with self.lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+_budget = HedgeBudget()
+
+
+def hedge_budget() -> HedgeBudget:
+    """The process-wide allowance of hedges, shared by all LLMs."""
+    return _budget
+
+
+class LatencyTracker:
+    """Latencies of the most recent (successful) attempts."""
+
+    def __init__(self, window: int):
+        self.lock = threading.Lock()
+        self.latencies: Deque[float] = deque(maxlen=window)
+
+    def add(self, latency: float) -> None:
+        with self.lock:
+            self.latencies.append(latency)
+
+    def values(self) -> List[float]:
+        with self.lock:
+            return list(self.latencies)
+
+    def tail_mean(self, above: float) -> float:
+        """Mean of the latencies above `above` (or `above`, if there are none)."""
+        tail = [x for x in self.values() if x > above]
+        return sum(tail) / len(tail) if tail else above
+
+
+class HedgeStats:
+    """
+    Counters of hedged calls, and the latencies of recent calls with and
+    without (estimated) hedging.
+    """
+
+    def __init__(self, window: int = 1000):
+        self.lock = threading.Lock()
+        self.window = window
+        self.reset()
+
+    def reset(self) -> None:
+        self.calls = 0
+        self.hedged = 0  # calls for which a hedge was sent
+        self.hedge_wins = 0  # ... and answered by the hedge
+        self.denied = 0  # calls that were due a hedge, but over the budget
+        self.saved = 0.0  # total (estimated) seconds saved
+        self.latencies: Deque[float] = deque(maxlen=self.window)
+        self.unhedged: Deque[float] = deque(maxlen=self.window)
+
+    def record(
+        self,
+        latency: float,
+        unhedged: float,
+        hedged: bool = False,
+        won: bool = False,
+        denied: bool = False,
+    ) -> None:
+        """
+        Record a call.
+        Args:
+            latency: seconds the call took
+            unhedged: (estimated) seconds it would have taken without hedging
+            hedged: whether a hedge was sent
+            won: whether the hedge answered first
+            denied: whether a hedge was due, but not allowed by the budget
+        """
+        with self.lock:
+            self.calls += 1
+            self.hedged += hedged
+            self.hedge_wins += won
+            self.denied += denied
+            self.saved += max(0.0, unhedged - latency)
+            self.latencies.append(latency)
+            self.unhedged.append(unhedged)
+
+    def dict(self) -> Dict[str, float]:
+        """
+        Counters, and percentiles of the latencies of recent calls (p50, p95,
+        p99), with hedging and (estimated) without it.
+        """
+        with self.lock:
+            stats: Dict[str, float] = dict(
+                calls=self.calls,
+                hedged=self.hedged,
+                hedge_wins=self.hedge_wins,
+                denied=self.denied,
+                extra_ratio=self.hedged / self.calls if self.calls else 0.0,
+                saved_seconds=self.saved,
+            )
+            latencies, unhedged = list(self.latencies), list(self.unhedged)
+        for p in (50, 95, 99):
+            stats[f"p{p}"] = percentile(latencies, p)
+            stats[f"p{p}_unhedged"] = percentile(unhedged, p)
+        return stats
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _hedge_executor() -> ThreadPoolExecutor:
+    """Threads running the attempts of sync hedged calls."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=64, thread_name_prefix="langroid-hedge"
+            )
+        return _executor
+
+
+class Hedger:
+    """
+    Makes hedged calls (see `call` and `acall`), tracking the latencies
+    they are hedged by.
+    """
+
+    def __init__(self, config: HedgingConfig, budget: Optional[HedgeBudget] = None):
+        """
+        Args:
+            config: hedging settings
+            budget: allowance of hedges; default: the process-wide one
+        """
+        self.config = config
+        self.budget = budget or hedge_budget()
+        self.tracker = LatencyTracker(config.window)
+        self.stats = HedgeStats()
+
+    def delay(self) -> Optional[float]:
+        """Seconds after which to hedge a call; None = not (yet) hedging."""
+        latencies = self.tracker.values()
+        if len(latencies) < self.config.min_samples:
+            return None
+        return max(self.config.min_delay, percentile(latencies, self.config.percentile))
+
+    def _timed(self, fn: Callable[[], T]) -> T:
+        start = time.time()
+        result = fn()
+        self.tracker.add(time.time() - start)
+        return result
+
+    async def _atimed(self, fn: Callable[[], Awaitable[T]]) -> T:
+        start = time.time()
+        result = await fn()
+        self.tracker.add(time.time() - start)
+        return result
+
+    def _record(
+        self,
+        start: float,
+        hedged: bool = False,
+        won: bool = False,
+        denied: bool = False,
+    ) -> None:
+        latency = time.time() - start
+        unhedged = self.tracker.tail_mean(latency) if won else latency
+        self.stats.record(latency, unhedged, hedged, won, denied)
+
+    def call(self, fn: Callable[[], T]) -> T:
+        """
+        Call `fn`, hedged: if it has not returned after `delay` seconds, call
+        it again (in parallel), and return the first result. (The slower call
+        is abandoned: a sync call in progress cannot be interrupted.)
+        Args:
+            fn: the call to make, e.g. an API call with retries
+        Returns:
+            the result of the first call to succeed
+        Raises:
+            the error of the first call, if all calls fail
+        """
+        self.budget.earn(self.config.max_extra_ratio, self.config.burst)
+        start = time.time()
+        delay = self.delay()
+        if delay is None:
+            result = self._timed(fn)
+            self._record(start)
+            return result
+        executor = _hedge_executor()
+
+        def attempt() -> T:
+            return self._timed(fn)
+
+        primary = executor.submit(attempt)
+        attempts: List["Future[T]"] = [primary]
+        hedged = denied = False
+        if not wait(attempts, timeout=delay).done:
+            if self.budget.spend():
+                attempts.append(executor.submit(attempt))
+                hedged = True
+            else:
+                denied = True
+        pending = set(attempts)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = next((f for f in done if f.exception() is None), None)
+            if winner is not None:
+                for f in pending:
+                    f.cancel()
+                self._record(start, hedged, winner is not primary, denied)
+                return winner.result()
+            error = error or next(iter(done)).exception()
+        assert error is not None
+        raise error
+
+    async def acall(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Async version of `call`; the slower call is cancelled.
+        """
+        self.budget.earn(self.config.max_extra_ratio, self.config.burst)
+        start = time.time()
+        delay = self.delay()
+        if delay is None:
+            result = await self._atimed(fn)
+            self._record(start)
+            return result
+        primary = asyncio.ensure_future(self._atimed(fn))
+        attempts: List["asyncio.Future[T]"] = [primary]
+        hedged = denied = False
+        pending: Any = set(attempts)
+        try:
+            done, _ = await asyncio.wait(attempts, timeout=delay)
+            if not done:
+                if self.budget.spend():
+                    attempts.append(asyncio.ensure_future(self._atimed(fn)))
+                    hedged = True
+                else:
+                    denied = True
+            pending = set(attempts)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                winner = next((t for t in done if t.exception() is None), None)
+                if winner is not None:
+                    self._record(start, hedged, winner is not primary, denied)
+                    return winner.result()
+                error = error or next(iter(done)).exception()
+            assert error is not None
+            raise error
+        finally:
+            for t in pending:
+                t.cancel()
@@ -0,0 +1,332 @@
+"""
+Local mock LLM, for load tests and profiling of the agent stack: no API key,
+no network. Responses are scripted (optionally selected by a regex on the last
+message, and templated with it), and may be function_calls or JSON tool
+messages; their latency and token usage are drawn from configurable
+distributions, and they can be streamed.
+
+Select it with `LLMConfig.type = "mock"`, e.g.:
+
+    MockLMConfig(
+        responses=[
+            MockResponse(match="square", content='{"request": "square", "x": 3}'),
+            MockResponse(content="You said: $message"),
+        ],
+        latency=Distribution(kind="lognormal", mean=0.5, std=0.2),
+    )
+"""
+import asyncio
+import json
+import math
+import random
+import re
+import threading
+import time
+from string import Template
+from typing import (
+    AsyncIterator,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from pydantic import BaseModel
+
+from langroid.language_models.base import (
+    LanguageModel,
+    LLMConfig,
+    LLMFunctionCall,
+    LLMFunctionSpec,
+    LLMMessage,
+    LLMResponse,
+    LLMStreamEvent,
+    LLMTokenUsage,
+    StreamEventType,
+    print_stream_event,
+)
+
+
+class Distribution(BaseModel):
+    """
+    Distribution of a non-negative quantity, e.g. a latency in seconds:
+    "fixed" (always `mean`), "uniform" (between `low` and `high`),
+    "normal" or "lognormal" (with the given `mean` and `std`).
+    """
+
+    kind: str = "fixed"
+    mean: float = 0.0
+    std: float = 0.0
+    low: float = 0.0
+    high: float = 0.0
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "uniform":
+            value = rng.uniform(self.low, self.high)
+        elif self.kind == "normal":
+            value = rng.gauss(self.mean, self.std)
+        elif self.kind == "lognormal":
+            if self.mean <= 0:
+                return 0.0
+            # parameters of the underlying normal, for the given mean and std
+            sigma2 = math.log(1 + (self.std / self.mean) ** 2)
+            mu = math.log(self.mean) - sigma2 / 2
+            value = rng.lognormvariate(mu, math.sqrt(sigma2))
+        elif self.kind == "fixed":
+            value = self.mean
+        else:
+            raise ValueError(f"Unknown distribution kind: {self.kind}")
+        return max(0.0, value)
+
+
+class MockResponse(BaseModel):
+    """
+    A scripted response. Its `content` (and the string values of its
+    function_call arguments) are templates, where `$message` is replaced by
+    the last message sent, and `$n` by the number of the call.
+    """
+
+    # regex searched for in the last message; None = matches any
+    match: Optional[str] = None
+    content: str = ""
+    function_call: Optional[LLMFunctionCall] = None
+
+
+class MockLMConfig(LLMConfig):
+    type: str = "mock"
+    chat_model: str = "mock"
+    completion_model: str = "mock"
+    context_length: Dict[str, int] = {"mock": 8192}
+    cost_per_1k_tokens: Dict[str, Tuple[float, float]] = {"mock": (0.0, 0.0)}
+    # the first response whose `match` is found in the last message is used;
+    # else those without a `match`, in turn (by call number)
+    responses: List[Union[MockResponse, str]] = [MockResponse(content="$message")]
+    # seconds until the response (or, when streaming, its first token)
+    latency: Distribution = Distribution()
+    # streaming speed (0 = all at once)
+    tokens_per_second: float = 0.0
+    # token usage reported; None = count the tokens of prompt and response
+    prompt_tokens: Optional[Distribution] = None
+    completion_tokens: Optional[Distribution] = None
+    seed: Optional[int] = None
+
+
+class MockLM(LanguageModel):
+    """
+    Mock LLM, with scripted responses, see `MockLMConfig`.
+    """
+
+    def __init__(self, config: Optional[MockLMConfig] = None):
+        # a fresh config by default, since e.g. `set_stream` changes it
+        config = config or MockLMConfig()
+        super().__init__(config)
+        self.config: MockLMConfig = config
+        self.responses = [
+            r if isinstance(r, MockResponse) else MockResponse(content=r)
+            for r in config.responses
+        ]
+        self.patterns = [
+            re.compile(r.match) if r.match is not None else None for r in self.responses
+        ]
+        self.defaults = [r for r in self.responses if r.match is None]
+        self.rng = random.Random(config.seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def set_stream(self, stream: bool) -> bool:
+        tmp = self.config.stream
+        self.config.stream = stream
+        return tmp
+
+    def get_stream(self) -> bool:
+        return self.config.stream
+
+    def _respond(
+        self,
+        messages: Union[str, List[LLMMessage]],
+        functions: Optional[List[LLMFunctionSpec]] = None,
+        fun_call: str | Dict[str, str] = "auto",
+    ) -> Tuple[LLMResponse, float]:
+        """
+        Pick (and fill in) the response to `messages`.
+        Args:
+            messages: prompt string, or list of messages
+            functions: functions available to the LLM (counted as prompt tokens)
+            fun_call: how the LLM should use `functions`
+        Returns:
+            the response, with usage, and its latency in seconds
+        """
+        last = messages if isinstance(messages, str) else messages[-1].content
+        with self.lock:
+            self.calls += 1
+            n = self.calls
+            latency = self.config.latency.sample(self.rng)
+            prompt_dist, completion_dist = (
+                self.config.prompt_tokens,
+                self.config.completion_tokens,
+            )
+            prompt_sample = prompt_dist.sample(self.rng) if prompt_dist else None
+            completion_sample = (
+                completion_dist.sample(self.rng) if completion_dist else None
+            )
+        scripted = next(
+            (
+                r
+                for r, p in zip(self.responses, self.patterns)
+                if p is not None and p.search(last)
+            ),
+            None,
+        )
+        if scripted is None:
+            if not self.defaults:
+                raise ValueError(f"No mock response matches: {last[:200]}")
+            scripted = self.defaults[(n - 1) % len(self.defaults)]
+        values = dict(message=last, n=str(n))
+        function_call = None
+        if scripted.function_call is not None:
+            arguments = scripted.function_call.arguments
+            function_call = scripted.function_call.copy(
+                update=dict(
+                    arguments=None
+                    if arguments is None
+                    else {
+                        k: Template(v).safe_substitute(values)
+                        if isinstance(v, str)
+                        else v
+                        for k, v in arguments.items()
+                    }
+                )
+            )
+        content = Template(scripted.content).safe_substitute(values)
+
+        if prompt_sample is not None:
+            prompt_tokens = int(prompt_sample)
+        else:
+            prompt_tokens = self.estimate_tokens(messages, 0, functions, fun_call)
+        if completion_sample is not None:
+            completion_tokens = int(completion_sample)
+        else:
+            completion_tokens = self.num_tokens(
+                content
+                if function_call is None
+                else json.dumps(function_call.arguments)
+            )
+        prompt_cost, completion_cost = self.chat_cost()
+        usage = LLMTokenUsage(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cost=(prompt_cost * prompt_tokens + completion_cost * completion_tokens)
+            / 1000,
+        )
+        response = LLMResponse(
+            message=content, function_call=function_call, usage=usage
+        )
+        return response, latency
+
+    def _stream_pieces(self, response: LLMResponse) -> List[LLMStreamEvent]:
+        """The delta events of a response, without timings."""
+        if response.function_call is not None:
+            events = [
+                LLMStreamEvent(
+                    type=StreamEventType.FUNCTION_NAME,
+                    delta=response.function_call.name,
+                )
+            ]
+            if response.function_call.arguments is not None:
+                args = json.dumps(response.function_call.arguments)
+                events += [
+                    LLMStreamEvent(type=StreamEventType.FUNCTION_ARGS, delta=piece)
+                    for piece in re.findall(r"\S+\s*", args)
+                ]
+            return events
+        return [
+            LLMStreamEvent(type=StreamEventType.TEXT, delta=piece)
+            for piece in re.findall(r"\s*\S+\s*", response.message)
+        ]
+
+    def _delay(self, i: int, latency: float) -> float:
+        """Seconds after the request when the i-th delta of a stream is sent."""
+        if self.config.tokens_per_second <= 0:
+            return latency
+        return latency + i / self.config.tokens_per_second
+
+    def chat_stream(
+        self,
+        messages: Union[str, List[LLMMessage]],
+        max_tokens: int,
+        functions: Optional[List[LLMFunctionSpec]] = None,
+        function_call: str | Dict[str, str] = "auto",
+    ) -> Iterator[LLMStreamEvent]:
+        start = time.time()
+        response, latency = self._respond(messages, functions, function_call)
+        for i, event in enumerate(self._stream_pieces(response)):
+            time.sleep(max(0.0, start + self._delay(i, latency) - time.time()))
+            event.elapsed = time.time() - start
+            yield event
+        time.sleep(max(0.0, start + latency - time.time()))
+        yield LLMStreamEvent(
+            type=StreamEventType.FINAL,
+            elapsed=time.time() - start,
+            response=response,
+            time_to_first_token=latency,
+        )
+
+    async def achat_stream(
+        self,
+        messages: Union[str, List[LLMMessage]],
+        max_tokens: int,
+        functions: Optional[List[LLMFunctionSpec]] = None,
+        function_call: str | Dict[str, str] = "auto",
+    ) -> AsyncIterator[LLMStreamEvent]:
+        start = time.time()
+        response, latency = self._respond(messages, functions, function_call)
+        for i, event in enumerate(self._stream_pieces(response)):
+            await asyncio.sleep(max(0.0, start + self._delay(i, latency) - time.time()))
+            event.elapsed = time.time() - start
+            yield event
+        await asyncio.sleep(max(0.0, start + latency - time.time()))
+        yield LLMStreamEvent(
+            type=StreamEventType.FINAL,
+            elapsed=time.time() - start,
+            response=response,
+            time_to_first_token=latency,
+        )
+
+    def chat(
+        self,
+        messages: Union[str, List[LLMMessage]],
+        max_tokens: int,
+        functions: Optional[List[LLMFunctionSpec]] = None,
+        function_call: str | Dict[str, str] = "auto",
+    ) -> LLMResponse:
+        if self.get_stream():
+            final = None
+            for event in self.chat_stream(
+                messages, max_tokens, functions, function_call
+            ):
+                print_stream_event(event)
+                final = event.response
+            assert final is not None
+            return final
+        response, latency = self._respond(messages, functions, function_call)
+        time.sleep(latency)
+        return response
+
+    async def achat(
+        self,
+        messages: Union[str, List[LLMMessage]],
+        max_tokens: int,
+        functions: Optional[List[LLMFunctionSpec]] = None,
+        function_call: str | Dict[str, str] = "auto",
+    ) -> LLMResponse:
+        response, latency = self._respond(messages, functions, function_call)
+        await asyncio.sleep(latency)
+        return response
+
+    def generate(self, prompt: str, max_tokens: int) -> LLMResponse:
+        return self.chat(prompt, max_tokens)
+
+    async def agenerate(self, prompt: str, max_tokens: int) -> LLMResponse:
+        return await self.achat(prompt, max_tokens)
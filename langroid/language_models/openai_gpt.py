@@ -1,18 +1,33 @@
-import ast
-import hashlib
+import asyncio
 import logging
 import os
-import sys
+import time
 from enum import Enum
-from typing import Any, Dict, List, Optional, Tuple, Union
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
 
 import openai
 from dotenv import load_dotenv
 from pydantic import BaseModel
 from rich import print
 
+from langroid.cachedb.base import CacheDB
+from langroid.cachedb.lru_cachedb import LRUCache
 from langroid.cachedb.momento_cachedb import MomentoCache, MomentoCacheConfig
 from langroid.cachedb.redis_cachedb import RedisCache, RedisCacheConfig
+from langroid.cachedb.sqlite_cachedb import SQLiteCache, SQLiteCacheConfig
+from langroid.cachedb.tiered_cachedb import TieredCache
 from langroid.language_models.base import (
     LanguageModel,
     LLMConfig,
@@ -20,15 +35,35 @@ from langroid.language_models.base import (
     LLMFunctionSpec,
     LLMMessage,
     LLMResponse,
+    LLMStreamEvent,
     LLMTokenUsage,
     Role,
+    StreamEventType,
+    print_stream_event,
+    response_stream_events,
+)
+from langroid.language_models.cache_key import cache_key
+from langroid.language_models.cassette import active_cassette, replaying
+from langroid.language_models.endpoint_pool import (
+    Endpoint,
+    EndpointPool,
+    EndpointPoolConfig,
 )
+from langroid.language_models.hedging import Hedger, HedgingConfig
+from langroid.language_models.prompt_prefix import HashedMessages
+from langroid.language_models.semantic_cache import SemanticCache, SemanticCacheConfig
+from langroid.language_models.single_flight import SingleFlight, single_flight
 from langroid.language_models.utils import (
-    async_retry_with_exponential_backoff,
+    aiohttp_session,
     retry_with_exponential_backoff,
 )
+from langroid.parsing.streaming_json import (
+    StreamingJSONParser,
+    parse_json_args,
+    pydantic_field_validator,
+)
 from langroid.utils.configuration import settings
-from langroid.utils.constants import NO_ANSWER, Colors
+from langroid.utils.constants import NO_ANSWER
 
 logging.getLogger("openai").setLevel(logging.ERROR)
 
@@ -69,6 +104,13 @@ class OpenAIGPTConfig(LLMConfig):
         OpenAIChatModel.GPT4: (0.03, 0.06),  # 8K context
         OpenAIChatModel.GPT4_NOFUNC: (0.03, 0.06),
     }
+    # reuse cached responses of paraphrased chat requests; None = disabled
+    semantic_cache_config: Optional[SemanticCacheConfig] = None
+    # hedge slow non-streamed calls with a duplicate request; None = disabled
+    hedging: Optional[HedgingConfig] = None
+    # spread calls over several endpoints (API keys, Azure deployments...),
+    # each with its own rate limits; None = the global `openai` settings
+    endpoint_pool: Optional[EndpointPoolConfig] = None
 
 
 class OpenAIResponse(BaseModel):
@@ -78,6 +120,111 @@ class OpenAIResponse(BaseModel):
     usage: Dict  # type: ignore
 
 
+class _StreamState:
+    """
+    State of a streaming API response: accumulates the completion and
+    function_call parts of the response, and converts each API event into
+    typed stream events.
+    """
+
+    def __init__(
+        self,
+        chat: bool = False,
+        start: Optional[float] = None,
+        functions: Optional[List[LLMFunctionSpec]] = None,
+    ):
+        """
+        Args:
+            chat: whether in chat-mode (or else completion-mode)
+            start: time the request was sent (default: now)
+            functions: functions available to the LLM, whose args are
+                validated (against their `_args_model`) as they stream in
+        """
+        self.chat = chat
+        self.functions = {f.name: f for f in functions or []}
+        # parses the function args as they stream in
+        self.args_parser = StreamingJSONParser()
+        self.start = time.time() if start is None else start
+        self.time_to_first_token: Optional[float] = None
+        self.has_function = False
+        self.completion = ""
+        self.function_args = ""
+        self.function_name = ""
+        # counted as the deltas arrive: the API streams one token per event
+        self.completion_tokens = 0
+
+    def process(self, event) -> Tuple[bool, List[LLMStreamEvent]]:  # type: ignore
+        """
+        Process a single event from the streaming API response, accumulating
+        the completion and function-call parts.
+        Args:
+            event: event from the streaming API response
+        Returns:
+            Tuple consisting of:
+                whether the stream is done,
+                the stream events for the new parts of the response
+        """
+        event_args = ""
+        event_fn_name = ""
+        if self.chat:
+            delta = event["choices"][0]["delta"]
+            if "function_call" in delta:
+                if "name" in delta.function_call:
+                    event_fn_name = delta.function_call["name"]
+                if "arguments" in delta.function_call:
+                    event_args = delta.function_call["arguments"]
+            event_text = delta.get("content", "")
+        else:
+            event_text = event["choices"][0]["text"]
+
+        elapsed = time.time() - self.start
+        events = []
+        if event_text or event_args:
+            self.completion_tokens += 1
+        if event_text:
+            self.completion += event_text
+            events.append(
+                LLMStreamEvent(
+                    type=StreamEventType.TEXT, delta=event_text, elapsed=elapsed
+                )
+            )
+        if event_fn_name:
+            self.function_name = event_fn_name
+            self.has_function = True
+            spec = self.functions.get(event_fn_name)
+            if spec is not None and spec._args_model is not None:
+                self.args_parser.validate = pydantic_field_validator(spec._args_model)
+            events.append(
+                LLMStreamEvent(
+                    type=StreamEventType.FUNCTION_NAME,
+                    delta=event_fn_name,
+                    elapsed=elapsed,
+                )
+            )
+        if event_args:
+            self.function_args += event_args
+            for name in self.args_parser.feed(event_args):
+                if name in self.args_parser.errors:
+                    logging.warning(
+                        f"Invalid arg {name} of function {self.function_name}: "
+                        f"{self.args_parser.errors[name]}"
+                    )
+            events.append(
+                LLMStreamEvent(
+                    type=StreamEventType.FUNCTION_ARGS,
+                    delta=event_args,
+                    elapsed=elapsed,
+                )
+            )
+        if events and self.time_to_first_token is None:
+            self.time_to_first_token = elapsed
+        # for function_call, finish_reason does not necessarily
+        # contain "function_call" as mentioned in the docs.
+        # So we check for "stop" or "function_call" here.
+        event_done = event.choices[0].finish_reason in ["stop", "function_call"]
+        return event_done, events
+
+
 # Define a class for OpenAI GPT-3 that extends the base class
 class OpenAIGPT(LanguageModel):
     """
@@ -94,19 +241,53 @@ class OpenAIGPT(LanguageModel):
             self.chat_model = OpenAIChatModel.GPT4_NOFUNC
         load_dotenv()
         self.api_key = os.getenv("OPENAI_API_KEY", "")
-        if self.api_key == "":
+        pool = config.endpoint_pool
+        if (
+            self.api_key == ""
+            and not replaying()
+            and not (
+                pool is not None
+                and pool.endpoints
+                and all(e.api_key for e in pool.endpoints)
+            )
+        ):
             raise ValueError(
                 """
                 OPENAI_API_KEY not set in .env file,
                 please set it to your OpenAI API key."""
             )
-        self.cache: MomentoCache | RedisCache
+        self.cache: CacheDB
         if settings.cache_type == "momento":
-            config.cache_config = MomentoCacheConfig()
+            if not isinstance(config.cache_config, MomentoCacheConfig):
+                config.cache_config = MomentoCacheConfig()
             self.cache = MomentoCache(config.cache_config)
+        elif settings.cache_type == "sqlite":
+            if not isinstance(config.cache_config, SQLiteCacheConfig):
+                config.cache_config = SQLiteCacheConfig()
+            self.cache = SQLiteCache(config.cache_config)
         else:
-            config.cache_config = RedisCacheConfig()
+            if not isinstance(config.cache_config, RedisCacheConfig):
+                config.cache_config = RedisCacheConfig()
+            if not config.cache_config.namespace:
+                # so that the responses of each model can be cleared apart
+                model = config.chat_model
+                config.cache_config = config.cache_config.copy(
+                    update=dict(namespace=str(getattr(model, "value", model)))
+                )
             self.cache = RedisCache(config.cache_config)
+        if config.memory_cache_config is not None:
+            self.cache = TieredCache(
+                LRUCache.shared(config.memory_cache_config), self.cache
+            )
+        self.semantic_cache: Optional[SemanticCache] = None
+        if config.semantic_cache_config is not None:
+            self.semantic_cache = SemanticCache(config.semantic_cache_config)
+        self.hedger: Optional[Hedger] = None
+        if config.hedging is not None:
+            self.hedger = Hedger(config.hedging)
+        self.endpoint_pool: Optional[EndpointPool] = None
+        if config.endpoint_pool is not None:
+            self.endpoint_pool = EndpointPool(config.endpoint_pool)
 
     def set_stream(self, stream: bool) -> bool:
         """Enable or disable streaming output from API.
@@ -122,69 +303,173 @@ class OpenAIGPT(LanguageModel):
         """Get streaming status"""
         return self.config.stream
 
-    def _stream_response(  # type: ignore
-        self, response, chat: bool = False
-    ) -> Tuple[LLMResponse, OpenAIResponse]:
+    def _stream_events(  # type: ignore
+        self,
+        response,
+        chat: bool = False,
+        hashed_key: Optional[str] = None,
+        prompt_tokens: int = 0,
+        start: Optional[float] = None,
+        functions: Optional[List[LLMFunctionSpec]] = None,
+    ) -> Iterator[LLMStreamEvent]:
         """
-        Grab and print streaming response from API.
+        Convert the streaming response from the API into stream events, yielding
+        each delta as it arrives. When the stream ends, the assembled response
+        is cached (under `hashed_key`, if given), and yielded in the final event.
         Args:
             response: event-sequence emitted by API
             chat: whether in chat-mode (or else completion-mode)
-        Returns:
-            Tuple consisting of:
-                LLMResponse object (with message, usage),
-                OpenAIResponse object (with choices, usage)
-
+            hashed_key: cache key of the request
+            prompt_tokens: number of tokens in the prompt, for the usage
+            start: time the request was sent (default: now)
+            functions: functions available to the LLM in the request
         """
-        completion = ""
-        function_args = ""
-        function_name = ""
-
-        sys.stdout.write(Colors().GREEN)
-        sys.stdout.flush()
-        has_function = False
+        stream = _StreamState(chat=chat, start=start, functions=functions)
         for event in response:
-            event_args = ""
-            event_fn_name = ""
-            if chat:
-                delta = event["choices"][0]["delta"]
-                if "function_call" in delta:
-                    if "name" in delta.function_call:
-                        event_fn_name = delta.function_call["name"]
-                    if "arguments" in delta.function_call:
-                        event_args = delta.function_call["arguments"]
-                event_text = delta.get("content", "")
-            else:
-                event_text = event["choices"][0]["text"]
-            if event_text:
-                completion += event_text
-                sys.stdout.write(Colors().GREEN + event_text)
-                sys.stdout.flush()
-            if event_fn_name:
-                function_name = event_fn_name
-                has_function = True
-                sys.stdout.write(Colors().GREEN + "FUNC: " + event_fn_name + ": ")
-                sys.stdout.flush()
-            if event_args:
-                function_args += event_args
-                sys.stdout.write(Colors().GREEN + event_args)
-                sys.stdout.flush()
-            if event.choices[0].finish_reason in ["stop", "function_call"]:
-                # for function_call, finish_reason does not necessarily
-                # contain "function_call" as mentioned in the docs.
-                # So we check for "stop" or "function_call" here.
+            event_done, deltas = stream.process(event)
+            yield from deltas
+            if event_done:
+                break
+        yield self._finish_stream(stream, hashed_key, prompt_tokens)
+
+    async def _stream_events_async(  # type: ignore
+        self,
+        response,
+        chat: bool = False,
+        hashed_key: Optional[str] = None,
+        prompt_tokens: int = 0,
+        start: Optional[float] = None,
+        functions: Optional[List[LLMFunctionSpec]] = None,
+    ) -> AsyncIterator[LLMStreamEvent]:
+        """
+        Async version of `_stream_events`, consuming the async event-sequence
+        emitted by the API.
+        """
+        stream = _StreamState(chat=chat, start=start, functions=functions)
+        async for event in response:
+            event_done, deltas = stream.process(event)
+            for delta in deltas:
+                yield delta
+            if event_done:
                 break
+        yield self._finish_stream(stream, hashed_key, prompt_tokens, is_async=True)
+
+    def _finish_stream(
+        self,
+        stream: "_StreamState",
+        hashed_key: Optional[str],
+        prompt_tokens: int,
+        is_async: bool = False,
+    ) -> LLMStreamEvent:
+        """
+        Assemble the final event of a stream, and cache the response.
+        """
+        llm_response, openai_response = self._create_stream_response(
+            chat=stream.chat,
+            has_function=stream.has_function,
+            completion=stream.completion,
+            function_args=stream.function_args,
+            function_name=stream.function_name,
+            args_parser=stream.args_parser,
+        )
+        completion_tokens = stream.completion_tokens
+        if stream.function_name:
+            # the name arrives whole, in one event
+            completion_tokens += self.num_tokens(stream.function_name)
+        llm_response.usage = LLMTokenUsage(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cost=self._cost_chat_model(prompt_tokens, completion_tokens),
+        )
+        if hashed_key is not None:
+            # so that hits on it count the spend they save
+            openai_response["usage"] = dict(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens,
+            )
+            fn_name = "ChatCompletion" if stream.chat else "Completion"
+            self._cache_store(
+                ("Async" if is_async else "") + fn_name, hashed_key, openai_response
+            )
+        return LLMStreamEvent(
+            type=StreamEventType.FINAL,
+            elapsed=time.time() - stream.start,
+            response=llm_response,
+            time_to_first_token=stream.time_to_first_token,
+        )
 
-        print("")
-        # TODO- get usage info in stream mode (?)
+    def _stream_response(  # type: ignore
+        self,
+        response,
+        chat: bool = False,
+        hashed_key: Optional[str] = None,
+        prompt_tokens: int = 0,
+        start: Optional[float] = None,
+        functions: Optional[List[LLMFunctionSpec]] = None,
+    ) -> LLMResponse:
+        """
+        Grab and print streaming response from API, i.e. consume the
+        events of `_stream_events` (see there for params), printing them.
+        Returns:
+            LLMResponse object (with message, usage)
+        """
+        final = None
+        for event in self._stream_events(
+            response, chat, hashed_key, prompt_tokens, start, functions
+        ):
+            print_stream_event(event)
+            final = event.response
+        assert final is not None
+        return final
+
+    async def _stream_response_async(  # type: ignore
+        self,
+        response,
+        chat: bool = False,
+        hashed_key: Optional[str] = None,
+        prompt_tokens: int = 0,
+        start: Optional[float] = None,
+        functions: Optional[List[LLMFunctionSpec]] = None,
+    ) -> LLMResponse:
+        """
+        Async version of `_stream_response`.
+        """
+        final = None
+        async for event in self._stream_events_async(
+            response, chat, hashed_key, prompt_tokens, start, functions
+        ):
+            print_stream_event(event)
+            final = event.response
+        assert final is not None
+        return final
+
+    def _create_stream_response(
+        self,
+        chat: bool = False,
+        has_function: bool = False,
+        completion: str = "",
+        function_args: str = "",
+        function_name: str = "",
+        args_parser: Optional[StreamingJSONParser] = None,
+    ) -> Tuple[LLMResponse, Dict[str, Any]]:
+        """
+        Assemble the accumulated streaming output into an LLMResponse, and a
+        mock OpenAI response (so it can be cached).
+        `args_parser`, if given, has been fed the `function_args` as they
+        streamed in, so only what remains of them is parsed here.
+        """
 
         # check if function_call args are valid, if not,
         # treat this as a normal msg, not a function call
         args = {}
         if has_function and function_args != "":
+            if args_parser is None:
+                args_parser = StreamingJSONParser()
+                args_parser.feed(function_args)
             try:
-                args = ast.literal_eval(function_args.strip())
-            except (SyntaxError, ValueError):
+                args = args_parser.close()
+            except ValueError:
                 logging.warning(
                     f"Parsing OpenAI function args failed: {function_args};"
                     " treating args as normal message"
@@ -212,7 +497,7 @@ class OpenAIGPT(LanguageModel):
             choices=[msg],
             usage=dict(total_tokens=0),
         )
-        return (  # type: ignore
+        return (
             LLMResponse(
                 message=completion,
                 cached=False,
@@ -222,12 +507,8 @@ class OpenAIGPT(LanguageModel):
         )
 
     def _cache_lookup(self, fn_name: str, **kwargs: Dict[str, Any]) -> Tuple[str, Any]:
-        # Use the kwargs as the cache key
-        sorted_kwargs_str = str(sorted(kwargs.items()))
-        raw_key = f"{fn_name}:{sorted_kwargs_str}"
-
-        # Hash the key to a fixed length using SHA256
-        hashed_key = hashlib.sha256(raw_key.encode()).hexdigest()
+        # Use the (semantically relevant) kwargs as the cache key
+        hashed_key = cache_key(fn_name, **kwargs)
 
         if not settings.cache:
             # when caching disabled, return the hashed_key and none result
@@ -240,18 +521,21 @@ class OpenAIGPT(LanguageModel):
         return (price[0] * prompt + price[1] * completion) / 1000
 
     def _get_non_stream_token_usage(
-        self, cached: bool, response: Dict[str, Any]
+        self, cached: bool, response: Dict[str, Any], streamed: bool = False
     ) -> LLMTokenUsage:
         """
-        Extracts token usage from ``response`` and computes cost, only when NOT
-        in streaming mode, since the LLM API (OpenAI currently) does not populate the
-        usage fields in streaming mode. In streaming mode, these are set to zero for
-        now, and will be updated later by the fn ``update_token_usage``.
+        Extracts token usage from ``response`` and computes cost, only when the
+        response was NOT streamed, since the LLM API (OpenAI currently) does not
+        populate the usage fields in streaming mode. For streamed responses, these
+        are set to zero for now, and will be updated later by the fn
+        ``update_token_usage``.
+        Note that whether a response was streamed is a property of its request,
+        not of ``config.stream``: e.g. batched calls are never streamed.
         """
         cost = 0.0
         prompt_tokens = 0
         completion_tokens = 0
-        if not cached and not self.config.stream:
+        if not cached and not streamed:
             prompt_tokens = response["usage"]["prompt_tokens"]
             completion_tokens = response["usage"]["completion_tokens"]
             cost = self._cost_chat_model(
@@ -276,42 +560,25 @@ class OpenAIGPT(LanguageModel):
         if self.config.use_chat_for_completion:
             return self.chat(messages=prompt, max_tokens=max_tokens)
         openai.api_key = self.api_key
-
         if settings.debug:
             print(f"[red]PROMPT: {prompt}[/red]")
 
-        @retry_with_exponential_backoff
-        def completions_with_backoff(**kwargs):  # type: ignore
-            cached = False
-            hashed_key, result = self._cache_lookup("Completion", **kwargs)
-            if result is not None:
-                cached = True
-                if settings.debug:
-                    print("[red]CACHED[/red]")
-            else:
-                # If it's not in the cache, call the API
-                result = openai.Completion.create(**kwargs)  # type: ignore
-                if self.config.stream:
-                    llm_response, openai_response = self._stream_response(result)
-                    self.cache.store(hashed_key, openai_response)
-                    return cached, hashed_key, openai_response
-                else:
-                    self.cache.store(hashed_key, result)
-            return cached, hashed_key, result
-
-        key_name = "engine" if self.config.type == "azure" else "model"
-        cached, hashed_key, response = completions_with_backoff(
-            **{key_name: self.config.completion_model},
-            prompt=prompt,
-            max_tokens=max_tokens,  # for output/completion
-            request_timeout=self.config.timeout,
-            temperature=self.config.temperature,
-            echo=False,
-            stream=self.config.stream,
+        args = self._prep_completion(prompt, max_tokens)
+        prompt_tokens = self.estimate_tokens(prompt, 0)
+        start = time.time()
+        cached, coalesced, hashed_key, response = self._request(
+            "Completion", args, prompt_tokens + max_tokens
         )
-
-        msg = response["choices"][0]["text"].strip()
-        return LLMResponse(message=msg, cached=cached)
+        if self.config.stream and not cached:
+            llm_response = self._stream_response(
+                response,
+                hashed_key=hashed_key,
+                prompt_tokens=prompt_tokens,
+                start=start,
+            )
+            llm_response.message = llm_response.message.strip()
+            return llm_response
+        return self._process_completion_response(cached, response, coalesced)
 
     async def agenerate(self, prompt: str, max_tokens: int) -> LLMResponse:
         try:
@@ -329,61 +596,491 @@ class OpenAIGPT(LanguageModel):
         # The calling fn should use the context `with Streaming(..., False)` to
         # disable streaming.
         if self.config.use_chat_for_completion:
-            messages = [
-                LLMMessage(role=Role.SYSTEM, content="You are a helpful assistant."),
-                LLMMessage(role=Role.USER, content=prompt),
-            ]
+            return await self._achat(prompt, max_tokens)
+        args = self._prep_completion(prompt, max_tokens)
+        prompt_tokens = self.estimate_tokens(prompt, 0)
+        start = time.time()
+        cached, coalesced, hashed_key, response = await self._arequest(
+            "Completion", args, prompt_tokens + max_tokens
+        )
+        if self.config.stream and not cached:
+            llm_response = await self._stream_response_async(
+                response,
+                hashed_key=hashed_key,
+                prompt_tokens=prompt_tokens,
+                start=start,
+            )
+            llm_response.message = llm_response.message.strip()
+            return llm_response
+        return self._process_completion_response(cached, response, coalesced)
 
-            @async_retry_with_exponential_backoff
-            async def completions_with_backoff(
-                **kwargs: Dict[str, Any]
-            ) -> Tuple[bool, str, Any]:
-                cached = False
-                hashed_key, result = self._cache_lookup("AsyncChatCompletion", **kwargs)
-                if result is not None:
-                    cached = True
-                else:
-                    # If it's not in the cache, call the API
-                    result = await openai.ChatCompletion.acreate(  # type: ignore
-                        **kwargs
-                    )
-                    self.cache.store(hashed_key, result)
-                return cached, hashed_key, result
-
-            cached, hashed_key, response = await completions_with_backoff(
-                model=self.config.chat_model,
-                messages=[m.api_dict() for m in messages],
-                max_tokens=max_tokens,
-                request_timeout=self.config.timeout,
-                temperature=self.config.temperature,
-                stream=self.config.stream,
+    def _prep_completion(self, prompt: str, max_tokens: int) -> Dict[str, Any]:
+        """
+        Prepare the args for a Completion API call (sync or async).
+        Args:
+            prompt: prompt to complete
+            max_tokens: max output tokens to generate
+        Returns:
+            Dict of keyword args for the API call
+        """
+        key_name = "engine" if self.config.type == "azure" else "model"
+        return dict(
+            **{key_name: self.config.completion_model},
+            prompt=prompt,
+            max_tokens=max_tokens,  # for output/completion
+            request_timeout=self.config.timeout,
+            temperature=self.config.temperature,
+            echo=False,
+            stream=self.config.stream,
+        )
+
+    def _process_completion_response(
+        self, cached: bool, response: Dict[str, Any], coalesced: bool = False
+    ) -> LLMResponse:
+        """
+        Convert a (non-streamed) Completion API response to an LLMResponse.
+        Args:
+            cached: whether the response was retrieved from cache
+            response: API response (or cached version of it)
+            coalesced: whether the response is from an identical call in flight
+        Returns:
+            LLMResponse object
+        """
+        msg = response["choices"][0]["text"].strip()
+        return LLMResponse(message=msg, cached=cached, coalesced=coalesced)
+
+    def _request(
+        self, fn_name: str, args: Dict[str, Any], est_tokens: int
+    ) -> Tuple[bool, bool, str, Any]:
+        """
+        Look up an API call in the cache, or else make the call (see `_api_call`),
+        and cache its response.
+        Args:
+            fn_name: API to call: "ChatCompletion" or "Completion"
+            args: keyword args of the API call
+            est_tokens: estimated tokens (prompt + completion) of the call
+        Returns:
+            Tuple consisting of:
+                whether the response is from the cache (or from an identical
+                    call in flight, so it cost nothing),
+                whether the response is from an identical call in flight,
+                the cache key of the call,
+                the API response (or cached version of it); when streaming,
+                    this is the (not yet consumed) event-sequence, which the
+                    caller caches once consumed
+        """
+        start = time.time()
+        hashed_key, result = self._cache_lookup(fn_name, **args)
+        semantic_cache = self._semantic_cache(fn_name, result)
+        if semantic_cache is not None:
+            result = self._semantic_lookup(semantic_cache, args, hashed_key, fn_name)
+            if result is not None and self._sample_hit(semantic_cache, args):
+                # the API is called anyway, so this counts as a miss
+                self._record_lookup(fn_name, None, start)
+                fresh = self._api_call(fn_name, args, est_tokens)
+                semantic_cache.check(result, fresh)
+                self._cache_store(fn_name, hashed_key, fresh)
+                return False, False, hashed_key, fresh
+        self._record_lookup(fn_name, result, start)
+        if result is not None:
+            if settings.debug:
+                print("[red]CACHED[/red]")
+            return True, False, hashed_key, result
+
+        def call() -> Any:
+            result = self._api_call(fn_name, args, est_tokens)
+            if not args["stream"]:
+                self._cache_store(fn_name, hashed_key, result)
+            return result
+
+        flight = self._single_flight()
+        if flight is None:
+            result = call()
+        elif args["stream"]:
+            # a stream cannot be shared, but can wait for a non-streamed call
+            future = flight.follow(hashed_key)
+            if future is not None:
+                result = future.result()
+                self.cache_stats.record_coalesced(fn_name, self._response_cost(result))
+                return True, True, hashed_key, result
+            result = call()
+        else:
+            result, coalesced = flight.do(hashed_key, call)
+            if coalesced:
+                self.cache_stats.record_coalesced(fn_name, self._response_cost(result))
+                return True, True, hashed_key, result
+        if semantic_cache is not None:
+            semantic_cache.add(args, hashed_key)
+        return False, False, hashed_key, result
+
+    async def _arequest(
+        self, fn_name: str, args: Dict[str, Any], est_tokens: int
+    ) -> Tuple[bool, bool, str, Any]:
+        """
+        Async version of `_request`.
+        """
+        call_type = "Async" + fn_name
+        start = time.time()
+        hashed_key, result = self._cache_lookup(fn_name, **args)
+        semantic_cache = self._semantic_cache(fn_name, result)
+        if semantic_cache is not None:
+            # embedding models are sync, so keep them off the event loop
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(
+                None,
+                self._semantic_lookup,
+                semantic_cache,
+                args,
+                hashed_key,
+                call_type,
             )
-            msg = response["choices"][0]["message"]["content"].strip()
+            if result is not None and self._sample_hit(semantic_cache, args):
+                self._record_lookup(call_type, None, start)
+                fresh = await self._aapi_call(fn_name, args, est_tokens)
+                await loop.run_in_executor(None, semantic_cache.check, result, fresh)
+                self._cache_store(call_type, hashed_key, fresh)
+                return False, False, hashed_key, fresh
+        self._record_lookup(call_type, result, start)
+        if result is not None:
+            if settings.debug:
+                print("[red]CACHED[/red]")
+            return True, False, hashed_key, result
+
+        async def call() -> Any:
+            result = await self._aapi_call(fn_name, args, est_tokens)
+            if not args["stream"]:
+                self._cache_store(call_type, hashed_key, result)
+            return result
+
+        flight = self._single_flight()
+        if flight is None:
+            result = await call()
+        elif args["stream"]:
+            # a stream cannot be shared, but can wait for a non-streamed call
+            future = flight.follow(hashed_key)
+            if future is not None:
+                result = await asyncio.wrap_future(future)
+                self.cache_stats.record_coalesced(
+                    call_type, self._response_cost(result)
+                )
+                return True, True, hashed_key, result
+            result = await call()
         else:
+            result, coalesced = await flight.ado(hashed_key, call)
+            if coalesced:
+                self.cache_stats.record_coalesced(
+                    call_type, self._response_cost(result)
+                )
+                return True, True, hashed_key, result
+        if semantic_cache is not None:
+            await asyncio.get_running_loop().run_in_executor(
+                None, semantic_cache.add, args, hashed_key
+            )
+        return False, False, hashed_key, result
 
-            @retry_with_exponential_backoff
-            async def completions_with_backoff(**kwargs):  # type: ignore
-                cached = False
-                hashed_key, result = self._cache_lookup("AsyncCompletion", **kwargs)
-                if result is not None:
-                    cached = True
-                else:
-                    # If it's not in the cache, call the API
-                    result = await openai.Completion.acreate(**kwargs)  # type: ignore
-                    self.cache.store(hashed_key, result)
-                return cached, hashed_key, result
-
-            cached, hashed_key, response = await completions_with_backoff(
-                model=self.config.completion_model,
-                prompt=prompt,
-                max_tokens=max_tokens,
-                request_timeout=self.config.timeout,
-                temperature=self.config.temperature,
-                echo=False,
-                stream=self.config.stream,
+    def _single_flight(self) -> Optional[SingleFlight]:
+        """
+        The registry of in-flight calls, if identical calls should be coalesced:
+        only when caching is on, since otherwise each call should get
+        its own response.
+        """
+        if not settings.cache or not self.config.coalesce_requests:
+            return None
+        return single_flight()
+
+    def _cache_store(self, call_type: str, key: str, value: Any) -> None:
+        """Cache an API response, counting the bytes written."""
+        self.cache.store(key, value)
+        self.cache_stats.record_store(call_type, response=value)
+
+    def _record_lookup(self, call_type: str, result: Any, start: float) -> None:
+        """
+        Count a cache lookup (if caching is on) that started at `start`,
+        and found `result` (None if it missed).
+        """
+        if not settings.cache:
+            return
+        if result is None:
+            self.cache_stats.record_lookup(call_type, False, time.time() - start)
+            return
+        self.cache_stats.record_lookup(
+            call_type,
+            True,
+            time.time() - start,
+            cost_saved=self._response_cost(result),
+            response=result,
+        )
+
+    def _response_cost(self, response: Dict[str, Any]) -> float:
+        """Estimated cost of an API response, from its usage (0 if unknown)."""
+        usage = response.get("usage") or {}
+        try:
+            return self._cost_chat_model(
+                usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
             )
-            msg = response["choices"][0]["text"].strip()
-        return LLMResponse(message=msg, cached=cached)
+        except (KeyError, ValueError):
+            return 0.0
+
+    def _semantic_cache(self, fn_name: str, result: Any) -> Optional[SemanticCache]:
+        """
+        The semantic cache, if it should be used for a call, i.e. if it is
+        enabled, the call is a chat, and it missed the exact-key cache.
+        """
+        if self.semantic_cache is None or not settings.cache:
+            return None
+        if fn_name != "ChatCompletion" or result is not None:
+            return None
+        return self.semantic_cache
+
+    def _semantic_lookup(
+        self,
+        semantic_cache: SemanticCache,
+        args: Dict[str, Any],
+        hashed_key: str,
+        call_type: str,
+    ) -> Any:
+        """
+        Look up the response of a semantically equivalent past call; a response
+        found is also cached under the exact key of this call.
+        """
+        key = semantic_cache.lookup(args)
+        result = None if key is None else self.cache.retrieve(key)
+        if result is not None:
+            self._cache_store(call_type, hashed_key, result)
+        return result
+
+    @staticmethod
+    def _sample_hit(semantic_cache: SemanticCache, args: Dict[str, Any]) -> bool:
+        """Whether to check a semantic hit against a fresh API response."""
+        # a streamed response cannot be compared before it is consumed
+        return not args["stream"] and semantic_cache.should_sample()
+
+    def _api_call(self, fn_name: str, args: Dict[str, Any], est_tokens: int) -> Any:
+        """
+        Call the OpenAI API (with retries, within the rate limits of the model),
+        on the endpoints of the pool if any (see `EndpointPool`, which then
+        applies the rate limits of each endpoint), hedged if enabled
+        (see `Hedger`).
+        Args:
+            fn_name: API to call: "ChatCompletion" or "Completion"
+            args: keyword args of the API call
+            est_tokens: estimated tokens (prompt + completion) of the call
+        Returns:
+            the API response
+        """
+        cassette = active_cassette()
+        if cassette is not None and cassette.replaying:
+            return cassette.replay(fn_name, args)
+        api = getattr(openai, fn_name)
+        limiter = self.rate_limiter(
+            self.config.chat_model
+            if fn_name == "ChatCompletion"
+            else self.config.completion_model
+        )
+
+        pool = self.endpoint_pool
+
+        @retry_with_exponential_backoff
+        def completions_with_backoff(**kwargs: Any) -> Any:
+            start = time.time()
+            if pool is not None:
+
+                def create(endpoint: Endpoint) -> Any:
+                    nonlocal start
+                    start = time.time()
+                    return api.create(**endpoint.request_args(kwargs, self.api_key))
+
+                result = pool.call(create, est_tokens)
+            else:
+                with limiter.limit(est_tokens):
+                    start = time.time()
+                    result = api.create(**kwargs)
+            if cassette is not None:
+                result = cassette.record(fn_name, kwargs, result, start)
+            return result
+
+        if self.hedger is not None and not args["stream"]:
+            return self.hedger.call(lambda: completions_with_backoff(**args))
+        return completions_with_backoff(**args)
+
+    async def _aapi_call(
+        self, fn_name: str, args: Dict[str, Any], est_tokens: int
+    ) -> Any:
+        """
+        Async version of `_api_call`, using the pooled aiohttp session of the
+        running event loop.
+        """
+        cassette = active_cassette()
+        if cassette is not None and cassette.replaying:
+            return await cassette.areplay(fn_name, args)
+        api = getattr(openai, fn_name)
+        limiter = self.rate_limiter(
+            self.config.chat_model
+            if fn_name == "ChatCompletion"
+            else self.config.completion_model
+        )
+
+        pool = self.endpoint_pool
+
+        @retry_with_exponential_backoff
+        async def completions_with_backoff(**kwargs: Any) -> Any:
+            openai.aiosession.set(aiohttp_session())
+            start = time.time()
+            if pool is not None:
+
+                async def create(endpoint: Endpoint) -> Any:
+                    nonlocal start
+                    start = time.time()
+                    return await api.acreate(
+                        **endpoint.request_args(kwargs, self.api_key)
+                    )
+
+                result = await pool.acall(create, est_tokens)
+            else:
+                async with limiter.alimit(est_tokens):
+                    start = time.time()
+                    result = await api.acreate(**kwargs)
+            if cassette is not None:
+                result = cassette.record(fn_name, kwargs, result, start)
+            return result
+
+        if self.hedger is not None and not args["stream"]:
+            return await self.hedger.acall(lambda: completions_with_backoff(**args))
+        return await completions_with_backoff(**args)
+
+    async def _abatch(
+        self,
+        fn_name: str,
+        requests: List[Tuple[Dict[str, Any], int]],
+        process: Callable[[bool, Dict[str, Any], bool], LLMResponse],
+        max_concurrent: Optional[int] = None,
+    ) -> List[LLMResponse]:
+        """
+        Make a batch of (non-streaming) API calls: look them all up in the cache
+        in one call, make the missing ones concurrently, and write their
+        responses back to the cache in one call.
+        Args:
+            fn_name: API to call: "ChatCompletion" or "Completion"
+            requests: list of (keyword args, estimated tokens) of each call
+            process: fn converting (cached, API response, coalesced)
+                to an LLMResponse
+            max_concurrent: max concurrent calls; defaults to
+                `config.max_concurrent_requests`
+        Returns:
+            List[LLMResponse]: responses, in the same order as `requests`
+        """
+        call_type = "Async" + fn_name
+        keys = [cache_key(fn_name, **args) for args, _ in requests]
+        start = time.time()
+        found = self.cache.retrieve_many(keys) if settings.cache else [None] * len(keys)
+        # each lookup is counted with its share of the time of the batch lookup
+        start = time.time() - (time.time() - start) / max(len(keys), 1)
+        for result in found:
+            self._record_lookup(call_type, result, start)
+        missing = [i for i, result in enumerate(found) if result is None]
+        flight = self._single_flight()
+        # calls that waited for an identical call in flight (possibly in the batch)
+        coalesced: Set[int] = set()
+
+        async def call(i: int) -> Any:
+            args, est_tokens = requests[i]
+            try:
+                if flight is None:
+                    return await self._aapi_call(fn_name, args, est_tokens)
+                result, follower = await flight.ado(
+                    keys[i], lambda: self._aapi_call(fn_name, args, est_tokens)
+                )
+                if follower:
+                    coalesced.add(i)
+                return result
+            except Exception as e:
+                # capture exceptions not handled by retry,
+                # so one failed call does not fail the whole batch
+                err_msg = str(e)[:500]
+                logging.error(f"OpenAI API error: {err_msg}")
+                return None
+
+        results = dict(
+            zip(missing, await self._run_batch(missing, call, max_concurrent))
+        )
+        fresh = {
+            keys[i]: r
+            for i, r in results.items()
+            if r is not None and i not in coalesced
+        }
+        if fresh:
+            self.cache.store_many(fresh)
+            for result in fresh.values():
+                self.cache_stats.record_store(call_type, response=result)
+        for i in coalesced:
+            self.cache_stats.record_coalesced(
+                call_type, self._response_cost(results[i])
+            )
+
+        responses = []
+        for i, result in enumerate(found):
+            if result is not None:
+                responses.append(process(True, result, False))
+            elif results[i] is not None:
+                follower = i in coalesced
+                responses.append(process(follower, results[i], follower))
+            else:
+                responses.append(LLMResponse(message=NO_ANSWER, cached=False))
+        return responses
+
+    async def achat_batch(
+        self,
+        messages_list: Sequence[Union[str, List[LLMMessage]]],
+        max_tokens: int,
+        functions: Optional[List[LLMFunctionSpec]] = None,
+        function_call: str | Dict[str, str] = "auto",
+        max_concurrent: Optional[int] = None,
+    ) -> List[LLMResponse]:
+        """
+        Run a batch of (non-streaming) chats, with one cache lookup and one
+        cache write for the whole batch. See `LanguageModel.achat_batch`.
+        """
+        openai.api_key = self.api_key
+        requests = []
+        for messages in messages_list:
+            args = self._prep_chat_completion(
+                messages, max_tokens, functions, function_call, incremental=False
+            )
+            args["stream"] = False
+            tokens = self.estimate_tokens(
+                messages, max_tokens, functions, function_call
+            )
+            requests.append((args, tokens))
+        return await self._abatch(
+            "ChatCompletion", requests, self._process_chat_response, max_concurrent
+        )
+
+    async def agenerate_batch(
+        self,
+        prompts: Sequence[str],
+        max_tokens: int,
+        max_concurrent: Optional[int] = None,
+    ) -> List[LLMResponse]:
+        """
+        Run a batch of (non-streaming) completions, with one cache lookup and one
+        cache write for the whole batch. See `LanguageModel.agenerate_batch`.
+        """
+        if self.config.use_chat_for_completion:
+            return await self.achat_batch(
+                prompts, max_tokens, max_concurrent=max_concurrent
+            )
+        openai.api_key = self.api_key
+        requests = []
+        for prompt in prompts:
+            args = self._prep_completion(prompt, max_tokens)
+            args["stream"] = False
+            requests.append((args, self.estimate_tokens(prompt, max_tokens)))
+        return await self._abatch(
+            "Completion",
+            requests,
+            self._process_completion_response,
+            max_concurrent,
+        )
 
     def chat(
         self,
@@ -400,32 +1097,40 @@ class OpenAIGPT(LanguageModel):
             logging.error(f"OpenAI API error: {err_msg}")
             return LLMResponse(message=NO_ANSWER, cached=False)
 
-    def _chat(
+    async def achat(
         self,
         messages: Union[str, List[LLMMessage]],
         max_tokens: int,
         functions: Optional[List[LLMFunctionSpec]] = None,
         function_call: str | Dict[str, str] = "auto",
     ) -> LLMResponse:
+        try:
+            return await self._achat(messages, max_tokens, functions, function_call)
+        except Exception as e:
+            # capture exceptions not handled by retry, so we don't crash
+            err_msg = str(e)[:500]
+            logging.error(f"OpenAI API error: {err_msg}")
+            return LLMResponse(message=NO_ANSWER, cached=False)
+
+    def _prep_chat_completion(
+        self,
+        messages: Union[str, List[LLMMessage]],
+        max_tokens: int,
+        functions: Optional[List[LLMFunctionSpec]] = None,
+        function_call: str | Dict[str, str] = "auto",
+        incremental: bool = True,
+    ) -> Dict[str, Any]:
         """
-        ChatCompletion API call to OpenAI.
+        Prepare the args for a ChatCompletion API call (sync or async).
+        See `_chat` for a description of the other params.
         Args:
-            messages: list of messages  to send to the API, typically
-                represents back and forth dialogue between user and LLM, but could
-                also include "function"-role messages. If messages is a string,
-                it is assumed to be a user message.
-            max_tokens: max output tokens to generate
-            functions: list of LLMFunction specs available to the LLM, to possibly
-                use in its response
-            function_call: controls how the LLM uses `functions`:
-                - "auto": LLM decides whether to use `functions` or not,
-                - "none": LLM blocked from using any function
-                - a dict of {"name": "function_name"} which forces the LLM to use
-                    the specified function.
+            incremental: whether the messages may update the incremental prompt
+                of the LLM (see `IncrementalPrompt`), if they continue its
+                conversation; else (e.g. for batch items) they are rendered
+                without changing it
         Returns:
-            LLMResponse object
+            Dict of keyword args for the API call
         """
-        openai.api_key = self.api_key
         if isinstance(messages, str):
             llm_messages = [
                 LLMMessage(role=Role.SYSTEM, content="You are a helpful assistant."),
@@ -434,25 +1139,6 @@ class OpenAIGPT(LanguageModel):
         else:
             llm_messages = messages
 
-        @retry_with_exponential_backoff
-        def completions_with_backoff(**kwargs):  # type: ignore
-            cached = False
-            hashed_key, result = self._cache_lookup("Completion", **kwargs)
-            if result is not None:
-                cached = True
-                if settings.debug:
-                    print("[red]CACHED[/red]")
-            else:
-                # If it's not in the cache, call the API
-                result = openai.ChatCompletion.create(**kwargs)  # type: ignore
-                if not self.config.stream:
-                    # if streaming, cannot cache result
-                    # since it is a generator. Instead,
-                    # we hold on to the hashed_key and
-                    # cache the result later
-                    self.cache.store(hashed_key, result)
-            return cached, hashed_key, result
-
         # Azure uses different parameters. It uses ``engine`` instead of ``model``
         # and the value should be the deployment_name not ``self.config.chat_model``
         chat_model = self.config.chat_model
@@ -464,7 +1150,9 @@ class OpenAIGPT(LanguageModel):
 
         args: Dict[str, Any] = dict(
             **{key_name: chat_model},
-            messages=[m.api_dict() for m in llm_messages],
+            messages=[m.api_dict() for m in llm_messages]
+            if isinstance(messages, str)
+            else self._api_messages(llm_messages, incremental),
             max_tokens=max_tokens,
             n=1,
             stop=None,
@@ -481,13 +1169,37 @@ class OpenAIGPT(LanguageModel):
                     function_call=function_call,
                 )
             )
-        cached, hashed_key, response = completions_with_backoff(**args)
+        return args
 
-        if self.config.stream and not cached:
-            llm_response, openai_response = self._stream_response(response, chat=True)
-            self.cache.store(hashed_key, openai_response)
-            return llm_response
+    def _api_messages(
+        self, messages: List[LLMMessage], incremental: bool
+    ) -> HashedMessages:
+        """
+        The messages, as sent to the API, with their digest. Only a call that
+        continues the conversation of the incremental prompt updates it.
+        """
+        prompt = self.prompt()
+        if incremental and prompt.continues(messages):
+            return prompt.sync(messages)[0]
+        return prompt.render(messages)[0]
 
+    def _process_chat_response(
+        self,
+        cached: bool,
+        response: Dict[str, Any],
+        coalesced: bool = False,
+        streamed: bool = False,
+    ) -> LLMResponse:
+        """
+        Convert a ChatCompletion API response to an LLMResponse.
+        Args:
+            cached: whether the response was retrieved from cache
+            response: API response (or cached version of it)
+            coalesced: whether the response is from an identical call in flight
+            streamed: whether the response was streamed (then it has no usage)
+        Returns:
+            LLMResponse object
+        """
         # openAI response will look like this:
         """
         {
@@ -524,9 +1236,9 @@ class OpenAIGPT(LanguageModel):
         else:
             fun_call = LLMFunctionCall(name=message["function_call"]["name"])
             try:
-                fun_args = ast.literal_eval(message["function_call"]["arguments"])
+                fun_args = parse_json_args(message["function_call"]["arguments"])
                 fun_call.arguments = fun_args
-            except (ValueError, SyntaxError):
+            except ValueError:
                 logging.warning(
                     "Could not parse function arguments: "
                     f"{message['function_call']['arguments']} "
@@ -540,5 +1252,203 @@ class OpenAIGPT(LanguageModel):
             message=msg.strip() if msg is not None else "",
             function_call=fun_call,
             cached=cached,
-            usage=self._get_non_stream_token_usage(cached, response),
+            coalesced=coalesced,
+            usage=self._get_non_stream_token_usage(cached, response, streamed),
         )
+
+    def _chat(
+        self,
+        messages: Union[str, List[LLMMessage]],
+        max_tokens: int,
+        functions: Optional[List[LLMFunctionSpec]] = None,
+        function_call: str | Dict[str, str] = "auto",
+    ) -> LLMResponse:
+        """
+        ChatCompletion API call to OpenAI.
+        Args:
+            messages: list of messages  to send to the API, typically
+                represents back and forth dialogue between user and LLM, but could
+                also include "function"-role messages. If messages is a string,
+                it is assumed to be a user message.
+            max_tokens: max output tokens to generate
+            functions: list of LLMFunction specs available to the LLM, to possibly
+                use in its response
+            function_call: controls how the LLM uses `functions`:
+                - "auto": LLM decides whether to use `functions` or not,
+                - "none": LLM blocked from using any function
+                - a dict of {"name": "function_name"} which forces the LLM to use
+                    the specified function.
+        Returns:
+            LLMResponse object
+        """
+        openai.api_key = self.api_key
+        args = self._prep_chat_completion(
+            messages, max_tokens, functions, function_call
+        )
+        prompt_tokens = self.estimate_tokens(messages, 0, functions, function_call)
+        start = time.time()
+        cached, coalesced, hashed_key, response = self._request(
+            "ChatCompletion", args, prompt_tokens + max_tokens
+        )
+        if self.config.stream and not cached:
+            return self._stream_response(
+                response,
+                chat=True,
+                hashed_key=hashed_key,
+                prompt_tokens=prompt_tokens,
+                start=start,
+                functions=functions,
+            )
+        return self._process_chat_response(cached, response, coalesced)
+
+    async def _achat(
+        self,
+        messages: Union[str, List[LLMMessage]],
+        max_tokens: int,
+        functions: Optional[List[LLMFunctionSpec]] = None,
+        function_call: str | Dict[str, str] = "auto",
+    ) -> LLMResponse:
+        """
+        Async version of `_chat`: ChatCompletion API call to OpenAI,
+        using the pooled aiohttp session of the running event loop.
+        See `_chat` for a description of the params.
+        Returns:
+            LLMResponse object
+        """
+        openai.api_key = self.api_key
+        args = self._prep_chat_completion(
+            messages, max_tokens, functions, function_call
+        )
+        prompt_tokens = self.estimate_tokens(messages, 0, functions, function_call)
+        start = time.time()
+        cached, coalesced, hashed_key, response = await self._arequest(
+            "ChatCompletion", args, prompt_tokens + max_tokens
+        )
+        if self.config.stream and not cached:
+            return await self._stream_response_async(
+                response,
+                chat=True,
+                hashed_key=hashed_key,
+                prompt_tokens=prompt_tokens,
+                start=start,
+                functions=functions,
+            )
+        return self._process_chat_response(cached, response, coalesced)
+
+    def chat_stream(
+        self,
+        messages: Union[str, List[LLMMessage]],
+        max_tokens: int,
+        functions: Optional[List[LLMFunctionSpec]] = None,
+        function_call: str | Dict[str, str] = "auto",
+    ) -> Iterator[LLMStreamEvent]:
+        """
+        Chat with the LLM, yielding the response incrementally as it is
+        generated (regardless of `config.stream`): text, function-name and
+        function-args delta events, and a final event with the complete response
+        (including usage, and the time to first token). The response is cached
+        when the stream ends. A cached response is emitted as a single delta.
+        See `_chat` for a description of the params.
+        Yields:
+            LLMStreamEvent objects
+        """
+        try:
+            yield from self._chat_stream(messages, max_tokens, functions, function_call)
+        except Exception as e:
+            # capture exceptions not handled by retry, so we don't crash
+            err_msg = str(e)[:500]
+            logging.error(f"OpenAI API error: {err_msg}")
+            yield LLMStreamEvent(
+                type=StreamEventType.FINAL,
+                response=LLMResponse(message=NO_ANSWER, cached=False),
+            )
+
+    async def achat_stream(
+        self,
+        messages: Union[str, List[LLMMessage]],
+        max_tokens: int,
+        functions: Optional[List[LLMFunctionSpec]] = None,
+        function_call: str | Dict[str, str] = "auto",
+    ) -> AsyncIterator[LLMStreamEvent]:
+        """
+        Async version of `chat_stream`.
+        """
+        try:
+            async for event in self._achat_stream(
+                messages, max_tokens, functions, function_call
+            ):
+                yield event
+        except Exception as e:
+            # capture exceptions not handled by retry, so we don't crash
+            err_msg = str(e)[:500]
+            logging.error(f"OpenAI API error: {err_msg}")
+            yield LLMStreamEvent(
+                type=StreamEventType.FINAL,
+                response=LLMResponse(message=NO_ANSWER, cached=False),
+            )
+
+    def _chat_stream(
+        self,
+        messages: Union[str, List[LLMMessage]],
+        max_tokens: int,
+        functions: Optional[List[LLMFunctionSpec]] = None,
+        function_call: str | Dict[str, str] = "auto",
+    ) -> Iterator[LLMStreamEvent]:
+        openai.api_key = self.api_key
+        args = self._prep_chat_completion(
+            messages, max_tokens, functions, function_call
+        )
+        args["stream"] = True
+        prompt_tokens = self.estimate_tokens(messages, 0, functions, function_call)
+        start = time.time()
+        cached, coalesced, hashed_key, response = self._request(
+            "ChatCompletion", args, prompt_tokens + max_tokens
+        )
+        if cached:
+            yield from response_stream_events(
+                self._process_chat_response(cached, response, coalesced),
+                time.time() - start,
+            )
+        else:
+            yield from self._stream_events(
+                response,
+                chat=True,
+                hashed_key=hashed_key,
+                prompt_tokens=prompt_tokens,
+                start=start,
+                functions=functions,
+            )
+
+    async def _achat_stream(
+        self,
+        messages: Union[str, List[LLMMessage]],
+        max_tokens: int,
+        functions: Optional[List[LLMFunctionSpec]] = None,
+        function_call: str | Dict[str, str] = "auto",
+    ) -> AsyncIterator[LLMStreamEvent]:
+        openai.api_key = self.api_key
+        args = self._prep_chat_completion(
+            messages, max_tokens, functions, function_call
+        )
+        args["stream"] = True
+        prompt_tokens = self.estimate_tokens(messages, 0, functions, function_call)
+        start = time.time()
+        cached, coalesced, hashed_key, response = await self._arequest(
+            "ChatCompletion", args, prompt_tokens + max_tokens
+        )
+        if cached:
+            for event in response_stream_events(
+                self._process_chat_response(cached, response, coalesced),
+                time.time() - start,
+            ):
+                yield event
+        else:
+            async for event in self._stream_events_async(
+                response,
+                chat=True,
+                hashed_key=hashed_key,
+                prompt_tokens=prompt_tokens,
+                start=start,
+                functions=functions,
+            ):
+                yield event
@@ -0,0 +1,209 @@
+"""
+Incremental preparation of chat prompts.
+
+A chat history grows by a few messages per turn, and starts with messages that
+never change (the system message, other task messages and tool instructions).
+Rather than converting every message to its API dict, re-hashing the whole
+history for the cache key and re-counting its tokens on each turn, these are
+kept, per position, in an `IncrementalPrompt`; each turn then only processes
+the messages appended since the previous one. The unchanging leading messages
+form a `FrozenPrefix`, from which the prompt restarts when the history is
+edited or a different conversation is sent to the same LLM.
+
+Messages are matched by identity (the same message object, with the same
+content string object), which is cheap, and catches contents that are
+replaced, e.g. by `ChatAgent.update_last_message`.
+"""
+import hashlib
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from langroid.language_models.base import LLMMessage
+from langroid.language_models.cache_key import new_messages_hash, update_message_hash
+
+
+class HashedMessages(List[Dict[str, Any]]):
+    """
+    Messages of a prompt, as sent to the API, along with their digest (see
+    `messages_digest`), so that `cache_key` does not re-hash them.
+    """
+
+    def __init__(self, messages: List[Dict[str, Any]], digest: str):
+        super().__init__(messages)
+        self.digest = digest
+
+
+class FrozenPrefix:
+    """
+    The leading messages of a chat history that do not change from turn to
+    turn, with their API dicts, token counts and running hash precomputed.
+    """
+
+    def __init__(
+        self,
+        messages: Sequence[LLMMessage],
+        count: Callable[[LLMMessage], int],
+    ):
+        """
+        Args:
+            messages: the leading messages (system, task, tool instructions)
+            count: number of tokens of a message
+        """
+        self.messages = tuple(messages)
+        self.contents = tuple(m.content for m in self.messages)
+        self.api_dicts = tuple(m.api_dict() for m in self.messages)
+        self.token_counts = tuple(count(m) for m in self.messages)
+        self.tokens = sum(self.token_counts)
+        self.hash = new_messages_hash()
+        for d in self.api_dicts:
+            update_message_hash(self.hash, d)
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def matches(self, messages: Sequence[LLMMessage]) -> bool:
+        """Whether `messages` start with (exactly) these messages."""
+        return len(messages) >= len(self.messages) and all(
+            m is p and m.content is c
+            for m, p, c in zip(messages, self.messages, self.contents)
+        )
+
+
+class IncrementalPrompt:
+    """
+    API dicts, token counts and running hash of the latest chat prompt, see
+    `sync`. Safe to share between threads. Only the conversation that owns the
+    prompt (e.g. that of the agent that set the prefix) should `sync` it;
+    other prompts on the same LLM (batch items, token estimates, other
+    conversations) are `render`ed, reusing what they have in common with it,
+    without changing it.
+    """
+
+    def __init__(
+        self,
+        count: Callable[[LLMMessage], int],
+        prefix: Optional[FrozenPrefix] = None,
+    ):
+        """
+        Args:
+            count: number of tokens of a message
+            prefix: leading messages of the prompts, if known
+        """
+        self.count = count
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.rebuilds = 0  # number of times the prompt restarted
+        self._restart(prefix)
+
+    def set_prefix(self, prefix: Optional[FrozenPrefix]) -> None:
+        with self.lock:
+            self.prefix = prefix
+            self._restart(prefix)
+
+    def _restart(self, prefix: Optional[FrozenPrefix]) -> None:
+        """Start over from `prefix` (or from nothing)."""
+        self.messages: List[LLMMessage] = []
+        self.contents: List[str] = []
+        self.api_dicts: List[Dict[str, Any]] = []
+        # after each message: cumulative tokens, and running hash (None within
+        # the prefix, where only the state after its last message is kept)
+        self.tokens: List[int] = [0]
+        self.hashes: List[Optional["hashlib._Hash"]] = [new_messages_hash()]
+        self.start = 0  # messages before this are those of the prefix
+        if prefix is not None and len(prefix) > 0:
+            self.messages.extend(prefix.messages)
+            self.contents.extend(prefix.contents)
+            self.api_dicts.extend(prefix.api_dicts)
+            self.tokens.extend([0] * (len(prefix) - 1) + [prefix.tokens])
+            self.hashes.extend([None] * (len(prefix) - 1) + [prefix.hash])
+            self.start = len(prefix)
+
+    def _common(self, messages: Sequence[LLMMessage]) -> int:
+        """Number of leading `messages` that are already processed."""
+        n = min(len(messages), len(self.messages))
+        for i in range(n):
+            if messages[i] is not self.messages[i] or (
+                messages[i].content is not self.contents[i]
+            ):
+                return i
+        return n
+
+    def continues(self, messages: Sequence[LLMMessage]) -> bool:
+        """
+        Whether `messages` belong to the conversation of the prefix (or there
+        is no prefix), i.e. may `sync` the prompt.
+        """
+        prefix = self.prefix
+        return prefix is None or prefix.matches(messages)
+
+    def render(self, messages: Sequence[LLMMessage]) -> Tuple[HashedMessages, int]:
+        """
+        Same result as `sync`, without changing the prompt: the messages in
+        common with it (or with the prefix) are reused, and the others are
+        processed afresh.
+        Args:
+            messages: messages of the prompt
+        Returns:
+            the messages, as sent to the API, with their digest; and
+            their number of tokens (excluding per-prompt overhead)
+        """
+        with self.lock:
+            common = self._common(messages)
+            prefix = self.prefix
+            if common < self.start:
+                common = 0
+            api_dicts = self.api_dicts[:common]
+            tokens = self.tokens[common]
+            h = self.hashes[common]
+            if prefix is not None and common < len(prefix) and prefix.matches(messages):
+                common = len(prefix)
+                api_dicts = list(prefix.api_dicts)
+                tokens = prefix.tokens
+                h = prefix.hash
+            assert h is not None
+            h = h.copy()
+        for m in messages[common:]:
+            d = m.api_dict()
+            update_message_hash(h, d)
+            api_dicts.append(d)
+            tokens += self.count(m)
+        return HashedMessages(api_dicts, h.hexdigest()), tokens
+
+    def sync(self, messages: Sequence[LLMMessage]) -> Tuple[HashedMessages, int]:
+        """
+        Bring the prompt up to date with `messages`, processing only those not
+        seen before (unless the history was edited before the end of the
+        prefix, or is a different conversation).
+        Args:
+            messages: messages of the prompt
+        Returns:
+            the messages, as sent to the API, with their digest; and
+            their number of tokens (excluding per-prompt overhead)
+        """
+        with self.lock:
+            common = self._common(messages)
+            prefix = self.prefix
+            from_prefix = (
+                prefix is not None and common < len(prefix) and prefix.matches(messages)
+            )
+            if common < self.start or from_prefix:
+                self.rebuilds += 1
+                self._restart(prefix if from_prefix else None)
+                common = self._common(messages)
+            del self.messages[common:]
+            del self.contents[common:]
+            del self.api_dicts[common:]
+            del self.tokens[common + 1 :]
+            del self.hashes[common + 1 :]
+            h = self.hashes[common]
+            assert h is not None
+            for m in messages[common:]:
+                d = m.api_dict()
+                h = h.copy()
+                update_message_hash(h, d)
+                self.messages.append(m)
+                self.contents.append(m.content)
+                self.api_dicts.append(d)
+                self.tokens.append(self.tokens[-1] + self.count(m))
+                self.hashes.append(h)
+            return HashedMessages(self.api_dicts, h.hexdigest()), self.tokens[-1]
@@ -0,0 +1,232 @@
+"""
+Client-side rate limiting of LLM API requests, using token buckets
+for requests-per-minute and tokens-per-minute budgets.
+
+Limiters are shared process-wide, keyed by model name (see `get_rate_limiter`),
+so that all `LanguageModel` (and embedding model) instances using the same model
+draw from the same budget, and wait *before* sending a request, rather than
+reacting to rate-limit errors from the API.
+"""
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Dict, Iterator, Optional
+
+
+class TokenBucket:
+    """
+    Token bucket that refills continuously at `rate` units per second,
+    up to `capacity` units. Callers *reserve* units: the bucket may go into
+    debt, and the returned delay is how long the caller must wait before
+    its reservation is covered. This gives first-come-first-served ordering
+    without any polling loops.
+    """
+
+    def __init__(self, capacity: float, rate: float):
+        """
+        Args:
+            capacity: max units the bucket can hold (i.e. max burst)
+            rate: refill rate, in units per second
+        """
+        self.capacity = capacity
+        self.rate = rate
+        self.level = capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self.last_refill
+        self.level = min(self.capacity, self.level + elapsed * self.rate)
+        self.last_refill = now
+
+    def reserve(self, amount: float) -> float:
+        """
+        Reserve `amount` units from the bucket.
+        Args:
+            amount: number of units to reserve
+        Returns:
+            float: seconds to wait before the reservation is covered
+        """
+        with self.lock:
+            self._refill(time.monotonic())
+            self.level -= amount
+            if self.level >= 0:
+                return 0.0
+            return -self.level / self.rate
+
+
+class RateLimiter:
+    """
+    Rate limiter combining a requests-per-minute and a tokens-per-minute bucket.
+    Either budget may be None, meaning unlimited.
+    Also tracks, for metrics, the total time callers spent waiting,
+    and the requests/tokens currently in flight.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+    ):
+        self.request_bucket: Optional[TokenBucket] = None
+        self.token_bucket: Optional[TokenBucket] = None
+        self.set_limits(requests_per_minute, tokens_per_minute)
+        self.lock = threading.Lock()
+        self.total_requests = 0
+        self.total_tokens = 0
+        self.total_wait_time = 0.0
+        self.requests_in_flight = 0
+        self.tokens_in_flight = 0
+
+    def set_limits(
+        self,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+    ) -> None:
+        """
+        Configure the budgets. A limit given as None leaves that budget
+        unchanged (initially: unlimited), and a bucket is only re-created if its
+        limit changed, so that its current level is preserved otherwise.
+        """
+        if requests_per_minute is not None and (
+            self.request_bucket is None
+            or self.request_bucket.capacity != requests_per_minute
+        ):
+            self.request_bucket = TokenBucket(
+                requests_per_minute, requests_per_minute / 60
+            )
+        if tokens_per_minute is not None and (
+            self.token_bucket is None or self.token_bucket.capacity != tokens_per_minute
+        ):
+            self.token_bucket = TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+
+    def reserve(self, tokens: int) -> float:
+        """
+        Reserve one request and `tokens` tokens.
+        Args:
+            tokens: estimated number of tokens (prompt + completion) of the request
+        Returns:
+            float: seconds to wait before sending the request
+        """
+        delay = 0.0
+        if self.request_bucket is not None:
+            delay = max(delay, self.request_bucket.reserve(1))
+        if self.token_bucket is not None:
+            delay = max(delay, self.token_bucket.reserve(tokens))
+        with self.lock:
+            self.total_requests += 1
+            self.total_tokens += tokens
+            self.total_wait_time += delay
+        return delay
+
+    def wait(self, tokens: int) -> None:
+        """
+        Block the current thread until a request of `tokens` tokens may be sent.
+        Use `acquire` instead in async code.
+        """
+        delay = self.reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire(self, tokens: int) -> None:
+        """
+        Wait (without blocking the event loop) until a request
+        of `tokens` tokens may be sent.
+        """
+        delay = self.reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _start(self, tokens: int) -> None:
+        with self.lock:
+            self.requests_in_flight += 1
+            self.tokens_in_flight += tokens
+
+    def _end(self, tokens: int) -> None:
+        with self.lock:
+            self.requests_in_flight -= 1
+            self.tokens_in_flight -= tokens
+
+    @contextmanager
+    def limit(self, tokens: int) -> Iterator[None]:
+        """
+        Context manager to wrap a (sync) API request: waits for budget
+        on entry, and counts the request as in flight until exit.
+        """
+        self.wait(tokens)
+        self._start(tokens)
+        try:
+            yield
+        finally:
+            self._end(tokens)
+
+    @asynccontextmanager
+    async def alimit(self, tokens: int) -> AsyncIterator[None]:
+        """
+        Async version of `limit`, to wrap an async API request.
+        """
+        await self.acquire(tokens)
+        self._start(tokens)
+        try:
+            yield
+        finally:
+            self._end(tokens)
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Current state of the limiter, e.g. for metrics.
+        Returns:
+            Dict[str, float]: counters, and the in-flight requests/tokens
+        """
+        with self.lock:
+            return dict(
+                total_requests=self.total_requests,
+                total_tokens=self.total_tokens,
+                total_wait_time=self.total_wait_time,
+                requests_in_flight=self.requests_in_flight,
+                tokens_in_flight=self.tokens_in_flight,
+            )
+
+
+_rate_limiters: Dict[str, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(
+    model: str,
+    requests_per_minute: Optional[int] = None,
+    tokens_per_minute: Optional[int] = None,
+) -> RateLimiter:
+    """
+    Get the process-wide rate limiter for a model, creating it if needed.
+    If the limiter already exists, any limits given (i.e. not None) replace
+    its current ones, so the most recently configured limits for a model apply;
+    a limit given as None leaves the current one unchanged (so that a user of
+    the model that sets no limit does not lift those set by others).
+    Args:
+        model: model name, the key of the limiter
+        requests_per_minute: requests budget; None = unchanged
+            (unlimited for a new limiter)
+        tokens_per_minute: tokens budget; None = unchanged
+            (unlimited for a new limiter)
+    Returns:
+        RateLimiter: the shared limiter for `model`
+    """
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(model)
+        if limiter is None:
+            limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+            _rate_limiters[model] = limiter
+        else:
+            limiter.set_limits(requests_per_minute, tokens_per_minute)
+        return limiter
+
+
+def rate_limiter_stats() -> Dict[str, Dict[str, float]]:
+    """
+    State of all process-wide rate limiters, keyed by model, e.g. for metrics.
+    """
+    with _rate_limiters_lock:
+        limiters = dict(_rate_limiters)
+    return {model: limiter.stats() for model, limiter in limiters.items()}
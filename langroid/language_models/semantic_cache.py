@@ -0,0 +1,247 @@
+"""
+Semantic (embedding-similarity) cache of LLM chat responses.
+
+The exact-key cache misses when a question is paraphrased. The semantic cache
+embeds the final user message of each chat request, and keeps, for each
+context (model, functions, and all the messages before the final one), a small
+in-process index of the embeddings of past messages, mapping each to the exact
+cache key of its request. A new request whose message is similar enough
+(cosine similarity above a threshold) to a past one, in the same context,
+reuses the cached response of the past request. Since the context includes
+the history, a follow-up such as "and the second one?" only matches the same
+follow-up in the same conversation.
+"""
+import hashlib
+import json
+import random
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import numpy.typing as npt
+from pydantic import BaseModel
+
+from langroid.embedding_models.base import EmbeddingModel, EmbeddingModelsConfig
+from langroid.embedding_models.models import OpenAIEmbeddingsConfig
+from langroid.language_models.cache_key import messages_digest
+
+Vector = npt.NDArray[np.float32]
+
+
+class SemanticCacheConfig(BaseModel):
+    """Configuration model for SemanticCache."""
+
+    embedding: EmbeddingModelsConfig = OpenAIEmbeddingsConfig()
+    # min cosine similarity between user messages, to reuse a response
+    threshold: float = 0.95
+    # max past messages indexed per context (model, functions, history);
+    # the oldest are dropped first
+    max_entries: int = 10_000
+    # fraction of hits that are checked by also calling the API, and comparing
+    # the cached response with the fresh one (see `SemanticCache.check`)
+    false_positive_sample_rate: float = 0.0
+    # min cosine similarity between the cached and fresh responses, for a
+    # sampled hit to be counted as a true positive
+    response_threshold: float = 0.9
+
+
+class _Index:
+    """
+    Normalized embeddings of past messages, and the cache keys they map to:
+    a ring buffer of at most `max_entries`, the oldest being overwritten.
+    The buffer grows by doubling until it holds `max_entries`, so that adding
+    an entry never copies the whole matrix (except, rarely, to grow it).
+    """
+
+    def __init__(self, dims: int, max_entries: int):
+        self.max_entries = max_entries
+        self.vectors: Vector = np.zeros((min(max_entries, 64), dims), dtype=np.float32)
+        self.keys: List[str] = []
+        self.cursor = 0  # slot overwritten next, once full
+
+    def nearest(self, vector: Vector) -> Tuple[Optional[str], float]:
+        if not self.keys:
+            return None, 0.0
+        similarities = self.vectors[: len(self.keys)] @ vector
+        i = int(np.argmax(similarities))
+        return self.keys[i], float(similarities[i])
+
+    def add(self, vector: Vector, key: str) -> None:
+        n = len(self.keys)
+        if n < self.max_entries:
+            if n == len(self.vectors):
+                grown = np.zeros(
+                    (min(2 * n, self.max_entries), self.vectors.shape[1]),
+                    dtype=np.float32,
+                )
+                grown[:n] = self.vectors
+                self.vectors = grown
+            self.vectors[n] = vector
+            self.keys.append(key)
+        elif self.max_entries > 0:
+            self.vectors[self.cursor] = vector
+            self.keys[self.cursor] = key
+            self.cursor = (self.cursor + 1) % self.max_entries
+
+
+class SemanticCache:
+    """
+    Index of past chat requests by the embedding of their final user message,
+    to find the cache key of a semantically equivalent past request.
+    The responses themselves stay in the exact-key CacheDB.
+    """
+
+    def __init__(
+        self,
+        config: SemanticCacheConfig,
+        embedding_model: Optional[EmbeddingModel] = None,
+    ):
+        """
+        Args:
+            config: configuration of the semantic cache
+            embedding_model: model to embed messages with; defaults to
+                one created from `config.embedding`
+        """
+        self.config = config
+        self.embedding_model = embedding_model or EmbeddingModel.create(
+            config.embedding
+        )
+        self.embed_fn = self.embedding_model.embedding_fn()
+        self.indexes: Dict[str, _Index] = {}
+        self.lock = threading.Lock()
+        # recent embeddings, so a message looked up and then added
+        # is embedded only once
+        self._recent: Dict[str, Vector] = {}
+        self.lookups = 0
+        self.hits = 0
+        self.misses = 0
+        self.sampled = 0
+        self.false_positives = 0
+
+    @staticmethod
+    def _context(args: Dict[str, Any]) -> Tuple[Optional[str], str]:
+        """
+        Split the args of a ChatCompletion call into the key of its context
+        (model, functions, and the messages before the final one), and its
+        final user message.
+        Returns (None, "") if the request does not end with a user message.
+        """
+        messages = args.get("messages", [])
+        if not messages or messages[-1].get("role") != "user":
+            return None, ""
+        context = dict(
+            model=args.get("model", args.get("engine")),
+            history=messages_digest(messages[:-1]),
+            functions=args.get("functions"),
+            function_call=args.get("function_call"),
+        )
+        context_key = hashlib.blake2b(
+            json.dumps(context, sort_keys=True, default=str).encode(),
+            digest_size=16,
+        ).hexdigest()
+        return context_key, messages[-1].get("content") or ""
+
+    def _embed(self, text: str) -> Vector:
+        with self.lock:
+            vector = self._recent.get(text)
+        if vector is None:
+            vector = np.array(self.embed_fn([text])[0], dtype=np.float32)
+            vector /= np.linalg.norm(vector) or 1.0
+            with self.lock:
+                if len(self._recent) >= 256:
+                    self._recent.pop(next(iter(self._recent)))
+                self._recent[text] = vector
+        return vector
+
+    def lookup(self, args: Dict[str, Any]) -> Optional[str]:
+        """
+        Find a past request semantically equivalent to a ChatCompletion call.
+        Args:
+            args: keyword args of the ChatCompletion call
+        Returns:
+            the cache key of the past request, if its final user message is
+            similar enough (and in the same context); else None
+        """
+        context_key, query = self._context(args)
+        if context_key is None or not query:
+            return None
+        vector = self._embed(query)
+        with self.lock:
+            self.lookups += 1
+            index = self.indexes.get(context_key)
+            key, similarity = (None, 0.0) if index is None else index.nearest(vector)
+            if key is not None and similarity >= self.config.threshold:
+                self.hits += 1
+                return key
+            self.misses += 1
+            return None
+
+    def add(self, args: Dict[str, Any], key: str) -> None:
+        """
+        Index a ChatCompletion call, under the cache key of its response.
+        Args:
+            args: keyword args of the ChatCompletion call
+            key: cache key of the call
+        """
+        context_key, query = self._context(args)
+        if context_key is None or not query:
+            return
+        vector = self._embed(query)
+        with self.lock:
+            index = self.indexes.get(context_key)
+            if index is None:
+                index = self.indexes[context_key] = _Index(
+                    len(vector), self.config.max_entries
+                )
+            index.add(vector, key)
+
+    def should_sample(self) -> bool:
+        """Whether to check a hit for being a false positive."""
+        return random.random() < self.config.false_positive_sample_rate
+
+    def check(self, cached: Dict[str, Any], fresh: Dict[str, Any]) -> bool:
+        """
+        Check a sampled hit: compare the cached response with a fresh one
+        for the same request, and record whether the hit was a false positive.
+        Args:
+            cached: the cached ChatCompletion response returned for the hit
+            fresh: the ChatCompletion response from the API
+        Returns:
+            whether the responses agree (i.e. the hit was a true positive)
+        """
+
+        def text(response: Dict[str, Any]) -> str:
+            message = response["choices"][0]["message"]
+            return (message.get("content") or "") + json.dumps(
+                message.get("function_call")
+            )
+
+        cached_text, fresh_text = text(cached), text(fresh)
+        agree = cached_text == fresh_text or (
+            float(self._embed(cached_text) @ self._embed(fresh_text))
+            >= self.config.response_threshold
+        )
+        with self.lock:
+            self.sampled += 1
+            self.false_positives += int(not agree)
+        return agree
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Counters of the semantic cache, e.g. for metrics.
+        Returns:
+            dict: lookups, hits, misses, sampled hits, false positives among
+                them, estimated false-positive rate, and number of indexed messages
+        """
+        with self.lock:
+            return dict(
+                lookups=self.lookups,
+                hits=self.hits,
+                misses=self.misses,
+                sampled=self.sampled,
+                false_positives=self.false_positives,
+                false_positive_rate=(
+                    self.false_positives / self.sampled if self.sampled else 0.0
+                ),
+                entries=sum(len(i.keys) for i in self.indexes.values()),
+            )
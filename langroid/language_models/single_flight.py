@@ -0,0 +1,127 @@
+"""
+Single-flight coalescing of identical in-flight LLM API calls.
+
+A response is only cached once its call returns, so identical calls issued at
+the same moment (e.g. by several agents on a shared corpus, or parallel test
+workers) would all miss the cache and all call the API. Instead, the first
+call for a cache key becomes the *leader* and makes the API call; calls with
+the same key made while it is in flight *follow* it, i.e. wait for its result
+rather than calling the API themselves.
+
+In-flight calls are shared process-wide (see `single_flight`), across threads
+and event loops: the leader's result is published through a
+`concurrent.futures.Future`, which sync followers wait on directly, and async
+followers wait on via `asyncio.wrap_future`, without blocking their loop.
+"""
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+
+class SingleFlight:
+    """
+    Registry of in-flight calls, keyed by cache key.
+    If the leader fails, its followers get the same exception.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.calls: Dict[str, "Future[Any]"] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def _join(self, key: str) -> Tuple[bool, "Future[Any]"]:
+        """Join the in-flight call for `key`, or register a new one (as leader)."""
+        with self.lock:
+            future = self.calls.get(key)
+            if future is not None:
+                self.followers += 1
+                return False, future
+            future = self.calls[key] = Future()
+            self.leaders += 1
+            return True, future
+
+    def _done(self, key: str) -> None:
+        with self.lock:
+            self.calls.pop(key, None)
+
+    def follow(self, key: str) -> Optional["Future[Any]"]:
+        """
+        Follow the in-flight call for `key`, if any, without becoming
+        a leader otherwise (e.g. for a call whose result cannot be shared).
+        Args:
+            key: key of the call
+        Returns:
+            the future result of the in-flight call, or None if there is none
+        """
+        with self.lock:
+            future = self.calls.get(key)
+            if future is not None:
+                self.followers += 1
+            return future
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Make the call `fn` for `key`, unless one is already in flight,
+        in which case wait for its result.
+        Args:
+            key: key of the call (e.g. its cache key)
+            fn: makes the call
+        Returns:
+            Tuple of (result of the call, whether it was coalesced with
+                the in-flight call, i.e. `fn` was not called)
+        """
+        leader, future = self._join(key)
+        if not leader:
+            return future.result(), True
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            self._done(key)
+        return result, False
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Async version of `do`.
+        """
+        leader, future = self._join(key)
+        if not leader:
+            return await asyncio.wrap_future(future), True
+        try:
+            result = await fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            self._done(key)
+        return result, False
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Counters of the registry, e.g. for metrics.
+        Returns:
+            dict: calls made (leaders), calls coalesced (followers),
+                and calls in flight
+        """
+        with self.lock:
+            return dict(
+                leaders=self.leaders,
+                followers=self.followers,
+                in_flight=len(self.calls),
+            )
+
+
+_single_flight = SingleFlight()
+
+
+def single_flight() -> SingleFlight:
+    """The process-wide registry of in-flight LLM API calls."""
+    return _single_flight
@@ -1,9 +1,22 @@
 # from openai-cookbook
 import asyncio
+import functools
 import logging
 import random
+import threading
 import time
-from typing import Any, Callable, Dict, List
+import weakref
+from typing import (
+    Any,
+    AsyncGenerator,
+    Callable,
+    Coroutine,
+    Dict,
+    Optional,
+    Tuple,
+    TypeVar,
+    overload,
+)
 
 import aiohttp
 import openai
@@ -13,133 +26,383 @@ logger = logging.getLogger(__name__)
 # setlevel to warning
 logger.setLevel(logging.WARNING)
 
+T = TypeVar("T")
+# a sync or async function, wrapped by `retry_with_exponential_backoff`
+F = TypeVar("F", bound=Callable[..., Any])
 
-# define a retry decorator
+# one pooled aiohttp session per event loop, since a session
+# cannot be shared across loops; with the async generator that closes it
+# when the loop shuts down (see `_closer`)
+_aiohttp_sessions: weakref.WeakKeyDictionary[
+    asyncio.AbstractEventLoop,
+    Tuple[aiohttp.ClientSession, AsyncGenerator[None, None]],
+] = weakref.WeakKeyDictionary()
+
+
+async def _closer(session: aiohttp.ClientSession) -> AsyncGenerator[None, None]:
+    """
+    Closes `session` when finalized. Once started, the generator is tracked by
+    the running loop, which finalizes it in `loop.shutdown_asyncgens()` (as
+    `asyncio.run` does before closing the loop), so the session is closed even
+    when the caller owns the loop.
+    """
+    try:
+        yield
+    finally:
+        if not session.closed:
+            await session.close()
+
+
+def aiohttp_session(max_connections: int = 100) -> aiohttp.ClientSession:
+    """
+    Get the pooled aiohttp session for the running event loop,
+    creating it if needed. Reusing one session lets concurrent async
+    API calls share keep-alive connections, instead of each call
+    opening (and tearing down) its own session.
+    Must be called from within a running event loop. The session is closed
+    when the loop shuts down (or by `close_aiohttp_session`).
+    Args:
+        max_connections: max simultaneous connections in the pool
+            (only used when the session is first created)
+    Returns:
+        aiohttp.ClientSession: session bound to the running loop
+    """
+    loop = asyncio.get_running_loop()
+    entry = _aiohttp_sessions.get(loop)
+    if entry is not None and not entry[0].closed:
+        return entry[0]
+    session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=max_connections)
+    )
+    closer = _closer(session)
+    # run it to its `yield`, which registers it with the loop
+    try:
+        closer.asend(None).send(None)  # type: ignore
+    except StopIteration:
+        pass
+    _aiohttp_sessions[loop] = (session, closer)
+    return session
+
+
+async def close_aiohttp_session() -> None:
+    """Close the pooled aiohttp session of the running event loop, if any."""
+    loop = asyncio.get_running_loop()
+    entry = _aiohttp_sessions.pop(loop, None)
+    if entry is not None:
+        await entry[1].aclose()
+
+
+def run_async(coro: Coroutine[Any, Any, T]) -> T:
+    """
+    Run a coroutine to completion from sync code, in a fresh event loop,
+    closing the loop's pooled aiohttp session before the loop is closed.
+    Args:
+        coro: coroutine to run
+    Returns:
+        result of the coroutine
+    """
+
+    async def _run() -> T:
+        try:
+            return await coro
+        finally:
+            await close_aiohttp_session()
+
+    return asyncio.run(_run())
+
+
+class RetryStats:
+    """
+    Process-wide counters of retries done by `retry_with_exponential_backoff`,
+    to see how much latency comes from backing off.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.calls = 0  # calls to decorated functions
+        self.retried_calls = 0  # calls that needed at least one retry
+        self.retries = 0  # total number of retries
+        self.failed_calls = 0  # calls that ran out of retries or retry budget
+        self.backoff_time = 0.0  # total seconds spent sleeping between retries
+        self.errors: Dict[str, int] = {}  # retries per error type
+
+    def record_call(self) -> None:
+        with self.lock:
+            self.calls += 1
+
+    def record_retry(self, error: Exception, delay: float, first: bool) -> None:
+        with self.lock:
+            self.retries += 1
+            self.retried_calls += int(first)
+            self.backoff_time += delay
+            name = type(error).__name__
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def record_failure(self) -> None:
+        with self.lock:
+            self.failed_calls += 1
+
+    def dict(self) -> Dict[str, Any]:
+        with self.lock:
+            return dict(
+                calls=self.calls,
+                retried_calls=self.retried_calls,
+                retries=self.retries,
+                failed_calls=self.failed_calls,
+                backoff_time=self.backoff_time,
+                errors=dict(self.errors),
+            )
+
+
+_retry_stats = RetryStats()
+
+
+def retry_stats() -> Dict[str, Any]:
+    """
+    Counters of all retries done via `retry_with_exponential_backoff`
+    in this process, e.g. for metrics.
+    """
+    return _retry_stats.dict()
+
+
+def reset_retry_stats() -> None:
+    """Reset the process-wide retry counters."""
+    _retry_stats.reset()
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """
+    Delay (in seconds) requested by the server via a `Retry-After`
+    (or `retry-after-ms`) header of the error's response, if any.
+    """
+    headers = getattr(error, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms") is not None:
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after") is not None:
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        # e.g. an HTTP-date, which OpenAI does not send; use our own backoff
+        pass
+    return None
+
+
+class _Backoff:
+    """
+    State of the retries of one call: computes successive delays with
+    decorrelated jitter, honours server-requested delays, and enforces
+    the max number of retries and the total retry time budget.
+    """
+
+    def __init__(
+        self,
+        initial_delay: float,
+        exponential_base: float,
+        jitter: bool,
+        max_retries: int,
+        max_delay: float,
+        max_retry_time: float,
+    ):
+        self.initial_delay = initial_delay
+        self.exponential_base = exponential_base
+        self.jitter = jitter
+        self.max_retries = max_retries
+        self.max_delay = max_delay
+        self.max_retry_time = max_retry_time
+        self.num_retries = 0
+        self.delay = initial_delay
+        self.start = time.monotonic()
+
+    def next_delay(self, error: Exception) -> float:
+        """
+        Seconds to wait before retrying after `error`.
+        Raises an exception (chained to `error`) if the retries are exhausted,
+        i.e. the max number of retries is reached, or waiting would exceed the
+        total retry budget of the call.
+        """
+        self.num_retries += 1
+        if self.num_retries > self.max_retries:
+            _retry_stats.record_failure()
+            raise Exception(
+                f"Maximum number of retries ({self.max_retries}) exceeded."
+            ) from error
+
+        # decorrelated jitter: each delay is drawn between the initial delay
+        # and a multiple of the previous one, so that concurrent callers
+        # hitting the same error spread out instead of retrying in lockstep.
+        if self.jitter:
+            self.delay = random.uniform(
+                self.initial_delay, self.delay * self.exponential_base
+            )
+        else:
+            self.delay *= self.exponential_base
+        self.delay = min(self.delay, self.max_delay)
+        delay = self.delay
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            # the server knows best when capacity will be available
+            delay = min(retry_after, self.max_delay)
+
+        elapsed = time.monotonic() - self.start
+        if elapsed + delay > self.max_retry_time:
+            _retry_stats.record_failure()
+            raise Exception(
+                f"Retry time budget ({self.max_retry_time}s) exceeded "
+                f"after {self.num_retries - 1} retries."
+            ) from error
+
+        _retry_stats.record_retry(error, delay, first=self.num_retries == 1)
+        logger.warning(
+            f"""OpenAI API request failed with error: 
+            {error}. 
+            Retrying in {delay:.2f} seconds..."""
+        )
+        return delay
+
+
+_RETRY_ERRORS = (
+    requests.exceptions.RequestException,
+    openai.error.Timeout,
+    openai.error.RateLimitError,
+    openai.error.APIError,
+    openai.error.ServiceUnavailableError,
+    openai.error.TryAgain,
+    aiohttp.ServerTimeoutError,
+    asyncio.TimeoutError,
+)
+
+
+@overload
+def retry_with_exponential_backoff(
+    func: F,
+    initial_delay: float = ...,
+    exponential_base: float = ...,
+    jitter: bool = ...,
+    max_retries: int = ...,
+    max_delay: float = ...,
+    max_retry_time: float = ...,
+    errors: tuple = ...,  # type: ignore
+) -> F:
+    ...
+
+
+@overload
 def retry_with_exponential_backoff(
-    func: Callable[..., Any],
+    func: None = None,
+    initial_delay: float = ...,
+    exponential_base: float = ...,
+    jitter: bool = ...,
+    max_retries: int = ...,
+    max_delay: float = ...,
+    max_retry_time: float = ...,
+    errors: tuple = ...,  # type: ignore
+) -> Callable[[F], F]:
+    ...
+
+
+def retry_with_exponential_backoff(
+    func: Optional[Callable[..., Any]] = None,
     initial_delay: float = 1,
-    exponential_base: float = 2,
+    exponential_base: float = 3,
     jitter: bool = True,
     max_retries: int = 10,
-    errors: tuple = (  # type: ignore
-        requests.exceptions.RequestException,
-        openai.error.Timeout,
-        openai.error.RateLimitError,
-        openai.error.APIError,
-        openai.error.ServiceUnavailableError,
-        openai.error.TryAgain,
-        aiohttp.ServerTimeoutError,
-        asyncio.TimeoutError,
-    ),
-) -> Callable[..., Any]:
-    """Retry a function with exponential backoff."""
-
-    def wrapper(*args: List[Any], **kwargs: Dict[Any, Any]) -> Any:
-        # Initialize variables
-        num_retries = 0
-        delay = initial_delay
-
-        # Loop until a successful response or max_retries is hit or exception is raised
-        while True:
-            try:
-                return func(*args, **kwargs)
+    max_delay: float = 60,
+    max_retry_time: float = 300,
+    errors: tuple = _RETRY_ERRORS,  # type: ignore
+) -> Any:
+    """
+    Retry a function with exponential backoff and decorrelated jitter.
+    Works for both sync and async functions: for the latter, the wrapper is
+    a coroutine function that waits with `asyncio.sleep`, so that backing off
+    never blocks the event loop. A `Retry-After` header on the error is
+    honoured. Can be used bare (`@retry_with_exponential_backoff`) or with
+    params (`@retry_with_exponential_backoff(max_retry_time=30)`).
+    Retries are counted process-wide, see `retry_stats()`.
 
-            except openai.error.InvalidRequestError as e:
-                # do not retry when the request itself is invalid,
-                # e.g. when context is too long
-                logger.error(f"OpenAI API request failed with error: {e}.")
-                raise e
+    Args:
+        func: function to wrap
+        initial_delay: delay (seconds) before the first retry
+        exponential_base: growth factor of the delay; with jitter, the next
+            delay is drawn between `initial_delay` and this multiple of the
+            previous delay
+        jitter: whether to randomize the delays
+        max_retries: max number of retries of a call
+        max_delay: max delay (seconds) between two attempts
+        max_retry_time: total budget (seconds) of a call, including attempts:
+            a retry is abandoned if waiting for it would exceed the budget
+        errors: errors to retry on; others are raised immediately
+    Returns:
+        the wrapped function (or a decorator, if `func` is None)
+    """
+    if func is None:
+        return functools.partial(
+            retry_with_exponential_backoff,
+            initial_delay=initial_delay,
+            exponential_base=exponential_base,
+            jitter=jitter,
+            max_retries=max_retries,
+            max_delay=max_delay,
+            max_retry_time=max_retry_time,
+            errors=errors,
+        )
 
-            # Retry on specified errors
-            except errors as e:
-                # Increment retries
-                num_retries += 1
-
-                # Check if max retries has been reached
-                if num_retries > max_retries:
-                    raise Exception(
-                        f"Maximum number of retries ({max_retries}) exceeded."
-                    )
-
-                # Increment the delay
-                delay *= exponential_base * (1 + jitter * random.random())
-                logger.warning(
-                    f"""OpenAI API request failed with error: 
-                    {e}. 
-                    Retrying in {delay} seconds..."""
-                )
-                # Sleep for the delay
-                time.sleep(delay)
-
-            # Raise exceptions for any errors not specified
-            except Exception as e:
-                raise e
+    def backoff() -> _Backoff:
+        return _Backoff(
+            initial_delay,
+            exponential_base,
+            jitter,
+            max_retries,
+            max_delay,
+            max_retry_time,
+        )
 
-    return wrapper
+    if asyncio.iscoroutinefunction(func):
 
+        @functools.wraps(func)
+        async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+            _retry_stats.record_call()
+            state = backoff()
+            while True:
+                try:
+                    return await func(*args, **kwargs)
+                except openai.error.InvalidRequestError as e:
+                    # do not retry when the request itself is invalid,
+                    # e.g. when context is too long
+                    logger.error(f"OpenAI API request failed with error: {e}.")
+                    raise e
+                except errors as e:
+                    await asyncio.sleep(state.next_delay(e))
 
-def async_retry_with_exponential_backoff(
-    func: Callable[..., Any],
-    initial_delay: float = 1,
-    exponential_base: float = 2,
-    jitter: bool = True,
-    max_retries: int = 10,
-    errors: tuple = (  # type: ignore
-        openai.error.Timeout,
-        openai.error.RateLimitError,
-        openai.error.APIError,
-        openai.error.ServiceUnavailableError,
-        openai.error.TryAgain,
-        aiohttp.ServerTimeoutError,
-        asyncio.TimeoutError,
-    ),
-) -> Callable[..., Any]:
-    """Retry a function with exponential backoff."""
-
-    async def wrapper(*args: List[Any], **kwargs: Dict[Any, Any]) -> Any:
-        # Initialize variables
-        num_retries = 0
-        delay = initial_delay
-
-        # Loop until a successful response or max_retries is hit or exception is raised
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        _retry_stats.record_call()
+        state = backoff()
         while True:
             try:
-                result = await func(*args, **kwargs)
-                return result
-
+                return func(*args, **kwargs)
             except openai.error.InvalidRequestError as e:
                 # do not retry when the request itself is invalid,
                 # e.g. when context is too long
                 logger.error(f"OpenAI API request failed with error: {e}.")
                 raise e
-
-            # Retry on specified errors
             except errors as e:
-                # Increment retries
-                num_retries += 1
-
-                # Check if max retries has been reached
-                if num_retries > max_retries:
-                    raise Exception(
-                        f"Maximum number of retries ({max_retries}) exceeded."
-                    )
-
-                # Increment the delay
-                delay *= exponential_base * (1 + jitter * random.random())
-                logger.warning(
-                    f"""OpenAI API request failed with error{e}. 
-                    Retrying in {delay} seconds..."""
-                )
-                # Sleep for the delay
-                time.sleep(delay)
-
-            # Raise exceptions for any errors not specified
-            except Exception as e:
-                raise e
+                time.sleep(state.next_delay(e))
 
     return wrapper
 
 
+# kept for backward compatibility: `retry_with_exponential_backoff`
+# handles async functions too
+async_retry_with_exponential_backoff = retry_with_exponential_backoff
+
+
 # @retry_with_exponential_backoff
 # def completions_with_backoff(**kwargs):
 #     return openai.Completion.create(**kwargs)
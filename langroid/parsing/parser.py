@@ -1,10 +1,10 @@
 import logging
 from enum import Enum
 from functools import reduce
-from typing import List
+from typing import List, Optional, Tuple
 
 import tiktoken
-from pydantic import BaseSettings
+from pydantic import BaseModel, BaseSettings, PrivateAttr
 
 from langroid.mytypes import Document
 from langroid.parsing.para_sentence_split import create_chunks, remove_extra_whitespace
@@ -206,3 +206,33 @@ class Parser:
             return self.split_simple(docs)
         else:
             raise ValueError(f"Unknown splitter: {self.config.splitter}")
+
+
+class TokenCounted(BaseModel):
+    """
+    Mixin for models with a `content` field (e.g. `LLMMessage`, `ChatDocument`)
+    that caches the number of tokens in the content, so that e.g. the messages
+    of a conversation are tokenized once, rather than on every turn.
+    The cached count is keyed by the hash of the content and the tokenizer
+    encoding, so it is never stale; code that changes the content should still
+    call `invalidate_token_count`, to free it early.
+    """
+
+    # (hash of content, encoding name, number of tokens)
+    _token_count: Optional[Tuple[int, str, int]] = PrivateAttr(default=None)
+
+    def num_tokens(self, parser: Parser) -> int:
+        """
+        Number of tokens in the content, with the tokenizer of `parser`.
+        """
+        content: str = getattr(self, "content")
+        key = (hash(content), parser.tokenizer.name)
+        cached = self._token_count
+        if cached is not None and (cached[0], cached[1]) == key:
+            return cached[2]
+        n = parser.num_tokens(content)
+        self._token_count = (key[0], key[1], n)
+        return n
+
+    def invalidate_token_count(self) -> None:
+        self._token_count = None
@@ -0,0 +1,211 @@
+"""
+Incremental parsing of the JSON arguments of function calls, as an LLM
+streams them.
+
+`StreamingJSONParser` consumes the argument deltas as they arrive, and decodes
+each top-level field of the (object) arguments as soon as it is complete, so
+that by the end of the stream only the last field remains to be decoded, and
+fields can be validated (e.g. against the pydantic model of a tool, see
+`pydantic_field_validator`) while the rest is still streaming. The scan skips
+over string contents with a regex, so it is linear in the size of the
+arguments, and fast on large payloads such as code.
+
+Arguments that are not a JSON object, or not valid JSON (e.g. a Python
+literal, with single quotes), fall back to `parse_json_args` on the whole text.
+"""
+import ast
+import json
+import re
+from typing import Any, Callable, Dict, List, Optional, Type
+
+from pydantic import BaseModel, ValidationError
+
+# chars that matter outside strings
+_STRUCTURAL = re.compile(r'["{}\[\],]')
+# chars that matter inside strings
+_STRING_SPECIAL = re.compile(r'["\\]')
+_NON_WHITESPACE = re.compile(r"\S")
+
+# validates the value of a field: returns an error message, or None if valid
+FieldValidator = Callable[[str, Any], Optional[str]]
+
+
+def parse_json_args(text: str) -> Any:
+    """
+    Parse function-call arguments: as JSON, or else as a Python literal
+    (which some models emit, e.g. with single-quoted strings).
+    Args:
+        text: the arguments, as sent by the LLM
+    Returns:
+        the parsed arguments
+    Raises:
+        ValueError: if they are neither JSON nor a Python literal
+    """
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    try:
+        return ast.literal_eval(text.strip())
+    except (SyntaxError, ValueError) as e:
+        raise ValueError(f"Invalid function arguments: {text[:200]}") from e
+
+
+def pydantic_field_validator(model: Type[BaseModel]) -> FieldValidator:
+    """
+    Validator of the fields of a pydantic model, one at a time (fields not in
+    the model are left to the validation of the whole model).
+    """
+
+    def validate(name: str, value: Any) -> Optional[str]:
+        field = model.__fields__.get(name)
+        if field is None:
+            return None
+        _, error = field.validate(value, {}, loc=name, cls=model)
+        if error is None:
+            return None
+        return str(ValidationError([error], model))
+
+    return validate
+
+
+class StreamingJSONParser:
+    """
+    Incremental parser of a JSON object, fed by `feed`, and finished by
+    `close`. The decoded (and validated) top-level fields are in `fields`
+    (and any validation errors in `errors`) as soon as they are complete.
+    """
+
+    def __init__(self, validate: Optional[FieldValidator] = None):
+        """
+        Args:
+            validate: validator of each top-level field, as it completes
+        """
+        self.validate = validate
+        self.fields: Dict[str, Any] = {}
+        self.errors: Dict[str, str] = {}
+        self._raw: List[str] = []
+        self._parts: List[str] = []  # text of the current field, so far
+        self._members = 0  # top-level members seen (including empty ones)
+        self._started = False
+        self._object = True  # whether the text is a JSON object (so far)
+        self._failed = False  # whether incremental parsing gave up
+        self._done = False  # whether the object is closed
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    @property
+    def text(self) -> str:
+        """All the text fed so far."""
+        return "".join(self._raw)
+
+    @property
+    def incremental(self) -> bool:
+        """Whether the text is parsed incrementally (so far)."""
+        return self._object and not self._failed
+
+    def feed(self, delta: str) -> List[str]:
+        """
+        Consume the next piece of the text.
+        Args:
+            delta: the new text
+        Returns:
+            names of the fields completed by it
+        """
+        self._raw.append(delta)
+        completed: List[str] = []
+        if not self.incremental:
+            return completed
+        segment = 0  # start of the current field's text in `delta`
+        i, n = 0, len(delta)
+        while i < n:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    i += 1
+                    continue
+                match = _STRING_SPECIAL.search(delta, i)
+                if match is None:
+                    break
+                i = match.start()
+                if delta[i] == "\\":
+                    self._escape = True
+                else:
+                    self._in_string = False
+                i += 1
+                continue
+            if self._done:
+                # only whitespace may follow the object
+                self._failed = _NON_WHITESPACE.search(delta, i) is not None
+                return completed
+            if not self._started:
+                match = _NON_WHITESPACE.search(delta, i)
+                if match is None:
+                    break
+                i = match.start()
+                self._started = True
+                if delta[i] != "{":
+                    self._object = False
+                    return completed
+                self._depth = 1
+                segment = i + 1
+                i += 1
+                continue
+            match = _STRUCTURAL.search(delta, i)
+            if match is None:
+                break
+            i = match.start()
+            c = delta[i]
+            if c == '"':
+                self._in_string = True
+            elif c in "{[":
+                self._depth += 1
+            elif c in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._member(delta[segment:i], completed, closing=True)
+                    self._done = True
+            elif self._depth == 1:  # a comma between top-level fields
+                self._member(delta[segment:i], completed)
+                segment = i + 1
+            if self._failed:
+                return completed
+            i += 1
+        if self._started and not self._done:
+            self._parts.append(delta[segment:])
+        return completed
+
+    def _member(self, tail: str, completed: List[str], closing: bool = False) -> None:
+        """Decode (and validate) a complete top-level field."""
+        text = "".join(self._parts) + tail
+        self._parts = []
+        self._members += 1
+        if not text.strip():
+            # valid only as the (sole) member of an empty object
+            self._failed = not (closing and self._members == 1)
+            return
+        try:
+            member = json.loads("{" + text + "}")
+        except ValueError:
+            self._failed = True
+            return
+        for name, value in member.items():
+            self.fields[name] = value
+            if self.validate is not None:
+                error = self.validate(name, value)
+                if error is not None:
+                    self.errors[name] = error
+            completed.append(name)
+
+    def close(self) -> Any:
+        """
+        Finish parsing.
+        Returns:
+            the parsed value (the fields, if parsed incrementally)
+        Raises:
+            ValueError: if the text is neither JSON nor a Python literal
+        """
+        if self.incremental and self._done and not self._in_string:
+            return dict(self.fields)
+        return parse_json_args(self.text)
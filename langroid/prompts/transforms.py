@@ -1,9 +1,7 @@
-import asyncio
 from typing import List, Tuple
 
-import aiohttp
-
 from langroid.language_models.base import LanguageModel
+from langroid.language_models.utils import run_async
 from langroid.mytypes import Document
 from langroid.prompts.dialog import collate_chat_history
 from langroid.prompts.templates import EXTRACTION_PROMPT
@@ -17,10 +15,9 @@ async def get_verbatim_extract_async(
     """
     Asynchronously, get verbatim extract from passage that is relevant to a question.
     """
-    async with aiohttp.ClientSession():
-        templatized_prompt = EXTRACTION_PROMPT
-        final_prompt = templatized_prompt.format(question=question, content=passage)
-        final_extract = await LLM.agenerate(prompt=final_prompt, max_tokens=1024)
+    templatized_prompt = EXTRACTION_PROMPT
+    final_prompt = templatized_prompt.format(question=question, content=passage)
+    final_extract = await LLM.agenerate(prompt=final_prompt, max_tokens=1024)
 
     return final_extract.message.strip()
 
@@ -30,10 +27,10 @@ async def _get_verbatim_extracts(
     passages: List[Document],
     LLM: LanguageModel,
 ) -> List[Document]:
-    async with aiohttp.ClientSession():
-        verbatim_extracts = await asyncio.gather(
-            *(get_verbatim_extract_async(question, P, LLM) for P in passages)
-        )
+    prompts = [EXTRACTION_PROMPT.format(question=question, content=P) for P in passages]
+    # bounded concurrency and rate limits, see `LanguageModel.agenerate_batch`
+    responses = await LLM.agenerate_batch(prompts, max_tokens=1024)
+    verbatim_extracts = [r.message.strip() for r in responses]
     metadatas = [P.metadata for P in passages]
     # return with metadata so we can use it downstream, e.g. to cite sources
     return [
@@ -57,7 +54,7 @@ def get_verbatim_extracts(
         list of verbatim extracts (Documents) from passages that are relevant to
         question
     """
-    return asyncio.run(_get_verbatim_extracts(question, passages, LLM))
+    return run_async(_get_verbatim_extracts(question, passages, LLM))
 
 
 def followup_to_standalone(
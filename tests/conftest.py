@@ -13,7 +13,7 @@ def pytest_addoption(parser) -> None:
     parser.addoption("--nc", action="store_true", default=False, help="don't use cache")
     parser.addoption("--3", action="store_true", default=False, help="use GPT-3.5")
     parser.addoption("--ns", action="store_true", default=False, help="no streaming")
-    parser.addoption("--ct", default="redis", help="redis or momento")
+    parser.addoption("--ct", default="redis", help="redis, momento or sqlite")
     parser.addoption(
         "--nof",
         action="store_true",
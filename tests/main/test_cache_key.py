@@ -0,0 +1,65 @@
+import pytest
+
+from langroid.language_models.cache_key import cache_key, function_schema_hash
+
+MESSAGES = [
+    dict(role="system", content="You are a helpful assistant."),
+    dict(role="user", content="What is the capital of France?"),
+]
+
+FUNCTION = dict(
+    name="capital",
+    description="Get the capital of a country",
+    parameters=dict(type="object", properties=dict(country=dict(type="string"))),
+)
+
+
+@pytest.mark.unit
+def test_cache_key_ignores_irrelevant_args():
+    key = cache_key(
+        "ChatCompletion",
+        model="gpt-4",
+        messages=MESSAGES,
+        max_tokens=10,
+        request_timeout=20,
+        stream=False,
+    )
+    # order of kwargs, timeout and streaming do not matter
+    assert key == cache_key(
+        "ChatCompletion",
+        stream=True,
+        request_timeout=5,
+        max_tokens=10,
+        messages=MESSAGES,
+        model="gpt-4",
+    )
+    # but the model, messages, params, and kind of call do
+    assert key != cache_key(
+        "ChatCompletion", model="gpt-3.5-turbo", messages=MESSAGES, max_tokens=10
+    )
+    assert key != cache_key(
+        "ChatCompletion", model="gpt-4", messages=MESSAGES[1:], max_tokens=10
+    )
+    assert key != cache_key(
+        "ChatCompletion", model="gpt-4", messages=MESSAGES, max_tokens=11
+    )
+    assert key != cache_key(
+        "Completion", model="gpt-4", messages=MESSAGES, max_tokens=10
+    )
+
+
+@pytest.mark.unit
+def test_cache_key_function_specs():
+    reordered = dict(reversed(list(FUNCTION.items())))
+    assert function_schema_hash(FUNCTION) == function_schema_hash(reordered)
+    assert cache_key(
+        "ChatCompletion", messages=MESSAGES, functions=[FUNCTION]
+    ) == cache_key("ChatCompletion", messages=MESSAGES, functions=[reordered])
+    other = dict(FUNCTION, description="Get the capital city of a country")
+    assert cache_key(
+        "ChatCompletion", messages=MESSAGES, functions=[FUNCTION]
+    ) != cache_key("ChatCompletion", messages=MESSAGES, functions=[other])
+    # the order of the functions does not matter
+    assert cache_key(
+        "ChatCompletion", messages=MESSAGES, functions=[FUNCTION, other]
+    ) == cache_key("ChatCompletion", messages=MESSAGES, functions=[other, FUNCTION])
@@ -0,0 +1,100 @@
+import json
+
+import pytest
+
+from langroid.cachedb.record import RecordCodec, compact_response
+from langroid.cachedb.redis_cachedb import RedisCache, RedisCacheConfig
+
+CHAT_RESPONSE = {
+    "id": "chatcmpl-7abcdefghijklmnopqrstuvwxyz",
+    "object": "chat.completion",
+    "created": 1693000000,
+    "model": "gpt-4-0613",
+    "choices": [
+        {
+            "index": 0,
+            "message": {
+                "role": "assistant",
+                "content": None,
+                "function_call": {"name": "square", "arguments": '{"x": 3}'},
+            },
+            "finish_reason": "function_call",
+        }
+    ],
+    "usage": {"prompt_tokens": 50, "completion_tokens": 10, "total_tokens": 60},
+}
+
+
+@pytest.mark.unit
+def test_compact_response():
+    assert compact_response(CHAT_RESPONSE) == {
+        "choices": [
+            {
+                "message": {
+                    "role": "assistant",
+                    "content": None,
+                    "function_call": {"name": "square", "arguments": '{"x": 3}'},
+                }
+            }
+        ],
+        "usage": {"prompt_tokens": 50, "completion_tokens": 10, "total_tokens": 60},
+    }
+    completion = {"id": "cmpl-1", "choices": [{"text": "hi", "index": 0}]}
+    assert compact_response(completion) == {"choices": [{"text": "hi"}]}
+    # other values are stored as they are
+    assert compact_response({"info": "something"}) == {"info": "something"}
+
+
+@pytest.mark.unit
+def test_record_round_trip_and_legacy():
+    codec = RecordCodec()
+    record = codec.encode(CHAT_RESPONSE)
+    assert codec.decode(record) == compact_response(CHAT_RESPONSE)
+    # values stored before records existed are still readable
+    assert codec.decode(json.dumps(CHAT_RESPONSE).encode()) == CHAT_RESPONSE
+    assert codec.decode(json.dumps(CHAT_RESPONSE)) == CHAT_RESPONSE
+
+    stats = codec.stats()
+    assert stats["records"] == 1
+    assert stats["stored_bytes"] == len(record)
+    assert stats["legacy_bytes"] == len(json.dumps(CHAT_RESPONSE))
+    assert stats["saved_bytes"] > 0 and 0 < stats["saved_ratio"] < 1
+
+    # the legacy size is measured on a sample of the records only,
+    # and extrapolated to the others
+    codec = RecordCodec(legacy_sample_every=4)
+    for _ in range(8):
+        codec.encode(CHAT_RESPONSE)
+    assert codec.sampled_legacy_bytes == 2 * len(json.dumps(CHAT_RESPONSE))
+    assert codec.stats()["legacy_bytes"] == 8 * len(json.dumps(CHAT_RESPONSE))
+
+    # records of a later version are rejected, rather than misread
+    with pytest.raises(ValueError):
+        codec.decode(b"\x00L\x09\x00{}")
+
+
+@pytest.mark.unit
+def test_compressed_records():
+    zstandard = pytest.importorskip("zstandard")
+    value = {"info": "something " * 100}
+    record = RecordCodec(compress=True).encode(value)
+    assert len(record) < len(json.dumps(value)) / 10
+    # readable with compression turned off
+    assert RecordCodec().decode(record) == value
+    # as are zstd-compressed JSON values of the legacy SQLiteCache format
+    legacy = zstandard.ZstdCompressor().compress(json.dumps(value).encode())
+    assert RecordCodec().decode(legacy) == value
+
+
+@pytest.mark.unit
+def test_redis_records():
+    cache = RedisCache(RedisCacheConfig(fake=True))
+    cache.clear()
+    cache.store("chat", CHAT_RESPONSE)
+    assert cache.retrieve("chat") == compact_response(CHAT_RESPONSE)
+    cache.client.set("legacy", json.dumps(CHAT_RESPONSE))
+    assert cache.retrieve_many(["legacy", "chat"]) == [
+        CHAT_RESPONSE,
+        compact_response(CHAT_RESPONSE),
+    ]
+    assert cache.stats()["saved_bytes"] > 0
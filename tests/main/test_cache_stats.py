@@ -0,0 +1,126 @@
+import asyncio
+
+import openai
+import pytest
+from openai.openai_object import OpenAIObject
+
+from langroid.cachedb.record import encoded_size
+from langroid.cachedb.redis_cachedb import RedisCacheConfig
+from langroid.language_models import cache_stats as cache_stats_module
+from langroid.language_models.cache_stats import (
+    CacheStats,
+    all_cache_stats,
+    cache_stats_prometheus,
+)
+from langroid.language_models.openai_gpt import (
+    OpenAIChatModel,
+    OpenAIGPT,
+    OpenAIGPTConfig,
+)
+from langroid.utils.configuration import Settings, set_global
+
+
+@pytest.mark.unit
+def test_cache_stats_lazy_sizes(monkeypatch):
+    sized = []
+    monkeypatch.setattr(
+        cache_stats_module,
+        "encoded_size",
+        lambda r: sized.append(r) or encoded_size(r),
+    )
+    monkeypatch.setattr(cache_stats_module, "MAX_PENDING", 4)
+    response = dict(choices=[dict(message=dict(role="assistant", content="hi"))])
+    stats = CacheStats()
+    for _ in range(3):
+        stats.record_lookup("ChatCompletion", True, 0.001, response=response)
+        stats.record_store("ChatCompletion", response=response)
+    # responses are only sized when the counters are read, and beyond
+    # MAX_PENDING, estimated from the mean size of those sized
+    assert sized == []
+    chat = stats.dict()["ChatCompletion"]
+    assert len(sized) == 4
+    assert chat["bytes_read"] == chat["bytes_written"] == 3 * encoded_size(response)
+
+
+@pytest.mark.unit
+def test_cache_stats_dict_and_prometheus():
+    stats = CacheStats("my-llm")
+    stats.record_lookup("ChatCompletion", True, 0.002, bytes_read=100, cost_saved=0.5)
+    stats.record_lookup("ChatCompletion", False, 0.004)
+    stats.record_store("ChatCompletion", 120)
+    stats.record_lookup("AsyncChatCompletion", True, 0.001, cost_saved=0.25)
+    stats.record_coalesced("AsyncChatCompletion", cost_saved=0.25)
+
+    d = stats.dict()
+    chat = d["ChatCompletion"]
+    assert chat["lookups"] == 2 and chat["hits"] == 1 and chat["misses"] == 1
+    assert chat["hit_ratio"] == 0.5
+    assert chat["mean_lookup_time"] == pytest.approx(0.003)
+    assert chat["max_lookup_time"] == 0.004
+    assert chat["bytes_read"] == 100 and chat["bytes_written"] == 120
+    assert d["AsyncChatCompletion"]["coalesced"] == 1
+    assert d["total"]["lookups"] == 3
+    assert d["total"]["cost_saved"] == pytest.approx(1.0)
+
+    text = stats.prometheus()
+    assert "# TYPE langroid_llm_cache_hits_total counter" in text
+    assert (
+        'langroid_llm_cache_hits_total{llm="my-llm",call_type="ChatCompletion"} 1'
+        in text
+    )
+    assert (
+        "langroid_llm_cache_saved_dollars_total"
+        '{llm="my-llm",call_type="AsyncChatCompletion"} 0.5' in text
+    )
+    assert 'call_type="total"' not in text
+
+
+@pytest.mark.unit
+def test_llm_cache_stats(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy-key")
+    set_global(Settings(cache=True, stream=False))
+    llm = OpenAIGPT(
+        OpenAIGPTConfig(
+            stream=False,
+            chat_model=OpenAIChatModel.GPT3_5_TURBO,
+            cache_config=RedisCacheConfig(fake=True, namespace="test-cache-stats"),
+            memory_cache_config=None,
+        )
+    )
+    llm.cache.clear()
+
+    def create(**kwargs):
+        return OpenAIObject.construct_from(
+            dict(
+                id="chatcmpl-123",
+                choices=[dict(index=0, message=dict(role="assistant", content="hi"))],
+                usage=dict(
+                    prompt_tokens=1000, completion_tokens=1000, total_tokens=2000
+                ),
+            )
+        )
+
+    async def acreate(**kwargs):
+        return create(**kwargs)
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", create)
+    monkeypatch.setattr(openai.ChatCompletion, "acreate", acreate)
+
+    llm.chat("hello", 10)
+    llm.chat("hello", 10)
+    asyncio.run(llm.achat("hello", 10))
+    asyncio.run(llm.achat_batch(["hello", "bye"], 10))
+
+    stats = llm.cache_stats.dict()
+    chat, achat = stats["ChatCompletion"], stats["AsyncChatCompletion"]
+    assert (chat["lookups"], chat["hits"], chat["misses"]) == (2, 1, 1)
+    assert (achat["lookups"], achat["hits"], achat["misses"]) == (3, 2, 1)
+    assert chat["bytes_written"] > 0 and achat["bytes_written"] > 0
+    assert chat["bytes_read"] == chat["bytes_written"]
+    # each hit saves the cost of 1000 prompt and 1000 completion tokens
+    assert stats["total"]["cost_saved"] == pytest.approx(3 * (0.0015 + 0.002))
+
+    # the process-wide view includes this LLM
+    model = OpenAIChatModel.GPT3_5_TURBO.value
+    assert all_cache_stats()[model]["total"]["hits"] >= 3
+    assert f'llm="{model}",call_type="AsyncChatCompletion"' in cache_stats_prometheus()
@@ -0,0 +1,112 @@
+import asyncio
+import re
+
+import pytest
+
+from langroid.agent.chat_agent import ChatAgent, ChatAgentConfig
+from langroid.language_models.base import LanguageModel, LLMFunctionSpec
+from langroid.language_models.cascade import CascadeConfig, CascadeLM
+from langroid.language_models.mock_lm import MockLMConfig, MockResponse
+from langroid.utils.configuration import Settings, set_global
+from langroid.utils.constants import NO_ANSWER
+
+CHEAP = MockLMConfig(
+    chat_model="cheap",
+    context_length={"cheap": 4096},
+    cost_per_1k_tokens={"cheap": (1.0, 1.0)},
+    responses=[
+        MockResponse(match="hard", content=NO_ANSWER),
+        MockResponse(match="tool", content='{"request": "square", "x": }'),
+        MockResponse(match="long", content="word " * 50),
+        MockResponse(match="empty", content=""),
+        "cheap: $message",
+    ],
+)
+EXPENSIVE = MockLMConfig(
+    chat_model="expensive",
+    context_length={"expensive": 8192},
+    cost_per_1k_tokens={"expensive": (10.0, 10.0)},
+    responses=["expensive: $message"],
+)
+
+
+@pytest.mark.unit
+def test_cascade():
+    llm = LanguageModel.create(CascadeConfig(tiers=[CHEAP, EXPENSIVE]))
+    assert isinstance(llm, CascadeLM)
+    assert llm.chat_context_length() == 4096
+
+    assert llm.chat("easy", 100).message == "cheap: easy"
+    # escalated: NO_ANSWER, a tool message that does not parse,
+    # a truncated or an empty response
+    for message in ["hard", "tool", "long", "empty"]:
+        assert llm.chat(message, 20).message == f"expensive: {message}"
+    assert asyncio.run(llm.achat("easy", 100)).message == "cheap: easy"
+    assert llm.generate("hard", 100).message == "expensive: hard"
+
+    stats = llm.stats.dict()
+    assert stats["calls"] == 7
+    cheap, expensive = stats["tiers"]["0:cheap"], stats["tiers"]["1:expensive"]
+    assert (cheap["attempts"], cheap["served"]) == (7, 2)
+    assert expensive["served"] == 5 and expensive["share"] == 5 / 7
+    assert cheap["escalations"] == dict(no_answer=2, parse_failure=1, length=2)
+    assert cheap["cost"] > 0 and expensive["cost"] > cheap["cost"]
+
+    # the usage of an escalated call includes that of all tiers tried
+    response = llm.chat("hard", 100)
+    assert response.usage.cost > EXPENSIVE.cost_per_1k_tokens["expensive"][0] / 1000
+
+
+@pytest.mark.unit
+def test_cascade_checks():
+    fun = LLMFunctionSpec(name="square", description="square", parameters={})
+    llm = CascadeLM(
+        CascadeConfig(tiers=[CHEAP, EXPENSIVE], checks=["no_answer"]),
+        # custom check
+        checks=dict(custom=lambda request, response: "custom" in response.message),
+    )
+    # only the selected (and custom) checks apply
+    assert llm.chat("empty", 100).message == ""
+    assert llm.chat("hard", 100).message == "expensive: hard"
+    assert llm.chat("custom", 100).message == "expensive: custom"
+    assert llm.stats.dict()["tiers"]["0:cheap"]["escalations"]["custom"] == 1
+    # a required function call that is missing
+    llm = CascadeLM(CascadeConfig(tiers=[CHEAP, EXPENSIVE]))
+    response = llm.chat("easy", 100, [fun], function_call={"name": "square"})
+    assert response.message == "expensive: easy"
+
+
+@pytest.mark.unit
+def test_cascade_agent():
+    set_global(Settings(cache=False, stream=False))
+    agent = ChatAgent(
+        ChatAgentConfig(llm=CascadeConfig(tiers=[CHEAP, EXPENSIVE]), vecdb=None)
+    )
+    assert agent.llm_response("easy").content == "cheap: easy"
+    assert agent.llm_response("hard").content == "expensive: hard"
+
+
+@pytest.mark.unit
+def test_cascade_agent_stream(capsys):
+    set_global(Settings(cache=False, stream=True))
+    tiers = [c.copy(update=dict(stream=True)) for c in [CHEAP, EXPENSIVE]]
+    agent = ChatAgent(ChatAgentConfig(llm=CascadeConfig(tiers=tiers), vecdb=None))
+    assert agent.llm.get_stream()
+
+    # served by the cheap tier, which does not stream: displayed by the agent,
+    # and costed at the rate of the cheap tier
+    response = agent.llm_response("easy")
+    assert response.content == "cheap: easy"
+    assert response.metadata.displayed
+    assert "cheap: easy" in capsys.readouterr().out
+    cost = response.metadata.usage.cost
+    assert cost > 0 and agent.total_llm_token_cost == cost
+    usage = response.metadata.usage
+    assert cost == (usage.prompt_tokens + usage.completion_tokens) / 1000
+
+    # escalated to the last tier, which streams it "live" (just once)
+    response = agent.llm_response("hard")
+    assert response.content == "expensive: hard"
+    assert not response.metadata.displayed
+    out = re.sub(r"\x1b\[[0-9;]*m", "", capsys.readouterr().out)
+    assert out.count("expensive: hard") == 1
@@ -0,0 +1,121 @@
+import asyncio
+import time
+
+import openai
+import pytest
+from openai.openai_object import OpenAIObject
+
+from langroid.embedding_models.models import OpenAIEmbeddings, OpenAIEmbeddingsConfig
+from langroid.language_models.cassette import CassetteMiss, use_cassette
+from langroid.language_models.openai_gpt import OpenAIGPT, OpenAIGPTConfig
+from langroid.utils.configuration import Settings, set_global
+
+
+def _chunk(delta, finish_reason=None):
+    return OpenAIObject.construct_from(
+        dict(choices=[dict(index=0, delta=delta, finish_reason=finish_reason)])
+    )
+
+
+def create(**kwargs):
+    question = kwargs["messages"][-1]["content"]
+    if kwargs.get("stream"):
+        time.sleep(0.05)
+        return iter(
+            [
+                _chunk(dict(role="assistant", content="streamed ")),
+                _chunk(dict(content=question)),
+                _chunk({}, "stop"),
+            ]
+        )
+    time.sleep(0.05)
+    return OpenAIObject.construct_from(
+        dict(
+            choices=[
+                dict(index=0, message=dict(role="assistant", content="re: " + question))
+            ],
+            usage=dict(prompt_tokens=5, completion_tokens=5, total_tokens=10),
+        )
+    )
+
+
+async def acreate(**kwargs):
+    return create(**kwargs)
+
+
+def embed(**kwargs):
+    return OpenAIObject.construct_from(
+        dict(data=[dict(embedding=[float(len(t)), 1.0]) for t in kwargs["input"]])
+    )
+
+
+def fail(**kwargs):
+    raise AssertionError("API called in replay mode")
+
+
+async def afail(**kwargs):
+    fail()
+
+
+@pytest.mark.unit
+def test_record_replay(monkeypatch, tmp_path):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy-key")
+    set_global(Settings(cache=False, stream=False))
+    path = str(tmp_path / "cassette.jsonl")
+    llm = OpenAIGPT(OpenAIGPTConfig(stream=False))
+    streaming_llm = OpenAIGPT(OpenAIGPTConfig(stream=True))
+    embed_fn = OpenAIEmbeddings(OpenAIEmbeddingsConfig()).embedding_fn()
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", create)
+    monkeypatch.setattr(openai.ChatCompletion, "acreate", acreate)
+    monkeypatch.setattr(openai.Embedding, "create", embed)
+    with use_cassette(path, "record") as cassette:
+        recorded = [
+            llm.chat("hello", 10).message,
+            asyncio.run(llm.achat("bye", 10)).message,
+            streaming_llm.chat("again", 10).message,
+            embed_fn(["a", "bb"]),
+        ]
+    assert recorded[0] == "re: hello" and recorded[2] == "streamed again"
+    assert cassette.stats()["recorded"] == 4
+    assert cassette.stats()["api_time"] >= 0.15
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", fail)
+    monkeypatch.setattr(openai.ChatCompletion, "acreate", afail)
+    monkeypatch.setattr(openai.Embedding, "create", fail)
+    with use_cassette(path, "replay") as cassette:
+        start = time.time()
+        replayed = [
+            llm.chat("hello", 10).message,
+            asyncio.run(llm.achat("bye", 10)).message,
+            streaming_llm.chat("again", 10).message,
+            embed_fn(["a", "bb"]),
+        ]
+        assert time.time() - start < 0.1
+        with pytest.raises(CassetteMiss):
+            llm._api_call(
+                "ChatCompletion",
+                dict(model="gpt-4", messages=[dict(role="user", content="new")]),
+                10,
+            )
+    assert replayed == recorded
+    assert cassette.stats()["replayed"] == 4
+
+    # replaying needs no API key
+    monkeypatch.delenv("OPENAI_API_KEY")
+    monkeypatch.setattr("langroid.language_models.openai_gpt.load_dotenv", lambda: None)
+    monkeypatch.setattr("langroid.embedding_models.models.load_dotenv", lambda: None)
+    with pytest.raises(ValueError):
+        OpenAIGPT(OpenAIGPTConfig(stream=False))
+    with use_cassette(path, "replay"):
+        offline = OpenAIGPT(OpenAIGPTConfig(stream=False))
+        assert offline.chat("hello", 10).message == "re: hello"
+        offline_embed_fn = OpenAIEmbeddings(OpenAIEmbeddingsConfig()).embedding_fn()
+        assert offline_embed_fn(["a", "bb"]) == recorded[3]
+
+    # with simulated latency, replays take about as long as the recorded calls
+    with use_cassette(path, "replay", simulate_latency=True) as cassette:
+        start = time.time()
+        assert llm.chat("hello", 10).message == "re: hello"
+        assert streaming_llm.chat("again", 10).message == "streamed again"
+        assert time.time() - start >= 0.1
@@ -1,3 +1,5 @@
+import asyncio
+
 from langroid.agent.base import NO_ANSWER
 from langroid.agent.chat_agent import ChatAgent, ChatAgentConfig
 from langroid.agent.task import Task
@@ -150,3 +152,19 @@ def test_task(test_settings: Settings):
 
     assert task.pending_message.metadata.sender == Entity.LLM
     assert "London" in task.pending_message.content
+
+
+def test_chat_agent_async(test_settings: Settings):
+    set_global(test_settings)
+    cfg = _TestChatAgentConfig()
+    agent = ChatAgent(cfg)
+
+    async def converse():
+        response = await agent.llm_response_async("what is the capital of France?")
+        assert "Paris" in response.content
+        response = await agent.llm_response_async("what about England?")
+        assert "London" in response.content
+
+    asyncio.run(converse())
+    # both rounds are recorded in the history, after the 2 task messages
+    assert len(agent.message_history) == 6
@@ -0,0 +1,162 @@
+import pytest
+
+from langroid.agent.chat_agent import ChatAgent, ChatAgentConfig
+from langroid.language_models.base import LLMFunctionCall, LLMFunctionSpec, LLMMessage
+from langroid.language_models.chat_tokens import ChatTokenEstimator, format_functions
+from langroid.language_models.mock_lm import MockLM, MockLMConfig
+
+# example from the OpenAI cookbook ("How to count tokens with tiktoken"),
+# with the prompt tokens reported by the API
+MESSAGES = [
+    dict(
+        role="system",
+        content="You are a helpful, pattern-following assistant that translates "
+        "corporate jargon into plain English.",
+    ),
+    dict(
+        role="system",
+        name="example_user",
+        content="New synergies will help drive top-line growth.",
+    ),
+    dict(
+        role="system",
+        name="example_assistant",
+        content="Things working well together will increase revenue.",
+    ),
+    dict(
+        role="system",
+        name="example_user",
+        content="Let's circle back when we have more time to touch base on "
+        "opportunities for increased leverage.",
+    ),
+    dict(
+        role="system",
+        name="example_assistant",
+        content="Let's talk later when we're less busy about how to do better.",
+    ),
+    dict(
+        role="user",
+        content="This late pivot means we don't have time to boil the ocean for "
+        "the client deliverable.",
+    ),
+]
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    "model, tokens",
+    [("gpt-3.5-turbo-0301", 127), ("gpt-3.5-turbo-0613", 129), ("gpt-4", 129)],
+)
+def test_prompt_tokens(model, tokens):
+    messages = [LLMMessage(**m) for m in MESSAGES]
+    assert ChatTokenEstimator(model).prompt_tokens(messages) == tokens
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    "name, description, properties, tokens",
+    [
+        ("foo", "", {}, 31),
+        ("foo", "Do a foo", {}, 36),
+        ("bing_bong", "Do a bing bong", {"foo": {"type": "string"}}, 49),
+    ],
+)
+def test_functions_tokens(name, description, properties, tokens):
+    estimator = ChatTokenEstimator("gpt-4")
+    spec = LLMFunctionSpec(
+        name=name,
+        description=description,
+        parameters={"type": "object", "properties": properties},
+    )
+    messages = [LLMMessage(role="user", content="hello")]
+    assert estimator.prompt_tokens(messages, [spec]) == tokens
+
+
+@pytest.mark.unit
+def test_format_functions():
+    spec = LLMFunctionSpec(
+        name="square",
+        description="Square a number",
+        parameters={
+            "type": "object",
+            "properties": {
+                "x": {"type": "number", "description": "the number"},
+                "unit": {"type": "string", "enum": ["m", "cm"]},
+                "tags": {"type": "array", "items": {"type": "string"}},
+            },
+            "required": ["x"],
+        },
+    )
+    assert format_functions([spec]) == "\n".join(
+        [
+            "namespace functions {",
+            "",
+            "// Square a number",
+            "type square = (_: {",
+            "// the number",
+            "x: number,",
+            'unit?: "m" | "cm",',
+            "tags?: string[],",
+            "}) => any;",
+            "",
+            "} // namespace functions",
+        ]
+    )
+
+
+@pytest.mark.unit
+def test_message_framing():
+    estimator = ChatTokenEstimator("gpt-4")
+    plain = LLMMessage(role="assistant", content="")
+    call = LLMMessage(
+        role="assistant",
+        content="",
+        function_call=LLMFunctionCall(name="square", arguments={"x": 3}),
+    )
+    # function name, JSON args, and their framing are counted
+    assert estimator.message_tokens(call) == (
+        estimator.message_tokens(plain)
+        + estimator.text_tokens("square")
+        + estimator.text_tokens('{"x": 3}')
+        + 3
+    )
+
+
+MOCK_GPT4 = MockLMConfig(
+    chat_model="gpt-4",
+    context_length={"gpt-4": 8192},
+    cost_per_1k_tokens={"gpt-4": (0.03, 0.06)},
+    responses=["ok"],
+)
+
+
+@pytest.mark.unit
+def test_estimate_tokens_with_functions():
+    llm = MockLM(MOCK_GPT4.copy())
+    spec = LLMFunctionSpec(
+        name="bing_bong",
+        description="Do a bing bong",
+        parameters={"type": "object", "properties": {"foo": {"type": "string"}}},
+    )
+    messages = [LLMMessage(role="user", content="hello")]
+    # the functions schema is part of the prompt
+    assert llm.estimate_tokens(messages, 10, [spec]) == 49 + 10
+    assert llm.estimate_tokens(messages, 0) < 49
+    response = llm.chat(messages, 10, [spec])
+    assert response.usage.prompt_tokens == 49
+
+
+@pytest.mark.unit
+def test_agent_usage_from_packed_prompt_tokens(monkeypatch):
+    agent = ChatAgent(ChatAgentConfig(llm=MOCK_GPT4.copy(), vecdb=None))
+    seen = []
+    update_token_usage = agent.update_token_usage
+
+    def update(response, prompt, stream, prompt_tokens=None):
+        seen.append(prompt_tokens)
+        update_token_usage(response, prompt, stream, prompt_tokens)
+
+    monkeypatch.setattr(agent, "update_token_usage", update)
+    agent.llm_response("hello")
+    # the prompt tokens counted when packing the history are passed on
+    assert seen == [agent.llm.estimate_tokens(agent.message_history[:-1], 0)]
@@ -0,0 +1,134 @@
+import pytest
+
+from langroid.agent.chat_agent import ChatAgent, ChatAgentConfig
+from langroid.agent.context_packing import (
+    ContextPacker,
+    ContextPackingConfig,
+    PackingPolicy,
+)
+from langroid.language_models.base import LLMMessage, Role
+from langroid.language_models.chat_tokens import ChatTokenEstimator
+from langroid.language_models.mock_lm import MockLMConfig
+from langroid.utils.configuration import Settings, set_global
+
+
+def _messages(n: int):
+    # each message is 10 "tokens" (words)
+    return [LLMMessage(role=Role.SYSTEM, content="sys " * 10)] + [
+        LLMMessage(role=Role.USER, content=f"m{i} " * 10) for i in range(1, n)
+    ]
+
+
+def _count(message: LLMMessage) -> int:
+    return len(message.content.split())
+
+
+@pytest.mark.unit
+def test_pack_drop():
+    calls = []
+
+    def count(message: LLMMessage) -> int:
+        calls.append(message)
+        return _count(message)
+
+    packer = ContextPacker(ContextPackingConfig(), count)
+    messages = _messages(10)
+
+    # fits: all kept, with the max output length
+    packed = packer.pack(messages, 200, 50, 10)
+    assert packed.messages == messages and packed.output_len == 50
+    assert packed.dropped == [] and packed.tokens == 100
+    # output shortened to fit
+    assert packer.pack(messages, 130, 50, 10).output_len == 30
+    # with the total known, messages are only counted when some must go
+    calls.clear()
+    assert packer.pack(messages, 130, 50, 10, total=100).output_len == 30
+    assert calls == []
+    # oldest unpinned messages dropped, leaving room for min output
+    packed = packer.pack(messages, 75, 50, 10, pinned=2)
+    assert packed.dropped == [2, 3, 4, 5]
+    assert packed.messages == messages[:2] + messages[6:]
+    assert (packed.tokens, packed.output_len) == (60, 15)
+
+    with pytest.raises(ValueError):
+        packer.pack(messages, 25, 10, 10, pinned=2)
+
+
+@pytest.mark.unit
+def test_pack_summarize():
+    summarized = []
+
+    def summarize(messages, max_tokens):
+        summarized.extend(messages)
+        return "short"
+
+    packer = ContextPacker(
+        ContextPackingConfig(policy=PackingPolicy.SUMMARIZE, summary_tokens=5),
+        _count,
+        summarize,
+    )
+    messages = _messages(10)
+    packed = packer.pack(messages, 85, 50, 10, pinned=1)
+    # room is kept for the summary (5 tokens + the header)
+    assert packed.dropped == [1, 2, 3, 4]
+    assert summarized == messages[1:5]
+    assert packed.summary is not None and packed.summary.content.endswith("short")
+    assert packed.messages == [messages[0], packed.summary] + messages[5:]
+    assert packed.tokens <= 75
+
+
+@pytest.mark.unit
+def test_chat_agent_packing():
+    set_global(Settings(cache=False, stream=False))
+    agent = ChatAgent(
+        ChatAgentConfig(
+            llm=MockLMConfig(
+                responses=["ok"],
+                context_length={"mock": 200},
+                max_output_tokens=50,
+                min_output_tokens=20,
+            ),
+            vecdb=None,
+        )
+    )
+    message = "hello " * 30
+    for _ in range(6):
+        agent.llm_response(message)
+        packing = agent.last_packing
+        assert packing.tokens + packing.output_len <= 200
+        # the system message is never left out
+        assert packing.messages[0].role == Role.SYSTEM
+    assert len(packing.dropped) > 0
+    assert packing.dropped[0] == 1
+
+
+@pytest.mark.unit
+def test_message_token_cache():
+    set_global(Settings(cache=False, stream=False))
+    agent = ChatAgent(ChatAgentConfig(llm=MockLMConfig(responses=["ok"]), vecdb=None))
+    parser = agent.token_estimator.parser
+    calls = []
+    num_tokens = parser.num_tokens
+
+    def counting_num_tokens(text: str) -> int:
+        calls.append(text)
+        return num_tokens(text)
+
+    def fresh_total() -> int:
+        # counted from scratch, on copies without cached counts
+        messages = [LLMMessage(**m.dict()) for m in agent.message_history]
+        return sum(ChatTokenEstimator("mock").message_tokens(m) for m in messages)
+
+    parser.num_tokens = counting_num_tokens
+    agent.llm_response("hello there")
+    agent.llm_response("and again")
+    assert agent.chat_num_tokens() == fresh_total()
+    # each content was tokenized once, however often the history was counted
+    contents = [m.content for m in agent.message_history]
+    assert sorted(c for c in calls if c in contents) == sorted(contents)
+
+    agent.update_last_message("a much longer message than before", role=Role.USER)
+    agent.augment_system_message("Be brief.")
+    assert agent.chat_num_tokens() == fresh_total()
+    agent.clear_history(-2)
+    assert agent.chat_num_tokens() == fresh_total()
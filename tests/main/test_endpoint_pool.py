@@ -0,0 +1,125 @@
+import asyncio
+import threading
+
+import openai
+import pytest
+from openai.openai_object import OpenAIObject
+
+from langroid.language_models.base import LanguageModel
+from langroid.language_models.endpoint_pool import (
+    EndpointConfig,
+    EndpointPool,
+    EndpointPoolConfig,
+    endpoint_stats,
+)
+from langroid.language_models.openai_gpt import OpenAIGPT, OpenAIGPTConfig
+from langroid.utils.configuration import Settings, set_global
+
+
+def _pool(*endpoints: EndpointConfig, **kwargs) -> EndpointPool:
+    return EndpointPool(EndpointPoolConfig(endpoints=list(endpoints), **kwargs))
+
+
+@pytest.mark.unit
+def test_weighted_least_outstanding():
+    pool = _pool(
+        EndpointConfig(name="w-a", weight=2),
+        EndpointConfig(name="w-b"),
+    )
+    served = [pool.call(lambda e: e.name) for _ in range(6)]
+    assert served.count("w-a") == 4 and served.count("w-b") == 2
+
+    # a call in progress on "w-a" sends the next ones elsewhere
+    started, release = threading.Event(), threading.Event()
+
+    def slow(e):
+        started.set()
+        release.wait(5)
+        return e.name
+
+    pool = _pool(EndpointConfig(name="o-a"), EndpointConfig(name="o-b"))
+    thread = threading.Thread(target=pool.call, args=(slow,))
+    thread.start()
+    started.wait(5)
+    assert pool.call(lambda e: e.name) == "o-b"
+    release.set()
+    thread.join()
+
+
+@pytest.mark.unit
+def test_failover_and_ejection():
+    pool = _pool(
+        EndpointConfig(name="f-bad", weight=10),
+        EndpointConfig(name="f-good"),
+        eject_after=2,
+    )
+
+    def call(e):
+        if e.name == "f-bad":
+            raise openai.error.ServiceUnavailableError("down")
+        return e.name
+
+    # the failing endpoint is tried first (by weight), then ejected
+    assert pool.call(call) == "f-good"
+    assert pool.call(call) == "f-good"
+    assert endpoint_stats()["f-bad"]["healthy"] == 0
+    tried = []
+    assert pool.call(lambda e: tried.append(e.name) or e.name) == "f-good"
+    assert tried == ["f-good"]
+
+    # errors that are the request's fault are raised, without failover
+    def invalid(e):
+        tried.append(e.name)
+        raise openai.error.InvalidRequestError("bad request", None)
+
+    tried.clear()
+    with pytest.raises(openai.error.InvalidRequestError):
+        pool.call(invalid)
+    assert tried == ["f-good"]
+    assert endpoint_stats()["f-good"]["errors"] == 0
+
+    # if all endpoints fail, the last error is raised
+    async def down(e):
+        raise openai.error.APIError("down")
+
+    with pytest.raises(openai.error.APIError):
+        asyncio.run(pool.acall(down))
+
+
+@pytest.mark.unit
+def test_openai_endpoints(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "")
+    set_global(Settings(cache=False, stream=False))
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        if kwargs["api_key"] == "key-1":
+            raise openai.error.RateLimitError("quota exceeded")
+        return OpenAIObject.construct_from(
+            dict(
+                choices=[dict(index=0, message=dict(role="assistant", content="ok"))],
+                usage=dict(prompt_tokens=5, completion_tokens=1, total_tokens=6),
+            )
+        )
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", create)
+    llm = LanguageModel.create(
+        OpenAIGPTConfig(stream=False),
+        endpoints=[
+            EndpointConfig(name="e-openai", api_key="key-1", weight=2),
+            EndpointConfig(
+                name="e-azure",
+                api_key="key-2",
+                api_type="azure",
+                api_base="https://example.openai.azure.com",
+                deployment_name="gpt4-deployment",
+            ),
+        ],
+    )
+    assert isinstance(llm, OpenAIGPT) and llm.endpoint_pool is not None
+    assert llm.chat("hello", 10).message == "ok"
+    assert [c["api_key"] for c in calls] == ["key-1", "key-2"]
+    assert "model" in calls[0] and "engine" not in calls[0]
+    assert calls[1]["engine"] == "gpt4-deployment" and "model" not in calls[1]
+    assert calls[1]["api_type"] == "azure"
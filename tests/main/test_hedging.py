@@ -0,0 +1,146 @@
+import asyncio
+import threading
+import time
+
+import openai
+import pytest
+from openai.openai_object import OpenAIObject
+
+from langroid.language_models.hedging import HedgeBudget, Hedger, HedgingConfig
+from langroid.language_models.openai_gpt import OpenAIGPT, OpenAIGPTConfig
+from langroid.utils.configuration import Settings, set_global
+
+CONFIG = HedgingConfig(min_samples=5, max_extra_ratio=1.0, burst=5)
+
+
+class SlowFirst:
+    """A call that is slow (and optionally fails) the first time only."""
+
+    def __init__(self, slow: float = 1.0, fail: bool = False):
+        self.slow = slow
+        self.fail = fail
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def first(self) -> bool:
+        with self.lock:
+            self.calls += 1
+            return self.calls == 1
+
+    def __call__(self) -> str:
+        if self.first():
+            time.sleep(self.slow)
+            if self.fail:
+                raise ValueError("failed")
+            return "slow"
+        time.sleep(0.01)
+        return "fast"
+
+
+def _warm_up(hedger: Hedger) -> None:
+    for _ in range(5):
+        hedger.call(lambda: time.sleep(0.01))
+
+
+@pytest.mark.unit
+def test_hedged_call():
+    hedger = Hedger(CONFIG, HedgeBudget())
+    assert hedger.delay() is None
+    _warm_up(hedger)
+    assert hedger.delay() is not None
+
+    start = time.time()
+    assert hedger.call(SlowFirst()) == "fast"
+    assert time.time() - start < 0.5
+    stats = hedger.stats.dict()
+    assert (stats["calls"], stats["hedged"], stats["hedge_wins"]) == (6, 1, 1)
+    assert stats["saved_seconds"] >= 0
+
+    # a failed call is covered by the hedge
+    assert hedger.call(SlowFirst(slow=0.2, fail=True)) == "fast"
+
+    # ... but if all calls fail, the error is raised
+    def fail() -> str:
+        time.sleep(0.2)
+        raise ValueError("failed")
+
+    with pytest.raises(ValueError):
+        hedger.call(fail)
+
+
+@pytest.mark.unit
+def test_hedge_budget():
+    # no allowance for extra requests: the slow call is not hedged
+    hedger = Hedger(CONFIG.copy(update=dict(max_extra_ratio=0.0)), HedgeBudget())
+    _warm_up(hedger)
+    assert hedger.call(SlowFirst(slow=0.2)) == "slow"
+    stats = hedger.stats.dict()
+    assert (stats["hedged"], stats["denied"]) == (0, 1)
+
+    # each request earns a fraction of a hedge
+    budget = HedgeBudget()
+    for _ in range(3):
+        budget.earn(0.25, 10)
+    assert not budget.spend()
+    budget.earn(0.25, 10)
+    assert budget.spend() and not budget.spend()
+
+
+@pytest.mark.unit
+def test_hedged_acall():
+    hedger = Hedger(CONFIG, HedgeBudget())
+    cancelled = []
+    calls = []
+
+    async def call() -> str:
+        calls.append(1)
+        if len(calls) == 6:
+            try:
+                await asyncio.sleep(1.0)
+            except asyncio.CancelledError:
+                cancelled.append(1)
+                raise
+            return "slow"
+        await asyncio.sleep(0.01)
+        return "fast"
+
+    async def run() -> None:
+        for _ in range(5):
+            await hedger.acall(call)
+        start = time.time()
+        assert await hedger.acall(call) == "fast"
+        assert time.time() - start < 0.5
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    # the slower call is cancelled
+    assert cancelled == [1]
+    assert hedger.stats.dict()["hedge_wins"] == 1
+
+
+@pytest.mark.unit
+def test_openai_hedging(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy-key")
+    set_global(Settings(cache=False, stream=False))
+    slow = SlowFirst()
+
+    def create(**kwargs):
+        latency = 0.01
+        if kwargs["messages"][-1]["content"] == "slow":
+            latency = 1.0 if slow.first() else 0.01
+        time.sleep(latency)
+        return OpenAIObject.construct_from(
+            dict(
+                choices=[dict(index=0, message=dict(role="assistant", content="ok"))],
+                usage=dict(prompt_tokens=5, completion_tokens=1, total_tokens=6),
+            )
+        )
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", create)
+    llm = OpenAIGPT(OpenAIGPTConfig(stream=False, hedging=CONFIG))
+    for _ in range(5):
+        llm.chat("hello", 10)
+    start = time.time()
+    assert llm.chat("slow", 10).message == "ok"
+    assert time.time() - start < 0.5
+    assert llm.hedger is not None and llm.hedger.stats.dict()["hedge_wins"] == 1
@@ -1,3 +1,5 @@
+import asyncio
+
 import openai
 import pytest
 
@@ -79,6 +81,18 @@ def test_openai_gpt(test_settings: Settings, streaming, country, capital):
     assert capital in response.message
     assert response.cached
 
+    # async chat mode
+    set_global(Settings(cache=False))
+    response = asyncio.run(mdl.achat(messages=messages, max_tokens=10))
+    assert capital in response.message
+    assert not response.cached
+
+    # batch chat mode: results come back in input order
+    questions = [question, "What is the capital of Japan?"]
+    responses = mdl.chat_batch(questions, max_tokens=10, max_concurrent=1)
+    assert capital in responses[0].message
+    assert "Tokyo" in responses[1].message
+
 
 @pytest.mark.parametrize(
     "mode, max_tokens",
@@ -0,0 +1,101 @@
+import openai
+import pytest
+from openai.openai_object import OpenAIObject
+
+from langroid.cachedb.lru_cachedb import LRUCacheConfig
+from langroid.cachedb.redis_cachedb import RedisCacheConfig
+from langroid.language_models.openai_gpt import OpenAIGPT, OpenAIGPTConfig
+from langroid.utils.configuration import Settings, set_global
+from langroid.utils.constants import NO_ANSWER
+
+
+@pytest.fixture
+def llm(monkeypatch) -> OpenAIGPT:
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy-key")
+    llm = OpenAIGPT(
+        OpenAIGPTConfig(stream=False, cache_config=RedisCacheConfig(fake=True))
+    )
+    llm.cache.clear()
+    return llm
+
+
+def _patch_api(monkeypatch, calls):
+    def create(**kwargs):
+        question = kwargs["messages"][-1]["content"]
+        calls.append(question)
+        if "fail" in question:
+            raise openai.error.InvalidRequestError("bad request", param=None)
+        return OpenAIObject.construct_from(
+            dict(
+                choices=[
+                    dict(message=dict(role="assistant", content="A: " + question))
+                ],
+                usage=dict(prompt_tokens=10, completion_tokens=5, total_tokens=15),
+            )
+        )
+
+    async def acreate(**kwargs):
+        return create(**kwargs)
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", create)
+    monkeypatch.setattr(openai.ChatCompletion, "acreate", acreate)
+
+
+@pytest.mark.unit
+def test_chat_batch_cache_round_trips(monkeypatch):
+    set_global(Settings(cache=True, stream=False))
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy-key")
+    llm = OpenAIGPT(
+        OpenAIGPTConfig(
+            stream=False,
+            cache_config=RedisCacheConfig(fake=True),
+            memory_cache_config=LRUCacheConfig(name="test_chat_batch"),
+        )
+    )
+    llm.cache.clear()
+    calls = []
+    _patch_api(monkeypatch, calls)
+
+    # count round-trips to the cache backend
+    backend = llm.cache.backend
+    lookups, writes = [], []
+    retrieve_many, store_many = backend.retrieve_many, backend.store_many
+    monkeypatch.setattr(
+        backend,
+        "retrieve_many",
+        lambda keys: lookups.append(keys) or retrieve_many(keys),
+    )
+    monkeypatch.setattr(
+        backend, "store_many", lambda items: writes.append(items) or store_many(items)
+    )
+
+    llm.chat("q0", max_tokens=10)  # cached before the batch
+    assert calls == ["q0"]
+
+    questions = [f"q{i}" for i in range(5)] + ["fail"]
+    responses = llm.chat_batch(questions, max_tokens=10, max_concurrent=3)
+    assert [r.message for r in responses[:5]] == [f"A: q{i}" for i in range(5)]
+    assert responses[5].message == NO_ANSWER
+    assert [r.cached for r in responses[:5]] == [True] + [False] * 4
+    assert responses[1].usage.prompt_tokens == 10
+    # q0 was not sent again; the failed call is not cached
+    assert sorted(calls[1:]) == ["fail", "q1", "q2", "q3", "q4"]
+    # q0 came from the memory tier; the others in one backend lookup and write
+    assert len(lookups) == 1 and len(lookups[0]) == 5
+    assert len(writes) == 1 and len(writes[0]) == 4
+
+    # second time around, all from the (memory) cache
+    responses = llm.chat_batch(questions[:5], max_tokens=10)
+    assert all(r.cached for r in responses)
+    assert len(calls) == 6
+
+
+@pytest.mark.unit
+def test_batch_usage_when_streaming(llm, monkeypatch):
+    set_global(Settings(cache=False, stream=True))
+    llm.config.stream = True
+    _patch_api(monkeypatch, [])
+    # batched calls are not streamed, so their usage comes from the API
+    responses = llm.chat_batch(["q1", "q2"], max_tokens=10)
+    assert [r.usage.prompt_tokens for r in responses] == [10, 10]
+    assert all(r.usage.cost > 0 for r in responses)
@@ -0,0 +1,159 @@
+import asyncio
+import json
+
+import openai
+import pytest
+from openai.openai_object import OpenAIObject
+
+from langroid.agent.chat_agent import ChatAgent, ChatAgentConfig
+from langroid.cachedb.redis_cachedb import RedisCacheConfig
+from langroid.language_models.base import LLMStreamEvent, StreamEventType
+from langroid.language_models.openai_gpt import OpenAIGPT, OpenAIGPTConfig
+from langroid.utils.configuration import Settings, set_global
+
+
+def _chunk(delta, finish_reason=None):
+    return OpenAIObject.construct_from(
+        dict(choices=[dict(delta=delta, finish_reason=finish_reason)])
+    )
+
+
+TEXT_CHUNKS = [
+    _chunk(dict(role="assistant", content="")),
+    _chunk(dict(content="The capital")),
+    _chunk(dict(content=" is Paris.")),
+    _chunk(dict(), finish_reason="stop"),
+]
+
+FUNCTION_CHUNKS = [
+    _chunk(dict(role="assistant", function_call=dict(name="capital", arguments=""))),
+    _chunk(dict(function_call=dict(arguments='{"country": '))),
+    _chunk(dict(function_call=dict(arguments='"France"}'))),
+    _chunk(dict(), finish_reason="function_call"),
+]
+
+
+@pytest.fixture
+def llm(monkeypatch) -> OpenAIGPT:
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy-key")
+    return OpenAIGPT(
+        OpenAIGPTConfig(stream=False, cache_config=RedisCacheConfig(fake=True))
+    )
+
+
+def _patch_api(monkeypatch, chunks, calls):
+    def create(**kwargs):
+        calls.append(kwargs)
+        assert kwargs["stream"]
+        return iter(chunks)
+
+    async def acreate(**kwargs):
+        calls.append(kwargs)
+
+        async def events():
+            for c in chunks:
+                yield c
+
+        return events()
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", create)
+    monkeypatch.setattr(openai.ChatCompletion, "acreate", acreate)
+
+
+@pytest.mark.unit
+def test_chat_stream_events(llm, monkeypatch):
+    set_global(Settings(cache=True, stream=False))
+    llm.cache.clear()
+    calls = []
+    _patch_api(monkeypatch, TEXT_CHUNKS, calls)
+
+    events = list(llm.chat_stream("What is the capital of France?", max_tokens=20))
+    assert [e.type for e in events] == [
+        StreamEventType.TEXT,
+        StreamEventType.TEXT,
+        StreamEventType.FINAL,
+    ]
+    assert "".join(e.delta for e in events) == "The capital is Paris."
+    final = events[-1]
+    assert final.response.message == "The capital is Paris."
+    assert not final.response.cached
+    assert final.response.usage.prompt_tokens > 0
+    assert final.response.usage.completion_tokens > 0
+    assert 0 <= final.time_to_first_token <= final.elapsed
+
+    # the response was cached when the stream finished
+    events = list(llm.chat_stream("What is the capital of France?", max_tokens=20))
+    assert len(calls) == 1
+    assert events[-1].response.cached
+    assert events[-1].response.message == "The capital is Paris."
+
+    # the cache entry is shared with non-streaming calls
+    response = llm.chat("What is the capital of France?", max_tokens=20)
+    assert len(calls) == 1
+    assert response.cached
+    assert response.message == "The capital is Paris."
+
+
+@pytest.mark.unit
+def test_chat_stream_function_call(llm, monkeypatch):
+    set_global(Settings(cache=False, stream=False))
+    calls = []
+    _patch_api(monkeypatch, FUNCTION_CHUNKS, calls)
+
+    async def collect() -> list[LLMStreamEvent]:
+        return [e async for e in llm.achat_stream("capital?", max_tokens=20)]
+
+    events = asyncio.run(collect())
+    assert [e.type for e in events] == [
+        StreamEventType.FUNCTION_NAME,
+        StreamEventType.FUNCTION_ARGS,
+        StreamEventType.FUNCTION_ARGS,
+        StreamEventType.FINAL,
+    ]
+    assert events[0].delta == "capital"
+    args = "".join(e.delta for e in events if e.type == StreamEventType.FUNCTION_ARGS)
+    assert json.loads(args) == {"country": "France"}
+    function_call = events[-1].response.function_call
+    assert function_call.name == "capital"
+    assert function_call.arguments == {"country": "France"}
+
+
+@pytest.mark.unit
+def test_chat_stream_console_consumer(llm, monkeypatch, capsys):
+    # with streaming enabled, `chat` prints the deltas as they arrive,
+    # and returns the complete response
+    set_global(Settings(cache=False, stream=True))
+    llm.config.stream = True
+    _patch_api(monkeypatch, TEXT_CHUNKS, [])
+    response = llm.chat("What is the capital of France?", max_tokens=20)
+    assert response.message == "The capital is Paris."
+    out = capsys.readouterr().out
+    assert "The capital" in out and " is Paris." in out
+
+
+@pytest.mark.unit
+def test_stream_usage_without_retokenizing(llm, monkeypatch):
+    set_global(Settings(cache=False, stream=True))
+    calls = []
+    _patch_api(monkeypatch, TEXT_CHUNKS, calls)
+    agent = ChatAgent(ChatAgentConfig(llm=llm.config, vecdb=None))
+    agent.llm = llm
+    llm.set_stream(True)
+
+    tokenized = []
+
+    def num_tokens(text):
+        tokenized.append(text)
+        return len(text.split())
+
+    # the completion is counted one token per delta, as the deltas arrive
+    monkeypatch.setattr(llm, "num_tokens", num_tokens)
+    monkeypatch.setattr(agent, "num_tokens", num_tokens)
+    response = agent.llm_response("What is the capital of France?")
+    assert response.content == "The capital is Paris."
+    assert response.metadata.usage.completion_tokens == 2
+    assert response.metadata.usage.prompt_tokens == llm.estimate_tokens(
+        agent.message_history[:-1], 0
+    )
+    assert tokenized == []
+    assert agent.total_llm_token_usage == response.metadata.usage.total_tokens
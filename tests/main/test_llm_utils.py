@@ -0,0 +1,143 @@
+import asyncio
+import time
+
+import openai
+import pytest
+
+from langroid.language_models.utils import (
+    aiohttp_session,
+    reset_retry_stats,
+    retry_stats,
+    retry_with_exponential_backoff,
+    run_async,
+)
+
+
+@pytest.mark.unit
+def test_pooled_aiohttp_session():
+    async def get_sessions():
+        s1 = aiohttp_session()
+        s2 = aiohttp_session()
+        assert s1 is s2
+        return s1
+
+    # run_async closes the loop's pooled session when done
+    session = run_async(get_sessions())
+    assert session.closed
+
+    # a new loop gets a new session
+    async def get_session():
+        s = aiohttp_session()
+        await s.close()
+        return s
+
+    assert asyncio.run(get_session()) is not session
+
+    # a loop owned by the caller closes the session when it shuts down
+    loop = asyncio.new_event_loop()
+    session = loop.run_until_complete(get_sessions())
+    assert not session.closed
+    loop.run_until_complete(loop.shutdown_asyncgens())
+    loop.close()
+    assert session.closed
+    assert asyncio.run(get_sessions()).closed
+
+
+def _rate_limit_error(retry_after: str | None = None) -> openai.error.RateLimitError:
+    headers = {} if retry_after is None else {"retry-after": retry_after}
+    return openai.error.RateLimitError("rate limited", headers=headers)
+
+
+@pytest.mark.unit
+def test_retry_sync_and_async():
+    reset_retry_stats()
+    calls = []
+
+    @retry_with_exponential_backoff(initial_delay=0.01, max_delay=0.05)
+    def flaky(n: int) -> int:
+        calls.append(n)
+        if len(calls) < 3:
+            raise _rate_limit_error()
+        return n
+
+    assert flaky(7) == 7
+    assert len(calls) == 3
+
+    calls.clear()
+
+    @retry_with_exponential_backoff(initial_delay=0.01, max_delay=0.05)
+    async def aflaky(n: int) -> int:
+        calls.append(n)
+        if len(calls) < 3:
+            raise _rate_limit_error()
+        return n
+
+    assert asyncio.iscoroutinefunction(aflaky)
+
+    async def main():
+        # other tasks keep running while `aflaky` backs off
+        ticks = []
+
+        async def ticker():
+            for i in range(3):
+                ticks.append(i)
+                await asyncio.sleep(0.001)
+
+        result, _ = await asyncio.gather(aflaky(8), ticker())
+        assert ticks == [0, 1, 2]
+        return result
+
+    assert asyncio.run(main()) == 8
+
+    stats = retry_stats()
+    assert stats["calls"] == 2
+    assert stats["retried_calls"] == 2
+    assert stats["retries"] == 4
+    assert stats["errors"] == {"RateLimitError": 4}
+    assert stats["backoff_time"] > 0
+
+
+@pytest.mark.unit
+def test_retry_after_and_budget():
+    reset_retry_stats()
+
+    @retry_with_exponential_backoff(initial_delay=10, max_retry_time=5)
+    def server_says_retry_soon(calls: list) -> str:
+        calls.append(1)
+        if len(calls) == 1:
+            raise _rate_limit_error(retry_after="0.01")
+        return "ok"
+
+    # Retry-After overrides our own (10s) delay
+    start = time.monotonic()
+    assert server_says_retry_soon([]) == "ok"
+    assert time.monotonic() - start < 1
+
+    @retry_with_exponential_backoff(initial_delay=0.01, max_retry_time=5)
+    def server_says_retry_late() -> str:
+        raise _rate_limit_error(retry_after="30")
+
+    # waiting 30s would exceed the 5s budget of the call: give up immediately
+    start = time.monotonic()
+    with pytest.raises(Exception, match="budget"):
+        server_says_retry_late()
+    assert time.monotonic() - start < 1
+
+    @retry_with_exponential_backoff(initial_delay=0.001, max_retries=2)
+    def always_fails() -> str:
+        raise _rate_limit_error()
+
+    with pytest.raises(Exception, match="Maximum number of retries"):
+        always_fails()
+
+    # invalid requests are not retried
+    @retry_with_exponential_backoff
+    def invalid() -> str:
+        raise openai.error.InvalidRequestError("context too long", param=None)
+
+    with pytest.raises(openai.error.InvalidRequestError):
+        invalid()
+
+    stats = retry_stats()
+    assert stats["failed_calls"] == 2
+    assert stats["retries"] == 3
@@ -0,0 +1,116 @@
+import time
+
+import pytest
+
+from langroid.cachedb.lru_cachedb import LRUCache, LRUCacheConfig
+from langroid.cachedb.redis_cachedb import RedisCache, RedisCacheConfig
+from langroid.cachedb.tiered_cachedb import TieredCache
+
+
+@pytest.mark.unit
+def test_lru_cache_eviction():
+    # each value below is 16 bytes as JSON
+    cache = LRUCache(LRUCacheConfig(max_bytes=40, ttl=None))
+    cache.store("a", {"info": "aaaa"})
+    cache.store("b", {"info": "bbbb"})
+    assert cache.retrieve("a") == {"info": "aaaa"}  # a is now most recent
+    cache.store("c", {"info": "cccc"})  # evicts b
+    assert cache.retrieve("b") is None
+    assert cache.retrieve("a") == {"info": "aaaa"}
+    assert cache.retrieve("c") == {"info": "cccc"}
+    assert cache.stats() == dict(hits=3, misses=1, evictions=1, entries=2, bytes=32)
+
+    # too large to store at all
+    cache.store("big", {"info": "x" * 100})
+    assert cache.retrieve("big") is None
+
+    # overwriting a key does not double-count its size
+    cache.store("a", {"info": "AAAA"})
+    assert cache.stats()["bytes"] == 32
+
+
+@pytest.mark.unit
+def test_lru_cache_ttl():
+    cache = LRUCache(LRUCacheConfig(ttl=0.05))
+    cache.store("a", {"info": "aaaa"})
+    assert cache.retrieve("a") is not None
+    time.sleep(0.1)
+    assert cache.retrieve("a") is None
+    assert cache.stats()["entries"] == 0
+
+
+@pytest.mark.unit
+def test_lru_cache_shared():
+    cfg = LRUCacheConfig(name="test_shared")
+    assert LRUCache.shared(cfg) is LRUCache.shared(cfg)
+    assert LRUCache.shared(cfg) is not LRUCache.shared(LRUCacheConfig(name="other"))
+
+
+@pytest.mark.unit
+def test_tiered_cache():
+    backend = RedisCache(RedisCacheConfig(fake=True))
+    backend.clear()
+    cache = TieredCache(LRUCache(LRUCacheConfig()), backend)
+
+    # write-through: stored in both tiers
+    cache.store("a", {"info": "aaaa"})
+    assert cache.memory.retrieve("a") == {"info": "aaaa"}
+    assert backend.retrieve("a") == {"info": "aaaa"}
+    assert cache.retrieve("a") == {"info": "aaaa"}
+
+    # read-promotion: a value only in the backend moves to the memory tier
+    backend.store("b", {"info": "bbbb"})
+    assert cache.retrieve("b") == {"info": "bbbb"}
+    assert cache.retrieve("b") == {"info": "bbbb"}
+    assert cache.retrieve("c") is None
+
+    stats = cache.stats()
+    # memory: a hit twice (1 direct check above), b missed then hit, c missed
+    assert stats["memory"]["hits"] == 3
+    assert stats["memory"]["misses"] == 2
+    assert stats["backend"] == dict(hits=1, misses=1)
+
+    cache.clear()
+    assert cache.retrieve("a") is None
+    assert backend.retrieve("a") is None
+
+
+@pytest.mark.unit
+def test_tiered_cache_many():
+    backend = RedisCache(RedisCacheConfig(fake=True))
+    backend.clear()
+    cache = TieredCache(LRUCache(LRUCacheConfig()), backend)
+    cache.store_many({"a": {"info": "aaaa"}, "b": {"info": "bbbb"}})
+    backend.store("c", {"info": "cccc"})
+    cache.memory.clear()
+    cache.memory.store("a", {"info": "aaaa"})
+
+    # b and c are looked up in the backend in one call, and promoted
+    assert cache.retrieve_many(["a", "b", "c", "d"]) == [
+        {"info": "aaaa"},
+        {"info": "bbbb"},
+        {"info": "cccc"},
+        None,
+    ]
+    assert cache.stats()["backend"] == dict(hits=2, misses=1)
+    assert cache.memory.retrieve("c") == {"info": "cccc"}
+
+
+@pytest.mark.unit
+def test_tiered_cache_shared_memory_clear():
+    # two caches (e.g. of two LLMs) sharing the memory tier, not the backend
+    memory = LRUCache(LRUCacheConfig())
+    backend_a = RedisCache(RedisCacheConfig(fake=True, namespace="a"))
+    backend_b = RedisCache(RedisCacheConfig(fake=True, namespace="b"))
+    cache_a = TieredCache(memory, backend_a)
+    cache_b = TieredCache(memory, backend_b)
+    cache_a.store("a", {"info": "aaaa"})
+    cache_b.store_many({"b": {"info": "bbbb"}})
+    backend_a.store("c", {"info": "cccc"})
+    assert cache_a.retrieve_many(["c"]) == [{"info": "cccc"}]
+
+    # clearing one only removes its own entries from the memory tier
+    cache_a.clear()
+    assert memory.retrieve("a") is None and memory.retrieve("c") is None
+    assert cache_b.retrieve("b") == {"info": "bbbb"}
+    assert memory.stats()["entries"] == 1
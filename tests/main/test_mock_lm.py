@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from langroid.agent.chat_agent import ChatAgent, ChatAgentConfig
+from langroid.language_models.base import (
+    LanguageModel,
+    LLMFunctionCall,
+    LLMMessage,
+    Role,
+    StreamEventType,
+)
+from langroid.language_models.mock_lm import (
+    Distribution,
+    MockLM,
+    MockLMConfig,
+    MockResponse,
+)
+from langroid.utils.configuration import Settings, set_global
+
+CONFIG = MockLMConfig(
+    responses=[
+        MockResponse(
+            match="square",
+            function_call=LLMFunctionCall(name="square", arguments={"x": "$n"}),
+        ),
+        MockResponse(match="json", content='{"request": "echo", "text": "$message"}'),
+        "You said: $message",
+        "Call $n",
+    ],
+)
+
+
+@pytest.mark.unit
+def test_mock_lm_responses():
+    llm = LanguageModel.create(CONFIG)
+    assert isinstance(llm, MockLM)
+
+    response = llm.chat("hello", 10)
+    assert response.message == "You said: hello"
+    assert response.usage.prompt_tokens == 1 and response.usage.completion_tokens > 0
+    assert llm.chat("hi", 10).message == "Call 2"
+    response = llm.chat([LLMMessage(role=Role.USER, content="square it")], 10)
+    assert response.function_call.name == "square"
+    assert response.function_call.arguments == {"x": "3"}
+    assert llm.generate("json please", 10).message == (
+        '{"request": "echo", "text": "json please"}'
+    )
+    assert asyncio.run(llm.achat("bye", 10)).message == "You said: bye"
+
+
+@pytest.mark.unit
+def test_mock_lm_default_config_not_shared():
+    llm = MockLM()
+    llm.set_stream(True)
+    assert llm.get_stream() and not MockLM().get_stream()
+
+
+@pytest.mark.unit
+def test_mock_lm_distributions_and_streaming():
+    llm = MockLM(
+        CONFIG.copy(
+            update=dict(
+                latency=Distribution(kind="uniform", low=0.01, high=0.02),
+                tokens_per_second=1000,
+                completion_tokens=Distribution(kind="normal", mean=50, std=5),
+                seed=1,
+            )
+        )
+    )
+    events = list(llm.chat_stream("hello there", 10))
+    assert "".join(e.delta for e in events[:-1]) == "You said: hello there"
+    assert all(e.type == StreamEventType.TEXT for e in events[:-1])
+    final = events[-1]
+    assert final.type == StreamEventType.FINAL
+    assert 0.01 <= final.time_to_first_token <= 0.02
+    assert final.elapsed >= final.time_to_first_token
+    assert 30 < final.response.usage.completion_tokens < 70
+
+    events = list(llm.chat_stream("square", 10))
+    assert events[0].type == StreamEventType.FUNCTION_NAME
+    assert "".join(e.delta for e in events[1:-1]) == '{"x": "2"}'
+
+
+@pytest.mark.unit
+def test_mock_lm_agent():
+    set_global(Settings(cache=False, stream=False))
+    agent = ChatAgent(
+        ChatAgentConfig(llm=MockLMConfig(responses=["ok: $message"]), vecdb=None)
+    )
+    assert agent.llm_response("hello").content == "ok: hello"
+    assert agent.llm_response("again").content == "ok: again"
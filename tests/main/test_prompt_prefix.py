@@ -0,0 +1,138 @@
+import pytest
+
+from langroid.agent.chat_agent import ChatAgent, ChatAgentConfig
+from langroid.cachedb.redis_cachedb import RedisCacheConfig
+from langroid.language_models.base import LLMMessage, Role
+from langroid.language_models.cache_key import cache_key, messages_digest
+from langroid.language_models.mock_lm import MockLMConfig
+from langroid.language_models.openai_gpt import OpenAIGPT, OpenAIGPTConfig
+from langroid.language_models.prompt_prefix import FrozenPrefix, IncrementalPrompt
+from langroid.utils.configuration import Settings, set_global
+
+
+def _count(message: LLMMessage) -> int:
+    return len(message.content.split())
+
+
+def _check(messages, hashed, tokens):
+    plain = [m.api_dict() for m in messages]
+    assert list(hashed) == plain
+    assert hashed.digest == messages_digest(plain)
+    assert cache_key("ChatCompletion", model="m", messages=hashed) == cache_key(
+        "ChatCompletion", model="m", messages=plain
+    )
+    assert tokens == sum(_count(m) for m in messages)
+
+
+@pytest.mark.unit
+def test_incremental_prompt():
+    counted = []
+
+    def count(message: LLMMessage) -> int:
+        counted.append(message)
+        return _count(message)
+
+    system = LLMMessage(role=Role.SYSTEM, content="you are helpful")
+    tools = LLMMessage(role=Role.USER, content="use these tools")
+    prefix = FrozenPrefix([system, tools], count)
+    prompt = IncrementalPrompt(count, prefix)
+    history = [system, tools, LLMMessage(role=Role.USER, content="hi there")]
+    _check(history, *prompt.sync(history))
+
+    # only the new messages are processed
+    counted.clear()
+    history += [
+        LLMMessage(role=Role.ASSISTANT, content="hello"),
+        LLMMessage(role=Role.USER, content="how are you"),
+    ]
+    _check(history, *prompt.sync(history))
+    assert counted == history[3:]
+
+    # a replaced content, or dropped messages, are detected
+    counted.clear()
+    history[-1].content = "how are you doing"
+    _check(history, *prompt.sync(history))
+    assert counted == history[-1:]
+    _check(history[:2] + history[3:], *prompt.sync(history[:2] + history[3:]))
+    assert prompt.rebuilds == 0
+
+    # another conversation continues from the prefix, without re-processing it
+    counted.clear()
+    other = [system, tools, LLMMessage(role=Role.USER, content="bye")]
+    _check(other, *prompt.sync(other))
+    assert counted == other[2:] and prompt.rebuilds == 0
+    # ... unless it does not start with the prefix
+    _check(other[1:], *prompt.sync(other[1:]))
+    assert prompt.rebuilds == 1
+    _check(history, *prompt.sync(history))
+    assert prompt.rebuilds == 2 and counted[-3:] == history[2:]
+
+
+@pytest.mark.unit
+def test_incremental_prompt_render():
+    counted = []
+
+    def count(message: LLMMessage) -> int:
+        counted.append(message)
+        return _count(message)
+
+    system = LLMMessage(role=Role.SYSTEM, content="you are helpful")
+    tools = LLMMessage(role=Role.USER, content="use these tools")
+    prompt = IncrementalPrompt(count, FrozenPrefix([system, tools], count))
+    history = [system, tools, LLMMessage(role=Role.USER, content="hi there")]
+    prompt.sync(history)
+    state = list(prompt.messages)
+
+    # rendering reuses the messages in common, and changes nothing
+    counted.clear()
+    longer = history + [LLMMessage(role=Role.ASSISTANT, content="hello")]
+    _check(longer, *prompt.render(longer))
+    assert counted == longer[3:]
+    other = [system, tools, LLMMessage(role=Role.USER, content="bye")]
+    _check(other, *prompt.render(other))
+    _check(other[1:], *prompt.render(other[1:]))
+    _check(history[:1], *prompt.render(history[:1]))
+    assert prompt.messages == state and prompt.rebuilds == 0
+
+
+@pytest.mark.unit
+def test_llm_prompt_owned_by_conversation(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    llm = OpenAIGPT(OpenAIGPTConfig(cache_config=RedisCacheConfig(fake=True)))
+    system = LLMMessage(role=Role.SYSTEM, content="you are helpful")
+    llm.set_prompt_prefix([system])
+    history = [system, LLMMessage(role=Role.USER, content="hi")]
+    llm._prep_chat_completion(history, 10)
+    prompt = llm.prompt()
+    state = list(prompt.messages)
+    assert state == history
+
+    # batch items, token estimates, and other conversations only render
+    question = [LLMMessage(role=Role.USER, content="what?")]
+    assert llm._prep_chat_completion(question, 10)["messages"] == [
+        question[0].api_dict()
+    ]
+    llm._prep_chat_completion(history + question, 10, incremental=False)
+    llm.estimate_tokens(question, 0)
+    assert prompt.messages == state and prompt.rebuilds == 0
+
+
+@pytest.mark.unit
+def test_chat_agent_prompt_prefix():
+    set_global(Settings(cache=False, stream=False))
+    agent = ChatAgent(ChatAgentConfig(llm=MockLMConfig(responses=["ok"]), vecdb=None))
+    for message in ["hello", "again", "and again"]:
+        agent.llm_response(message)
+    prompt = agent.llm.prompt()
+    assert prompt.prefix.matches(agent.message_history)
+    assert prompt.rebuilds == 0
+
+    # changing the system message re-freezes the prefix
+    agent.augment_system_message("Be brief.")
+    assert prompt.prefix.matches(agent.message_history)
+    agent.llm_response("once more")
+    assert prompt.rebuilds == 0
+    _, tokens = prompt.sync(agent.message_history[:-1])
+    assert tokens == sum(
+        agent.token_estimator.message_tokens(m) for m in agent.message_history[:-1]
+    )
@@ -0,0 +1,98 @@
+import asyncio
+import time
+
+import pytest
+
+from langroid.language_models.rate_limiter import (
+    RateLimiter,
+    TokenBucket,
+    get_rate_limiter,
+    rate_limiter_stats,
+)
+
+
+@pytest.mark.unit
+def test_token_bucket_reserve():
+    bucket = TokenBucket(capacity=10, rate=10)
+    # full bucket covers reservations up to its capacity
+    assert bucket.reserve(6) == 0
+    assert bucket.reserve(4) == 0
+    # then the bucket goes into debt, and callers must wait for refills
+    assert bucket.reserve(5) == pytest.approx(0.5, abs=0.05)
+    assert bucket.reserve(5) == pytest.approx(1.0, abs=0.05)
+
+
+@pytest.mark.unit
+def test_rate_limiter_unlimited():
+    limiter = RateLimiter()
+    assert limiter.reserve(1_000_000) == 0
+
+
+@pytest.mark.unit
+def test_rate_limiter_requests_per_minute():
+    # 60 rpm = 1 request per second, with a burst of 60
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=6000)
+    for _ in range(60):
+        assert limiter.reserve(10) == 0
+    assert limiter.reserve(10) == pytest.approx(1.0, abs=0.05)
+
+
+@pytest.mark.unit
+def test_rate_limiter_acquire_does_not_block_loop():
+    limiter = RateLimiter(tokens_per_minute=600)  # 10 tokens/sec
+    limiter.reserve(600)  # drain the bucket
+
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        start = time.monotonic()
+        await limiter.acquire(2)  # needs 0.2 sec of refill
+        elapsed = time.monotonic() - start
+        task.cancel()
+        return elapsed, ticks
+
+    elapsed, ticks = asyncio.run(main())
+    assert elapsed == pytest.approx(0.2, abs=0.1)
+    # other tasks kept running while we waited
+    assert ticks > 5
+
+
+@pytest.mark.unit
+def test_shared_rate_limiter():
+    limiter = get_rate_limiter("test-model", requests_per_minute=100)
+    # same model => same limiter, and None leaves existing limits unchanged
+    assert get_rate_limiter("test-model") is limiter
+    assert limiter.request_bucket.capacity == 100
+    assert get_rate_limiter("other-test-model") is not limiter
+    # newly configured limits apply to the shared limiter
+    get_rate_limiter("test-model", requests_per_minute=50, tokens_per_minute=500)
+    assert limiter.request_bucket.capacity == 50
+    assert limiter.token_bucket.capacity == 500
+
+
+@pytest.mark.unit
+def test_rate_limiter_stats():
+    limiter = get_rate_limiter("stats-test-model", tokens_per_minute=6000)
+    with limiter.limit(100):
+        stats = rate_limiter_stats()["stats-test-model"]
+        assert stats["requests_in_flight"] == 1
+        assert stats["tokens_in_flight"] == 100
+
+    async def request():
+        async with limiter.alimit(6000):  # exceeds remaining budget
+            pass
+
+    asyncio.run(request())
+    stats = limiter.stats()
+    assert stats["requests_in_flight"] == 0
+    assert stats["tokens_in_flight"] == 0
+    assert stats["total_requests"] == 2
+    assert stats["total_tokens"] == 6100
+    assert stats["total_wait_time"] == pytest.approx(1.0, abs=0.1)
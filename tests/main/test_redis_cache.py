@@ -1,6 +1,10 @@
+import time
+
 import pytest
 
 from langroid.cachedb.redis_cachedb import RedisCache, RedisCacheConfig
+from langroid.language_models.openai_gpt import OpenAIGPT, OpenAIGPTConfig
+from langroid.utils.configuration import Settings, set_global
 
 
 @pytest.fixture
@@ -35,3 +39,91 @@ def test_real_store_and_retrieve(real_redis_cache):
     real_redis_cache.store(key, data)
     result = real_redis_cache.retrieve(key)
     assert result == data
+
+
+@pytest.mark.unit
+def test_fake_store_and_retrieve_many(fake_redis_cache):
+    items = {f"key{i}": {"info": i} for i in range(5)}
+    fake_redis_cache.store_many(items)
+    keys = list(items) + ["missing"]
+    assert fake_redis_cache.retrieve_many(keys) == list(items.values()) + [None]
+    assert fake_redis_cache.retrieve_many([]) == []
+
+
+@pytest.mark.unit
+def test_fake_namespaces_and_invalidation():
+    a = RedisCache(RedisCacheConfig(fake=True, namespace="projA"))
+    b = RedisCache(RedisCacheConfig(fake=True, namespace="projB"))
+    a.clear()
+    b.clear()
+    a.store_many({"gpt4:k1": {"v": 1}, "gpt4:k2": {"v": 2}, "gpt3:k1": {"v": 3}})
+    b.store("gpt4:k1", {"v": 4})
+    # same key, different namespaces
+    assert a.retrieve("gpt4:k1") == {"v": 1}
+    assert b.retrieve("gpt4:k1") == {"v": 4}
+    # no expiry by default
+    assert a.client.ttl("projA:gpt4:k1") == -1
+
+    assert a.invalidate("gpt4:") == 2
+    assert a.retrieve_many(["gpt4:k1", "gpt4:k2", "gpt3:k1"]) == [None, None, {"v": 3}]
+    # clearing a namespace leaves the others alone
+    a.clear()
+    assert a.retrieve("gpt3:k1") is None
+    assert b.retrieve("gpt4:k1") == {"v": 4}
+    # glob chars in prefixes are matched literally
+    b.store("x*", {"v": 5})
+    assert b.invalidate("x*") == 1
+    assert b.retrieve("gpt4:k1") == {"v": 4}
+
+
+@pytest.mark.unit
+def test_fake_ttl():
+    cache = RedisCache(RedisCacheConfig(fake=True, namespace="ttl", ttl=1))
+    cache.clear()
+    cache.store("k", {"v": 1})
+    assert cache.retrieve("k") == {"v": 1}
+    assert 0 < cache.client.ttl("ttl:k") <= 1
+
+
+@pytest.mark.unit
+def test_fake_lru_cap():
+    cache = RedisCache(
+        RedisCacheConfig(fake=True, namespace="lru", max_entries=10, evict_every=1)
+    )
+    cache.clear()
+    cache.store_many({f"k{i}": {"v": i} for i in range(10)})
+    # k0 is used again, so k1 is now the least recently used
+    assert cache.retrieve("k0") == {"v": 0}
+    cache.store("k10", {"v": 10})
+    # 11 keys > 10: the 2 least recently used are evicted, down to 9
+    values = cache.retrieve_many([f"k{i}" for i in range(11)])
+    assert [i for i, v in enumerate(values) if v is None] == [1, 2]
+    assert cache.client.zcard(cache.lru_key) == 9
+
+
+@pytest.mark.unit
+def test_fake_lru_ttl_renewed_on_access():
+    cache = RedisCache(
+        RedisCacheConfig(fake=True, namespace="lru_ttl", ttl=100, max_entries=10)
+    )
+    cache.clear()
+    cache.store("k", {"v": 1})
+    cache.client.expire("lru_ttl:k", 5)  # as if stored 95s ago
+    # a use renews the expiry, along with the access time in the LRU set
+    assert cache.retrieve("k") == {"v": 1}
+    assert cache.client.ttl("lru_ttl:k") > 5
+    assert cache.client.zscore(cache.lru_key, "lru_ttl:k") > time.time() - 5
+
+
+@pytest.mark.unit
+def test_llm_keeps_redis_cache_config(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy")
+    set_global(Settings(cache_type="redis"))
+    config = RedisCacheConfig(fake=True, namespace="llm", ttl=60)
+    llm = OpenAIGPT(OpenAIGPTConfig(cache_config=config, memory_cache_config=None))
+    assert isinstance(llm.cache, RedisCache)
+    assert llm.cache.config.namespace == "llm" and llm.cache.config.ttl == 60
+
+    # when unset, the namespace is the model name
+    llm = OpenAIGPT(OpenAIGPTConfig(cache_config=RedisCacheConfig(fake=True)))
+    assert llm.cache.config.namespace == llm.config.chat_model.value
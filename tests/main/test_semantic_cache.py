@@ -0,0 +1,190 @@
+import asyncio
+import re
+from typing import List
+
+import numpy as np
+import openai
+import pytest
+from openai.openai_object import OpenAIObject
+
+from langroid.cachedb.redis_cachedb import RedisCacheConfig
+from langroid.embedding_models.base import EmbeddingModel
+from langroid.language_models.base import LLMMessage, Role
+from langroid.language_models.openai_gpt import OpenAIGPT, OpenAIGPTConfig
+from langroid.language_models.semantic_cache import (
+    SemanticCache,
+    SemanticCacheConfig,
+    _Index,
+)
+from langroid.utils.configuration import Settings, set_global
+
+VOCAB = ["capital", "france", "germany", "paris", "city", "what", "is", "the"]
+# words that do not change the meaning of a question
+STOP = {"tell", "me", "please", "of"}
+
+
+class BagOfWordsEmbeddings(EmbeddingModel):
+    """Deterministic embeddings: counts of vocabulary words."""
+
+    def embedding_fn(self):
+        def fn(texts: List[str]) -> List[List[float]]:
+            vectors = []
+            for text in texts:
+                words = re.findall(r"\w+", text.lower())
+                vector = [float(words.count(w)) for w in VOCAB]
+                # words outside the vocabulary go to one extra dimension
+                vector.append(float(sum(w not in VOCAB + list(STOP) for w in words)))
+                vectors.append(vector)
+            return vectors
+
+        return fn
+
+    @property
+    def embedding_dims(self) -> int:
+        return len(VOCAB) + 1
+
+
+@pytest.fixture
+def llm(monkeypatch) -> OpenAIGPT:
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy-key")
+    set_global(Settings(cache=True, stream=False))
+    llm = OpenAIGPT(
+        OpenAIGPTConfig(
+            stream=False,
+            cache_config=RedisCacheConfig(fake=True),
+            memory_cache_config=None,
+        )
+    )
+    llm.cache.clear()
+    llm.semantic_cache = SemanticCache(
+        SemanticCacheConfig(threshold=0.95), embedding_model=BagOfWordsEmbeddings()
+    )
+    return llm
+
+
+@pytest.fixture
+def calls(monkeypatch) -> List[str]:
+    calls: List[str] = []
+
+    def create(**kwargs):
+        question = kwargs["messages"][-1]["content"]
+        calls.append(question)
+        return OpenAIObject.construct_from(
+            dict(
+                choices=[
+                    dict(message=dict(role="assistant", content=f"answer {len(calls)}"))
+                ],
+                usage=dict(prompt_tokens=10, completion_tokens=5, total_tokens=15),
+            )
+        )
+
+    async def acreate(**kwargs):
+        return create(**kwargs)
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", create)
+    monkeypatch.setattr(openai.ChatCompletion, "acreate", acreate)
+    return calls
+
+
+def _messages(system: str, question: str) -> List[LLMMessage]:
+    return [
+        LLMMessage(role=Role.SYSTEM, content=system),
+        LLMMessage(role=Role.USER, content=question),
+    ]
+
+
+@pytest.mark.unit
+def test_semantic_hit_and_context(llm, calls):
+    first = llm.chat(_messages("Be brief", "What is the capital of France?"), 10)
+    assert not first.cached and calls == ["What is the capital of France?"]
+
+    # paraphrase: same embedding direction, served from the cache
+    second = llm.chat(
+        _messages("Be brief", "Please tell me: what is the capital of France"), 10
+    )
+    assert second.cached and second.message == first.message
+    assert len(calls) == 1
+
+    # the hit was also stored under its exact key: no semantic lookup next time
+    llm.chat(_messages("Be brief", "Please tell me: what is the capital of France"), 10)
+    assert llm.semantic_cache.stats()["lookups"] == 2
+
+    # a different question misses
+    third = llm.chat(_messages("Be brief", "What is the capital of Germany?"), 10)
+    assert not third.cached and len(calls) == 2
+
+    # same question under a different system prompt misses
+    fourth = llm.chat(_messages("Be verbose", "What is the capital of France?"), 10)
+    assert not fourth.cached and len(calls) == 3
+
+    stats = llm.semantic_cache.stats()
+    assert stats["lookups"] == 4
+    assert stats["hits"] == 1 and stats["misses"] == 3
+    assert stats["entries"] == 3
+
+
+@pytest.mark.unit
+def test_semantic_follow_up_needs_same_history(llm, calls):
+    def conversation(topic: str, follow_up: str) -> List[LLMMessage]:
+        return _messages("Be brief", f"What is the capital of {topic}?") + [
+            LLMMessage(role=Role.ASSISTANT, content="It is the city of ..."),
+            LLMMessage(role=Role.USER, content=follow_up),
+        ]
+
+    llm.chat(conversation("France", "what is the city"), 10)
+    # the same follow-up, paraphrased, in another conversation misses...
+    other = llm.chat(conversation("Germany", "please tell me what is the city"), 10)
+    assert not other.cached and len(calls) == 2
+    # ... but hits in the same conversation
+    same = llm.chat(conversation("France", "please tell me what is the city"), 10)
+    assert same.cached and len(calls) == 2
+
+
+@pytest.mark.unit
+def test_semantic_hit_async(llm, calls):
+    asyncio.run(llm.achat(_messages("Be brief", "What is the capital of France?"), 10))
+    response = asyncio.run(
+        llm.achat(_messages("Be brief", "what is the capital of france, please"), 10)
+    )
+    assert response.cached and len(calls) == 1
+
+
+@pytest.mark.unit
+def test_false_positive_sampling(llm, calls):
+    llm.semantic_cache.config.false_positive_sample_rate = 1.0
+    llm.chat(_messages("Be brief", "What is the capital of France?"), 10)
+    # a sampled hit is answered by the API, and compared with the cached answer
+    response = llm.chat(
+        _messages("Be brief", "Please, what is the capital of France"), 10
+    )
+    assert not response.cached and response.message == "answer 2"
+    assert len(calls) == 2
+    stats = llm.semantic_cache.stats()
+    assert stats["sampled"] == 1
+    # "answer 1" vs "answer 2" embed identically with the bag of words
+    assert stats["false_positives"] == 0
+
+
+@pytest.mark.unit
+def test_check_counts_disagreement(llm):
+    def response(content: str):
+        return dict(choices=[dict(message=dict(role="assistant", content=content))])
+
+    cache = llm.semantic_cache
+    assert cache.check(response("Paris"), response("Paris"))
+    assert not cache.check(response("Paris"), response("the capital city"))
+    assert cache.stats()["false_positive_rate"] == 0.5
+    assert np.isclose(np.linalg.norm(cache._embed("Paris")), 1.0)
+
+
+@pytest.mark.unit
+def test_index_ring_buffer():
+    index = _Index(dims=2, max_entries=100)
+    vectors = np.eye(2, dtype=np.float32)
+    for i in range(250):
+        index.add(vectors[i % 2], f"k{i}")
+    # the oldest entries are overwritten in place
+    assert len(index.keys) == len(index.vectors) == 100
+    assert index.keys[:3] == ["k200", "k201", "k202"] and index.keys[-1] == "k199"
+    key, similarity = index.nearest(vectors[1])
+    assert int(key[1:]) % 2 == 1 and similarity == 1.0
@@ -0,0 +1,150 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+import pytest
+from openai.openai_object import OpenAIObject
+
+from langroid.cachedb.redis_cachedb import RedisCacheConfig
+from langroid.language_models.openai_gpt import OpenAIGPT, OpenAIGPTConfig
+from langroid.language_models.single_flight import SingleFlight
+from langroid.utils.configuration import Settings, set_global
+
+
+@pytest.mark.unit
+def test_single_flight_threads():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "result"
+
+    with ThreadPoolExecutor(4) as pool:
+        leader = pool.submit(flight.do, "key", fn)
+        started.wait(5)
+        followers = [pool.submit(flight.do, "key", fn) for _ in range(3)]
+        time.sleep(0.05)
+        assert flight.stats()["in_flight"] == 1
+        release.set()
+        assert leader.result() == ("result", False)
+        assert [f.result() for f in followers] == [("result", True)] * 3
+    assert len(calls) == 1
+    assert flight.stats() == dict(leaders=1, followers=3, in_flight=0)
+
+    # once done, the next call is made again
+    release.set()
+    assert flight.do("key", fn) == ("result", False)
+    assert flight.follow("key") is None
+
+
+@pytest.mark.unit
+def test_single_flight_async_error():
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.05)
+        raise ValueError("boom")
+
+    async def main():
+        return await asyncio.gather(
+            flight.ado("key", fail), flight.ado("key", fail), return_exceptions=True
+        )
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, ValueError) for r in results)
+    assert flight.stats() == dict(leaders=1, followers=1, in_flight=0)
+
+
+@pytest.fixture
+def llm(monkeypatch) -> OpenAIGPT:
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy-key")
+    set_global(Settings(cache=True, stream=False))
+    llm = OpenAIGPT(
+        OpenAIGPTConfig(
+            stream=False,
+            cache_config=RedisCacheConfig(fake=True),
+            memory_cache_config=None,
+        )
+    )
+    llm.cache.clear()
+    return llm
+
+
+def _response(question: str) -> OpenAIObject:
+    return OpenAIObject.construct_from(
+        dict(
+            choices=[dict(message=dict(role="assistant", content="A: " + question))],
+            usage=dict(prompt_tokens=10, completion_tokens=5, total_tokens=15),
+        )
+    )
+
+
+@pytest.mark.unit
+def test_coalesce_chat(llm, monkeypatch):
+    calls = []
+
+    def create(**kwargs):
+        question = kwargs["messages"][-1]["content"]
+        calls.append(question)
+        time.sleep(0.2)
+        return _response(question)
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", create)
+    with ThreadPoolExecutor(4) as pool:
+        responses = list(pool.map(lambda _: llm.chat("same question", 10), range(4)))
+    assert calls == ["same question"]
+    assert all(r.message == "A: same question" for r in responses)
+    assert sorted(r.coalesced for r in responses) == [False, True, True, True]
+    # the coalesced responses cost nothing
+    assert all(r.cached for r in responses if r.coalesced)
+    assert [r.usage.cost > 0 for r in responses].count(True) == 1
+
+
+@pytest.mark.unit
+def test_coalesce_achat_and_batch(llm, monkeypatch):
+    calls = []
+
+    async def acreate(**kwargs):
+        question = kwargs["messages"][-1]["content"]
+        calls.append(question)
+        await asyncio.sleep(0.2)
+        return _response(question)
+
+    monkeypatch.setattr(openai.ChatCompletion, "acreate", acreate)
+
+    async def main():
+        return await asyncio.gather(
+            llm.achat("q0", 10),
+            llm.achat("q0", 10),
+            llm.achat_batch(["q1", "q0", "q1"], 10),
+        )
+
+    first, second, batch = asyncio.run(main())
+    assert sorted(calls) == ["q0", "q1"]
+    assert [first.coalesced, second.coalesced].count(True) == 1
+    assert [r.message for r in batch] == ["A: q1", "A: q0", "A: q1"]
+    assert [r.coalesced for r in batch] == [False, True, True]
+
+
+@pytest.mark.unit
+def test_no_coalescing_without_cache(llm, monkeypatch):
+    set_global(Settings(cache=False, stream=False))
+    calls = []
+
+    def create(**kwargs):
+        calls.append(1)
+        time.sleep(0.1)
+        return _response("q")
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", create)
+    with ThreadPoolExecutor(3) as pool:
+        responses = list(pool.map(lambda _: llm.chat("q", 10), range(3)))
+    assert len(calls) == 3
+    assert not any(r.coalesced for r in responses)
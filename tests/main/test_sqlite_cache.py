@@ -0,0 +1,72 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from langroid.cachedb.sqlite_cachedb import SQLiteCache, SQLiteCacheConfig
+
+
+def _retrieve(path: str, key: str):
+    return SQLiteCache(SQLiteCacheConfig(path=path)).retrieve(key)
+
+
+@pytest.mark.unit
+def test_sqlite_store_and_retrieve(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = SQLiteCache(SQLiteCacheConfig(path=path))
+    data = {"info": "something", "nested": [1, 2.5, None, True]}
+    cache.store("test_key", data)
+    assert cache.retrieve("test_key") == data
+    assert cache.retrieve("missing") is None
+
+    # persists across instances, and is readable from other processes
+    assert SQLiteCache(SQLiteCacheConfig(path=path)).retrieve("test_key") == data
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        results = list(pool.map(_retrieve, [path] * 2, ["test_key"] * 2))
+    assert results == [data, data]
+
+    cache.clear()
+    assert cache.retrieve("test_key") is None
+
+
+@pytest.mark.unit
+def test_sqlite_ttl_and_size_eviction(tmp_path):
+    cache = SQLiteCache(SQLiteCacheConfig(path=str(tmp_path / "ttl.db"), ttl=0))
+    cache.store("a", {"info": "aaaa"})
+    time.sleep(0.01)
+    assert cache.retrieve("a") is None
+
+    # each value is a 19-byte record: storing 10 of them exceeds 100 bytes,
+    # so the least recently used are evicted, down to 90 bytes
+    cache = SQLiteCache(
+        SQLiteCacheConfig(
+            path=str(tmp_path / "size.db"), ttl=None, max_bytes=100, evict_every=1
+        )
+    )
+    for i in range(10):
+        cache.store(f"k{i}", {"info": f"val{i}"})
+    remaining = [i for i in range(10) if cache.retrieve(f"k{i}") is not None]
+    assert remaining == list(range(10 - len(remaining), 10))
+    assert 19 * len(remaining) <= 90
+
+
+@pytest.mark.unit
+def test_sqlite_compression(tmp_path):
+    pytest.importorskip("zstandard")
+    path = str(tmp_path / "zstd.db")
+    cache = SQLiteCache(SQLiteCacheConfig(path=path, compress=True))
+    data = {"info": "something " * 100}
+    cache.store("test_key", data)
+    assert cache.retrieve("test_key") == data
+    # compressed entries remain readable with compression turned off
+    assert SQLiteCache(SQLiteCacheConfig(path=path)).retrieve("test_key") == data
+
+
+@pytest.mark.unit
+def test_sqlite_store_and_retrieve_many(tmp_path):
+    cache = SQLiteCache(SQLiteCacheConfig(path=str(tmp_path / "many.db")))
+    # more keys than fit in one query
+    items = {f"key{i}": {"info": i} for i in range(1200)}
+    cache.store_many(items)
+    keys = ["missing"] + list(items)
+    assert cache.retrieve_many(keys) == [None] + list(items.values())
@@ -0,0 +1,118 @@
+import openai
+import pytest
+from openai.openai_object import OpenAIObject
+
+from langroid.agent.tool_message import ToolMessage
+from langroid.cachedb.redis_cachedb import RedisCacheConfig
+from langroid.language_models.openai_gpt import OpenAIGPT, OpenAIGPTConfig
+from langroid.parsing.streaming_json import (
+    StreamingJSONParser,
+    parse_json_args,
+    pydantic_field_validator,
+)
+from langroid.utils.configuration import Settings, set_global
+
+
+class SquareTool(ToolMessage):
+    request: str = "square"
+    purpose: str = "To square a <number>, maybe <exact>"
+    number: int
+    exact: bool = True
+    note: str = ""
+
+
+def _feed(parser, text, size):
+    completed = []
+    for i in range(0, len(text), size):
+        completed.append(parser.feed(text[i : i + size]))
+    return completed
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("size", [1, 3, 7, 1000])
+def test_streaming_json_parser(size):
+    text = (
+        '{"number": 12, "flags": [true, false, null], '
+        '"nested": {"a": "x,}]", "b": [1, {"c": 2}]}, '
+        '"quote": "say \\"hi\\", \\\\ ok", "last": null}'
+    )
+    parser = StreamingJSONParser()
+    completed = [name for names in _feed(parser, text, size) for name in names]
+    assert completed == ["number", "flags", "nested", "quote", "last"]
+    assert parser.close() == dict(
+        number=12,
+        flags=[True, False, None],
+        nested=dict(a="x,}]", b=[1, dict(c=2)]),
+        quote='say "hi", \\ ok',
+        last=None,
+    )
+
+    # fields are decoded as soon as they are complete
+    parser = StreamingJSONParser()
+    assert parser.feed('{"a": 1, "b"') == ["a"]
+    assert parser.fields == dict(a=1)
+    assert parser.feed(': "long') == []
+    assert parser.feed(' value"}  ') == ["b"]
+    assert parser.close() == dict(a=1, b="long value")
+
+    parser = StreamingJSONParser()
+    parser.feed(" { } ")
+    assert parser.incremental and parser.close() == {}
+
+
+@pytest.mark.unit
+def test_streaming_json_fallback():
+    # Python literals and other non-JSON args are parsed at the end
+    for text, value in [
+        ("{'number': 3, 'exact': True}", dict(number=3, exact=True)),
+        ('{"a": 1,}', dict(a=1)),
+        ("[1, 2]", [1, 2]),
+    ]:
+        parser = StreamingJSONParser()
+        _feed(parser, text, 2)
+        assert parser.close() == value
+    assert parse_json_args('{"ok": true}') == dict(ok=True)
+
+    for text in ['{"a": 1', '{"a": }', '{"a": 1} extra', "not json"]:
+        parser = StreamingJSONParser()
+        parser.feed(text)
+        with pytest.raises(ValueError):
+            parser.close()
+
+
+@pytest.mark.unit
+def test_streaming_json_validation():
+    parser = StreamingJSONParser(pydantic_field_validator(SquareTool))
+    parser.feed('{"number": "twelve", "exact": false, "other": 1}')
+    assert list(parser.errors) == ["number"]
+    assert "number" in parser.errors["number"]
+    assert parser.close() == dict(number="twelve", exact=False, other=1)
+
+
+def _chunk(delta, finish_reason=None):
+    return OpenAIObject.construct_from(
+        dict(choices=[dict(delta=delta, finish_reason=finish_reason)])
+    )
+
+
+@pytest.mark.unit
+def test_streamed_function_args(monkeypatch, caplog):
+    monkeypatch.setenv("OPENAI_API_KEY", "dummy-key")
+    set_global(Settings(cache=False, stream=False))
+    args = '{"number": "x", "exact": false, "note": "a \\"b\\""}'
+    chunks = [_chunk(dict(role="assistant", function_call=dict(name="square")))] + [
+        _chunk(dict(function_call=dict(arguments=args[i : i + 4])))
+        for i in range(0, len(args), 4)
+    ]
+    chunks.append(_chunk(dict(), finish_reason="function_call"))
+    monkeypatch.setattr(openai.ChatCompletion, "create", lambda **kwargs: iter(chunks))
+    llm = OpenAIGPT(
+        OpenAIGPTConfig(stream=True, cache_config=RedisCacheConfig(fake=True))
+    )
+    response = llm.chat("square x", 20, [SquareTool.llm_function_schema()])
+    assert response.function_call.name == "square"
+    assert response.function_call.arguments == dict(
+        number="x", exact=False, note='a "b"'
+    )
+    # the invalid arg was reported as soon as it arrived
+    assert "Invalid arg number of function square" in caplog.text